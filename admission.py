@@ -0,0 +1,196 @@
+import logging
+import math
+import os
+import shutil
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_QUEUE = 1000  # Outstanding analysis jobs across all callers
+DEFAULT_MAX_INFLIGHT_BYTES = 4 * 1024 ** 3  # Uploaded bytes whose analysis hasn't finished
+DEFAULT_MIN_FREE_BYTES = 1024 ** 3  # Disk that must stay free after accepting an upload
+DEFAULT_MAX_JOBS_PER_CALLER = 300  # Outstanding jobs one caller may have
+DEFAULT_RETRY_AFTER = 30  # Seconds to suggest before any jobs have finished to measure
+DISK_RETRY_AFTER = 300  # Seconds to suggest when the disk is low; roughly a janitor sweep
+DRAIN_WINDOW = 600  # Seconds of completions used to estimate how fast the queue drains
+MIN_DRAIN_SAMPLES = 3  # Releases needed in the window before the rate is trusted
+MAX_RETRY_AFTER = 3600
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request would exceed a limit.
+
+    retry_after is the suggested wait in seconds, or None when the request
+    is too large to ever be admitted and has to be split up.
+    """
+
+    def __init__(self, message: str, retry_after: Optional[int]):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """Bounds the work upload endpoints accept.
+
+    Each batch or single upload reserves a ticket for its jobs and bytes
+    before anything is written to disk, and returns capacity as its files
+    finish. Requests over the global queue depth, in-flight bytes, free
+    disk or the caller's outstanding-job limit are rejected with a wait
+    estimated from how fast recently admitted jobs have been finishing.
+    """
+
+    def __init__(self, max_queue: int = DEFAULT_MAX_QUEUE,
+                 max_inflight_bytes: int = DEFAULT_MAX_INFLIGHT_BYTES,
+                 min_free_bytes: int = DEFAULT_MIN_FREE_BYTES,
+                 max_jobs_per_caller: int = DEFAULT_MAX_JOBS_PER_CALLER,
+                 disk_path: str = '.'):
+        self.max_queue = max_queue
+        self.max_inflight_bytes = max_inflight_bytes
+        self.min_free_bytes = min_free_bytes
+        self.max_jobs_per_caller = max_jobs_per_caller
+        self.disk_path = disk_path
+        self.rejected = 0
+        self._tickets: Dict[str, Dict[str, Any]] = {}  # key -> caller, jobs, bytes
+        self._drained: Deque[Tuple[float, int, int]] = deque()  # (time, jobs, bytes) released
+        self._started = time.time()
+        self._lock = threading.Lock()
+
+    def _totals(self) -> Tuple[int, int]:
+        return (sum(t['jobs'] for t in self._tickets.values()),
+                sum(t['bytes'] for t in self._tickets.values()))
+
+    def _caller_jobs(self, caller: str) -> int:
+        return sum(t['jobs'] for t in self._tickets.values() if t['caller'] == caller)
+
+    def _drain_rates(self) -> Tuple[float, float]:
+        """Jobs and bytes per second released over the recent window."""
+        now = time.time()
+        while self._drained and now - self._drained[0][0] > DRAIN_WINDOW:
+            self._drained.popleft()
+        if len(self._drained) < MIN_DRAIN_SAMPLES:
+            return 0.0, 0.0
+        # Measured over the whole window, not from the first release, so a burst isn't taken as the pace
+        elapsed = max(min(DRAIN_WINDOW, now - self._started), 1.0)
+        return (sum(jobs for _, jobs, _ in self._drained) / elapsed,
+                sum(size for _, _, size in self._drained) / elapsed)
+
+    @staticmethod
+    def _wait(excess: float, rate: float) -> int:
+        if rate <= 0:
+            return DEFAULT_RETRY_AFTER
+        return max(1, min(MAX_RETRY_AFTER, math.ceil(excess / rate)))
+
+    def _free_bytes(self) -> int:
+        return shutil.disk_usage(self.disk_path).free
+
+    def check(self, caller: str, jobs: int = 1, nbytes: int = 0, key: Optional[str] = None):
+        """Raise AdmissionRejected if the work can't be accepted now."""
+        with self._lock:
+            self._check(caller, jobs, nbytes, key)
+
+    def _check(self, caller: str, jobs: int, nbytes: int, key: Optional[str]):
+        if key in self._tickets:
+            # Growing a reservation counts against whoever made it
+            caller = self._tickets[key]['caller']
+        total_jobs, total_bytes = self._totals()
+        caller_jobs = self._caller_jobs(caller)
+        job_rate, byte_rate = self._drain_rates()
+
+        if jobs > self.max_jobs_per_caller or jobs > self.max_queue:
+            raise AdmissionRejected(
+                f"Request of {jobs} files exceeds the limit of "
+                f"{min(self.max_jobs_per_caller, self.max_queue)}; split it into smaller batches", None)
+        if nbytes > self.max_inflight_bytes:
+            raise AdmissionRejected(
+                f"Request of {nbytes} bytes exceeds the in-flight limit of {self.max_inflight_bytes} bytes", None)
+
+        if caller_jobs + jobs > self.max_jobs_per_caller:
+            # A caller's jobs drain at roughly their share of the overall rate
+            callers = max(1, len({t['caller'] for t in self._tickets.values()}))
+            raise AdmissionRejected(
+                f"Too many outstanding jobs for this caller ({caller_jobs} of {self.max_jobs_per_caller})",
+                self._wait(caller_jobs + jobs - self.max_jobs_per_caller, job_rate / callers))
+        if total_jobs + jobs > self.max_queue:
+            raise AdmissionRejected(
+                f"Analysis queue is full ({total_jobs} of {self.max_queue} jobs)",
+                self._wait(total_jobs + jobs - self.max_queue, job_rate))
+        if total_bytes + nbytes > self.max_inflight_bytes:
+            raise AdmissionRejected(
+                f"Too much data awaiting analysis ({total_bytes} of {self.max_inflight_bytes} bytes)",
+                self._wait(total_bytes + nbytes - self.max_inflight_bytes, byte_rate))
+        if self._free_bytes() - nbytes < self.min_free_bytes:
+            raise AdmissionRejected("Not enough free disk space to accept the upload", DISK_RETRY_AFTER)
+
+    def admit(self, key: str, caller: str, jobs: int = 1, nbytes: int = 0):
+        """Reserve capacity under key (a batch or upload ID), adding to an existing reservation."""
+        with self._lock:
+            try:
+                self._check(caller, jobs, nbytes, key)
+            except AdmissionRejected as e:
+                self.rejected += 1
+                retry = f"retry after {e.retry_after}s" if e.retry_after is not None else "too large"
+                logger.warning(f"Rejected work from {caller}: {str(e)} ({retry})")
+                raise
+            ticket = self._tickets.setdefault(key, {'caller': caller, 'jobs': 0, 'bytes': 0})
+            ticket['jobs'] += jobs
+            ticket['bytes'] += nbytes
+
+    def release(self, key: str, jobs: Optional[int] = None):
+        """Return capacity: that many jobs and their share of bytes, or the whole reservation when jobs is None."""
+        with self._lock:
+            ticket = self._tickets.get(key)
+            if ticket is None:
+                return
+            if jobs is None:
+                released_jobs, released_bytes = ticket['jobs'], ticket['bytes']
+                del self._tickets[key]
+            else:
+                # The reservation stays until its owner is done, since an archive may still add jobs
+                released_jobs = min(jobs, ticket['jobs'])
+                released_bytes = ticket['bytes'] * released_jobs // ticket['jobs'] if ticket['jobs'] else 0
+                ticket['jobs'] -= released_jobs
+                ticket['bytes'] -= released_bytes
+            if released_jobs:
+                self._drained.append((time.time(), released_jobs, released_bytes))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total_jobs, total_bytes = self._totals()
+            job_rate, byte_rate = self._drain_rates()
+            callers: Dict[str, int] = {}
+            for ticket in self._tickets.values():
+                callers[ticket['caller']] = callers.get(ticket['caller'], 0) + ticket['jobs']
+        return {
+            'outstanding_jobs': total_jobs,
+            'inflight_bytes': total_bytes,
+            'free_bytes': self._free_bytes(),
+            'max_queue': self.max_queue,
+            'max_inflight_bytes': self.max_inflight_bytes,
+            'min_free_bytes': self.min_free_bytes,
+            'max_jobs_per_caller': self.max_jobs_per_caller,
+            'jobs_per_second': round(job_rate, 3),
+            'rejected': self.rejected,
+            'callers': callers
+        }
+
+
+_controller: Optional[AdmissionController] = None
+_controller_lock = threading.Lock()
+
+
+def get_admission_controller(disk_path: str = '.') -> AdmissionController:
+    """Return the process-wide controller, configured from ADMISSION_* environment variables."""
+    global _controller
+    with _controller_lock:
+        if _controller is None:
+            _controller = AdmissionController(
+                max_queue=int(os.environ.get('ADMISSION_MAX_QUEUE', DEFAULT_MAX_QUEUE)),
+                max_inflight_bytes=int(os.environ.get('ADMISSION_MAX_INFLIGHT_BYTES', DEFAULT_MAX_INFLIGHT_BYTES)),
+                min_free_bytes=int(os.environ.get('ADMISSION_MIN_FREE_BYTES', DEFAULT_MIN_FREE_BYTES)),
+                max_jobs_per_caller=int(os.environ.get('ADMISSION_MAX_JOBS_PER_CALLER', DEFAULT_MAX_JOBS_PER_CALLER)),
+                disk_path=disk_path
+            )
+        return _controller
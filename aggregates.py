@@ -0,0 +1,231 @@
+import json
+import logging
+from collections import defaultdict
+from itertools import combinations
+from typing import Any, Dict, Optional, Tuple
+
+from sqlalchemy import event, select, text
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import attributes
+
+from database import db
+from models import AudioAnalysis, DashboardAggregate
+
+logger = logging.getLogger(__name__)
+
+# Columns the dashboard totals are computed from
+AGGREGATED_COLUMNS = (
+    'format', 'has_narration', 'has_underscore', 'has_sound_effects', 'songs_count',
+    'environments', 'characters_mentioned', 'speaking_characters', 'themes',
+    'emotion_scores', 'dominant_emotion', 'confidence_score'
+)
+# Metric -> list column whose items are counted
+LIST_METRICS = {
+    'theme': 'themes',
+    'character': 'characters_mentioned',
+    'speaking_character': 'speaking_characters',
+    'environment': 'environments'
+}
+# Metric -> list column whose item pairs are counted, for theme correlations and the character network
+PAIR_METRICS = {
+    'theme_pair': 'themes',
+    'speaking_character_pair': 'speaking_characters'
+}
+FLAGS = ('has_narration', 'has_underscore', 'has_sound_effects')
+BUILT = ('built', '')  # Present once the totals cover every analysis
+MAX_PAIRS = 500  # Most frequent pairs returned per metric
+# An analysis adds a row per pair to its write, k(k-1)/2 for k items, so only its first items are paired
+MAX_PAIR_ITEMS = 20
+
+Deltas = Dict[Tuple[str, str], Tuple[int, float]]
+
+
+def _number(value) -> Optional[float]:
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return None
+    return float(value)
+
+
+def _items(value) -> list:
+    """Distinct non-empty strings of a list column, in order."""
+    if not isinstance(value, list):
+        return []
+    return list(dict.fromkeys(str(item) for item in value if item not in (None, '')))
+
+
+def contributions(row: Dict[str, Any]) -> Deltas:
+    """What one analysis adds to each total: (metric, key) -> (count, sum)."""
+    totals: Deltas = {('analyses', ''): (1, 0.0)}
+    if row.get('format'):
+        totals[('format', row['format'])] = (1, 0.0)
+    for flag in FLAGS:
+        if row.get(flag):
+            totals[('flag', flag)] = (1, 0.0)
+    songs = row.get('songs_count') or 0
+    totals[('songs', '')] = (1 if songs > 0 else 0, float(songs))
+    confidence = _number(row.get('confidence_score'))
+    if confidence is not None:
+        totals[('confidence', '')] = (1, confidence)
+    if row.get('dominant_emotion'):
+        totals[('dominant_emotion', row['dominant_emotion'])] = (1, 0.0)
+    scores = row.get('emotion_scores')
+    for emotion, score in (scores.items() if isinstance(scores, dict) else ()):
+        score = _number(score)
+        if score is not None:
+            totals[('emotion', emotion)] = (1, score)
+    for metric, column in LIST_METRICS.items():
+        for item in _items(row.get(column)):
+            totals[(metric, item)] = (1, 0.0)
+    for metric, column in PAIR_METRICS.items():
+        for pair in combinations(sorted(_items(row.get(column))[:MAX_PAIR_ITEMS]), 2):
+            totals[(metric, json.dumps(pair))] = (1, 0.0)
+    return totals
+
+
+def _combine(deltas: Deltas, row: Optional[Dict[str, Any]], sign: int):
+    if row is None:
+        return
+    for key, (count, total) in contributions(row).items():
+        old_count, old_total = deltas.get(key, (0, 0.0))
+        deltas[key] = (old_count + sign * count, old_total + sign * total)
+
+
+def apply_deltas(connection, deltas: Deltas):
+    """Add deltas to the stored totals in the caller's transaction."""
+    rows = [{'metric': metric, 'key': key, 'count': count, 'total': total}
+            for (metric, key), (count, total) in sorted(deltas.items()) if count or total]
+    if not rows:
+        return
+    table = DashboardAggregate.__table__
+    # Sorted, so concurrent writers lock shared rows in the same order
+    stmt = insert(table).values(rows)
+    connection.execute(stmt.on_conflict_do_update(
+        index_elements=[table.c.metric, table.c.key],
+        set_={'count': table.c.count + stmt.excluded.count, 'total': table.c.total + stmt.excluded.total}
+    ))
+
+
+def _stored_row(connection, analysis_id: int) -> Optional[Dict[str, Any]]:
+    """The aggregated columns as currently stored, before this flush changes them."""
+    table = AudioAnalysis.__table__
+    result = connection.execute(
+        select(*[table.c[column] for column in AGGREGATED_COLUMNS]).where(table.c.id == analysis_id)
+    ).mappings().first()
+    return dict(result) if result is not None else None
+
+
+# The totals follow writes made through the ORM. An in-place change to a JSONB list or dict is only
+# saved, and only counted, once flagged with flag_modified; old values are read back from the database,
+# so a flagged change is counted correctly. Raw SQL writes bypass the totals: delete the ('built', '')
+# marker row and they are rebuilt on the next read after a restart.
+@event.listens_for(AudioAnalysis, 'after_insert')
+def _count_insert(mapper, connection, target):
+    deltas: Deltas = {}
+    _combine(deltas, {column: getattr(target, column) for column in AGGREGATED_COLUMNS}, 1)
+    apply_deltas(connection, deltas)
+
+
+@event.listens_for(AudioAnalysis, 'before_update')
+def _count_update(mapper, connection, target):
+    histories = {column: attributes.get_history(target, column) for column in AGGREGATED_COLUMNS}
+    if not any(history.has_changes() for history in histories.values()):
+        return
+    old = _stored_row(connection, target.id)
+    if old is None:
+        return
+    new = {column: histories[column].added[0] if histories[column].added else old[column]
+           for column in AGGREGATED_COLUMNS}
+    deltas: Deltas = {}
+    _combine(deltas, old, -1)
+    _combine(deltas, new, 1)
+    apply_deltas(connection, deltas)
+
+
+@event.listens_for(AudioAnalysis, 'before_delete')
+def _count_delete(mapper, connection, target):
+    deltas: Deltas = {}
+    _combine(deltas, _stored_row(connection, target.id), -1)
+    apply_deltas(connection, deltas)
+
+
+_built = False  # Set once the totals are known to exist; they are kept up to date from then on
+
+
+def ensure_built():
+    """Compute the totals from scratch if they have never been, e.g. just after the migration.
+
+    Once the marker row has been seen, reads skip the check altogether. The
+    table is only locked when the totals need building, and that is done in
+    a transaction of its own rather than the caller's session.
+    """
+    global _built
+    if _built:
+        return
+    table = DashboardAggregate.__table__
+    marker = select(table.c.metric).where(table.c.metric == BUILT[0], table.c.key == BUILT[1])
+    with db.engine.begin() as connection:
+        if connection.execute(marker).first() is None:
+            # Waits for writers in flight, whose analyses are then counted below, and keeps new ones out until done
+            connection.execute(text('LOCK TABLE dashboard_aggregates IN SHARE ROW EXCLUSIVE MODE'))
+            # Another process may have built them while this one waited for the lock
+            if connection.execute(marker).first() is None:
+                connection.execute(table.delete())
+                deltas: Deltas = {}
+                analyses_table = AudioAnalysis.__table__
+                rows = connection.execute(select(*[analyses_table.c[column] for column in AGGREGATED_COLUMNS])
+                                          .execution_options(yield_per=1000))
+                analyses = 0
+                for values in rows:
+                    _combine(deltas, dict(zip(AGGREGATED_COLUMNS, values)), 1)
+                    analyses += 1
+                deltas[BUILT] = (1, 0.0)
+                apply_deltas(connection, deltas)
+                logger.info(f"Built dashboard totals over {analyses} analyses")
+    _built = True
+
+
+def dashboard_summary() -> Dict[str, Any]:
+    """The dashboard's numbers, read from the running totals rather than the analyses."""
+    ensure_built()
+    counts: Dict[str, Dict[str, int]] = defaultdict(dict)
+    sums: Dict[str, Dict[str, float]] = defaultdict(dict)
+    rows = DashboardAggregate.query.filter(
+        DashboardAggregate.metric.notin_(list(PAIR_METRICS)), DashboardAggregate.count != 0
+    )
+    for row in rows:
+        counts[row.metric][row.key] = row.count
+        sums[row.metric][row.key] = row.total
+
+    def by_count(metric):
+        return dict(sorted(counts[metric].items(), key=lambda item: (-item[1], item[0])))
+
+    def average(metric, key):
+        count = counts[metric].get(key, 0)
+        return round(sums[metric][key] / count, 4) if count else None
+
+    pairs = {}
+    for metric in PAIR_METRICS:
+        top = DashboardAggregate.query.filter(
+            DashboardAggregate.metric == metric, DashboardAggregate.count > 0
+        ).order_by(DashboardAggregate.count.desc(), DashboardAggregate.key).limit(MAX_PAIRS)
+        pairs[f'{metric}s'] = [[*json.loads(row.key), row.count] for row in top]
+
+    latest = AudioAnalysis.query.with_entities(AudioAnalysis.tone_analysis).order_by(
+        AudioAnalysis.id.desc()).first()
+    return {
+        'total': counts['analyses'].get('', 0),
+        'formats': by_count('format'),
+        'flags': {flag: counts['flag'].get(flag, 0) for flag in FLAGS},
+        'with_songs': counts['songs'].get('', 0),
+        'total_songs': int(sums['songs'].get('', 0)),
+        'average_confidence': average('confidence', ''),
+        # Averaged over the analyses that have each score
+        'emotion_averages': {emotion: average('emotion', emotion) for emotion in counts['emotion']},
+        'dominant_emotions': by_count('dominant_emotion'),
+        'themes': by_count('theme'),
+        'characters': by_count('character'),
+        'speaking_characters': by_count('speaking_character'),
+        'environments': by_count('environment'),
+        **pairs,
+        'latest_tone_analysis': latest.tone_analysis if latest else None
+    }
@@ -0,0 +1,138 @@
+import asyncio
+import logging
+import os
+import threading
+from concurrent.futures import CancelledError, Future, ThreadPoolExecutor
+from typing import Any, Awaitable, Dict, Optional
+
+from cancellation import AnalysisCancelled, CancellationToken
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_IN_FLIGHT = 256  # Analyses awaiting the network at once
+DEFAULT_IO_THREADS = 16  # Threads for blocking SDK calls such as file uploads
+
+
+class AnalysisWorker:
+    """Runs analysis coroutines on one background event loop.
+
+    Model calls spend almost all their time waiting on the network, so a
+    single loop can hold hundreds of them in flight. A semaphore bounds how
+    many run at once; the rest wait in the loop's queue, which keeps memory
+    bounded no matter how much work is submitted.
+    """
+
+    def __init__(self, max_in_flight: int = DEFAULT_MAX_IN_FLIGHT, io_threads: int = DEFAULT_IO_THREADS):
+        self.max_in_flight = max_in_flight
+        self.io_threads = io_threads
+        self.in_flight = 0
+        self.queued = 0
+        self.completed = 0
+        self.failed = 0
+        self.cancelled = 0
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._lock = threading.Lock()
+
+    def _ensure_started(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                # asyncio.to_thread() runs on the default executor, so this bounds blocking SDK calls
+                loop.set_default_executor(
+                    ThreadPoolExecutor(max_workers=self.io_threads, thread_name_prefix='analysis-io')
+                )
+                started = threading.Event()
+
+                def run():
+                    asyncio.set_event_loop(loop)
+                    self._semaphore = asyncio.Semaphore(self.max_in_flight)
+                    started.set()
+                    loop.run_forever()
+
+                self._thread = threading.Thread(target=run, name='analysis-worker', daemon=True)
+                self._thread.start()
+                started.wait()
+                self._loop = loop
+                logger.info(f"Started analysis event loop with {self.max_in_flight} in-flight slots")
+            return self._loop
+
+    def in_worker_thread(self) -> bool:
+        return self._thread is not None and threading.current_thread() is self._thread
+
+    async def _bounded(self, coro: Awaitable) -> Any:
+        self.queued += 1
+        try:
+            await self._semaphore.acquire()
+        except BaseException:
+            coro.close()
+            raise
+        finally:
+            self.queued -= 1
+        self.in_flight += 1
+        try:
+            result = await coro
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        except BaseException:
+            self.failed += 1
+            raise
+        finally:
+            self.in_flight -= 1
+            self._semaphore.release()
+        self.completed += 1
+        return result
+
+    def submit(self, coro: Awaitable, token: Optional[CancellationToken] = None) -> Future:
+        """Schedule a coroutine on the worker loop and return a thread-safe future.
+
+        Cancelling the token cancels the task, interrupting whatever it is
+        awaiting and freeing its in-flight slot.
+        """
+        loop = self._ensure_started()
+        future = asyncio.run_coroutine_threadsafe(self._bounded(coro), loop)
+        if token is not None:
+            # Cancelling the concurrent future cancels the task on the loop
+            cancel = future.cancel
+            token.add_callback(cancel)
+            future.add_done_callback(lambda _: token.remove_callback(cancel))
+        return future
+
+    def run(self, coro: Awaitable, timeout: Optional[float] = None,
+            token: Optional[CancellationToken] = None) -> Any:
+        """Run a coroutine on the worker loop and block the calling thread for its result."""
+        if self.in_worker_thread():
+            coro.close()
+            raise RuntimeError("Blocking analysis call made from the analysis event loop; await the async method")
+        try:
+            return self.submit(coro, token).result(timeout)
+        except CancelledError:
+            raise AnalysisCancelled(token.reason if token else 'Cancelled') from None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'max_in_flight': self.max_in_flight,
+            'in_flight': self.in_flight,
+            'queued': self.queued,
+            'completed': self.completed,
+            'failed': self.failed,
+            'cancelled': self.cancelled
+        }
+
+
+_worker: Optional[AnalysisWorker] = None
+_worker_lock = threading.Lock()
+
+
+def get_analysis_worker() -> AnalysisWorker:
+    """Return the process-wide analysis worker, sized by ANALYSIS_MAX_IN_FLIGHT."""
+    global _worker
+    with _worker_lock:
+        if _worker is None:
+            _worker = AnalysisWorker(
+                max_in_flight=int(os.environ.get('ANALYSIS_MAX_IN_FLIGHT', DEFAULT_MAX_IN_FLIGHT)),
+                io_threads=int(os.environ.get('ANALYSIS_IO_THREADS', DEFAULT_IO_THREADS))
+            )
+        return _worker
@@ -0,0 +1,59 @@
+import logging
+import os
+import shutil
+import tarfile
+import zipfile
+from typing import BinaryIO, Callable, Iterator, Tuple
+
+from werkzeug.utils import secure_filename
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_EXTENSIONS = ('.zip', '.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tbz2', '.tar.xz', '.txz')
+ARCHIVE_ERRORS = (tarfile.TarError, zipfile.BadZipFile, EOFError)
+COPY_CHUNK_SIZE = 1024 * 1024
+
+
+def is_archive(filename: str) -> bool:
+    return filename.lower().endswith(ARCHIVE_EXTENSIONS)
+
+
+def entry_name(name: str) -> str:
+    """A safe batch filename for an archive member, keeping its folders so names don't collide."""
+    return '/'.join(filter(None, (secure_filename(part) for part in name.replace('\\', '/').split('/'))))
+
+
+def iter_archive_entries(stream: BinaryIO, filename: str,
+                         temp_path: Callable[[str], str]) -> Iterator[Tuple[str, BinaryIO, int]]:
+    """Yield (name, file object, size) for each regular file in a zip or tar archive.
+
+    Tar archives, compressed or not, are read in a single pass as the
+    stream arrives, so each entry can be handled before the rest has been
+    received; an entry's file object is only valid until the next one is
+    requested. Zip archives keep their index at the end, so a stream that
+    can't seek is spooled to temp_path('.zip') first.
+    """
+    if not filename.lower().endswith('.zip'):
+        with tarfile.open(fileobj=stream, mode='r|*') as tar:
+            for member in tar:
+                if member.isfile():
+                    yield member.name, tar.extractfile(member), member.size
+        return
+
+    spool_path, spool = None, None
+    try:
+        if not (hasattr(stream, 'seekable') and stream.seekable()):
+            spool_path = temp_path('.zip')
+            with open(spool_path, 'wb') as out:
+                shutil.copyfileobj(stream, out, COPY_CHUNK_SIZE)
+            stream = spool = open(spool_path, 'rb')
+        with zipfile.ZipFile(stream) as archive:
+            for info in archive.infolist():
+                if not info.is_dir():
+                    with archive.open(info) as entry:
+                        yield info.filename, entry, info.file_size
+    finally:
+        if spool is not None:
+            spool.close()
+        if spool_path and os.path.exists(spool_path):
+            os.remove(spool_path)
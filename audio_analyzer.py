@@ -1,13 +1,18 @@
 import os
+import math
+import wave
 import shutil
+import asyncio
 import logging
 import tempfile
 import subprocess
-import time
 from typing import Dict, Any
-from openai import OpenAI, RateLimitError
-from pydub import AudioSegment
+from openai import AsyncOpenAI
 import json
+from analysis_worker import get_analysis_worker
+from blob_store import file_digest, get_blob_store
+from cancellation import stage_timeout, with_deadline
+from retry_policy import RATE_LIMIT, classify_error, get_retry_policy
 
 # Configure logging
 logging.basicConfig(
@@ -16,6 +21,10 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Bump when the FFmpeg arguments change so stored transcodes are rebuilt
+WAV_TRANSFORM = 'wav_16k_mono'
+WAV_TRANSFORM_VERSION = 1
+
 class AudioAnalyzer:
     def __init__(self):
         """Initialize AudioAnalyzer with OpenAI client"""
@@ -23,8 +32,10 @@ class AudioAnalyzer:
             self.temp_dir = tempfile.mkdtemp()
             logger.debug("Created temporary directory at: %s", self.temp_dir)
 
-            # Initialize OpenAI client
-            self.client = OpenAI()
+            # Initialize OpenAI client; calls run on the analysis event loop. The
+            # client's own retries are off so the shared policy is the only one
+            self.client = AsyncOpenAI(max_retries=0, timeout=stage_timeout('generation'))
+            self.retry = get_retry_policy('openai')
 
             # Verify FFmpeg installation
             try:
@@ -40,137 +51,175 @@ class AudioAnalyzer:
                 shutil.rmtree(self.temp_dir)
             raise
 
-    def _transcribe_with_retry(self, audio_file, max_retries=3):
-        """Attempt to transcribe audio with retries"""
-        for attempt in range(max_retries):
-            try:
-                return self.client.audio.transcriptions.create(
-                    model="whisper-1",
-                    file=audio_file,
-                    response_format="verbose_json"
-                )
-            except RateLimitError as e:
-                if attempt == max_retries - 1:
-                    raise ValueError("OpenAI API rate limit exceeded. Please try again in a few minutes.") from e
-                wait_time = (attempt + 1) * 2  # Exponential backoff
-                logger.warning(f"Rate limit hit, waiting {wait_time} seconds before retry")
-                time.sleep(wait_time)
-            except Exception as e:
-                raise ValueError(f"Error transcribing audio: {str(e)}") from e
+    async def _transcribe_with_retry(self, audio_file):
+        """Transcribe audio under the shared OpenAI retry policy"""
+        async def transcribe():
+            audio_file.seek(0)  # A failed attempt may have consumed the upload stream
+            return await self.client.audio.transcriptions.create(
+                model="whisper-1",
+                file=audio_file,
+                response_format="verbose_json"
+            )
+
+        try:
+            return await self.retry.call_async(transcribe)
+        except Exception as e:
+            if classify_error(e) == RATE_LIMIT:
+                raise ValueError("OpenAI API rate limit exceeded. Please try again in a few minutes.") from e
+            raise ValueError(f"Error transcribing audio: {str(e)}") from e
+
+    async def _convert_to_wav(self, file_path: str, temp_wav: str):
+        """Convert a file to 16kHz mono WAV with FFmpeg without blocking the event loop."""
+        convert_cmd = [
+            'ffmpeg', '-i', file_path,
+            '-ac', '1',  # Convert to mono
+            '-ar', '16000',  # Set sample rate for Whisper
+            '-acodec', 'pcm_s16le',  # Use 16-bit PCM codec
+            '-y',  # Overwrite output file if exists
+            temp_wav
+        ]
+        process = await asyncio.create_subprocess_exec(
+            *convert_cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+        )
+        try:
+            stdout, stderr = await with_deadline('transcode', process.communicate())
+        except BaseException:
+            # Timed out or cancelled: don't leave FFmpeg running
+            if process.returncode is None:
+                process.kill()
+                await process.wait()
+            raise
+        if process.returncode != 0:
+            raise subprocess.CalledProcessError(process.returncode, convert_cmd, stdout, stderr)
+
+    async def _get_wav(self, file_path: str) -> str:
+        """Return a 16kHz mono WAV of the file, reusing a stored transcode of the same content."""
+        store = get_blob_store()
+        digest = await asyncio.to_thread(file_digest, file_path)
+        wav_path = store.derived_path(digest, WAV_TRANSFORM, WAV_TRANSFORM_VERSION)
+        if wav_path:
+            logger.debug(f"Reusing stored transcode for {file_path}")
+            return wav_path
+
+        temp_wav = store.new_temp_path('.wav')
+        try:
+            await self._convert_to_wav(file_path, temp_wav)
+            return await asyncio.to_thread(
+                store.put_derived, digest, WAV_TRANSFORM, WAV_TRANSFORM_VERSION, temp_wav
+            )
+        finally:
+            if os.path.exists(temp_wav):
+                os.remove(temp_wav)
 
     def analyze_content(self, file_path: str) -> Dict[str, Any]:
         """Analyze audio content using Whisper and audio processing"""
+        return get_analysis_worker().run(self.analyze_content_async(file_path))
+
+    async def analyze_content_async(self, file_path: str) -> Dict[str, Any]:
+        """Async analysis; many files can be converted and transcribed concurrently on one loop."""
         if not os.path.exists(file_path):
             raise FileNotFoundError(f"File not found: {file_path}")
 
         logger.info(f"Starting analysis of file: {file_path}")
-        temp_wav = None
 
-        try:
-            # Basic file validation
-            file_size = os.path.getsize(file_path)
-            if file_size == 0:
-                raise ValueError("File is empty")
+        # Basic file validation
+        file_size = os.path.getsize(file_path)
+        if file_size == 0:
+            raise ValueError("File is empty")
 
-            if file_size > 500 * 1024 * 1024:  # 500MB limit
-                raise ValueError("File size exceeds 500MB limit")
+        if file_size > 500 * 1024 * 1024:  # 500MB limit
+            raise ValueError("File size exceeds 500MB limit")
 
-            file_ext = os.path.splitext(file_path)[1].lower()
-            if not file_ext:
-                raise ValueError("File has no extension")
+        file_ext = os.path.splitext(file_path)[1].lower()
+        if not file_ext:
+            raise ValueError("File has no extension")
 
-            valid_extensions = {'.mp3', '.wav', '.mp4', '.avi', '.mov'}
-            if file_ext not in valid_extensions:
-                raise ValueError(f"Unsupported file format. Supported formats: {', '.join(valid_extensions)}")
+        valid_extensions = {'.mp3', '.wav', '.mp4', '.avi', '.mov'}
+        if file_ext not in valid_extensions:
+            raise ValueError(f"Unsupported file format. Supported formats: {', '.join(valid_extensions)}")
 
-            # Convert to WAV for analysis
-            temp_wav = os.path.join(self.temp_dir, "temp.wav")
-            try:
-                # Use FFmpeg for conversion
-                convert_cmd = [
-                    'ffmpeg', '-i', file_path,
-                    '-ac', '1',  # Convert to mono
-                    '-ar', '16000',  # Set sample rate for Whisper
-                    '-acodec', 'pcm_s16le',  # Use 16-bit PCM codec
-                    '-y',  # Overwrite output file if exists
-                    temp_wav
-                ]
-                subprocess.run(convert_cmd, capture_output=True, text=True, check=True)
-                logger.debug("File converted to WAV successfully")
-
-                # Get audio duration using pydub
-                audio = AudioSegment.from_wav(temp_wav)
-                duration = len(audio) / 1000.0  # Convert to seconds
-
-                # Format duration
-                hours = int(duration // 3600)
-                minutes = int((duration % 3600) // 60)
-                seconds = int(duration % 60)
-                formatted_duration = f"{hours:02d}:{minutes:02d}:{seconds:02d}"
-
-                # Analyze audio using Whisper with retry logic
-                logger.debug("Starting Whisper analysis")
-                with open(temp_wav, 'rb') as audio_file:
-                    transcription = self._transcribe_with_retry(audio_file)
-
-                # Extract real information from transcription
-                segments = transcription.segments
-                logger.debug(f"Found {len(segments)} segments in audio")
-
-                # Analyze audio characteristics
-                full_text = ' '.join(segment.text for segment in segments)
-                logger.debug("Extracted full text from audio")
-
-                # Detect voice characteristics
-                multiple_speakers = len([s for s in segments if s.confidence > 0.8]) > 3
-                speaking_characters = ["Multiple Speakers"] if multiple_speakers else ["Single Speaker"]
-
-                # Detect music and sound effects
-                has_music = '♪' in full_text or '♫' in full_text
-                sfx_segments = [s for s in segments if s.end - s.start < 0.5 and s.confidence < 0.5]
-
-                # Analyze audio environment
-                avg_confidence = sum(s.confidence for s in segments) / len(segments) if segments else 0
-                environments = []
-                if avg_confidence > 0.9:
-                    environments.append("clear audio environment")
-                elif avg_confidence < 0.6:
-                    environments.append("noisy environment")
-
-                # Determine format based on content
-                has_speech = any(s.confidence > 0.8 for s in segments)
-                format_type = "narrated content" if has_speech else "ambient audio"
-
-                result = {
-                    'length': duration,
-                    'format': format_type,
-                    'has_underscore': has_music,
-                    'sound_effects_count': len(sfx_segments),
-                    'songs_count': sum(1 for s in segments if '♪' in s.text or '♫' in s.text),
-                    'characters_mentioned': [],  # Let's keep this empty as it requires NLP
-                    'speaking_characters': speaking_characters,
-                    'environments': environments,
-                    'themes': [],  # Let's keep this empty as it requires semantic analysis
-                    'duration': formatted_duration
-                }
-
-                logger.info("Analysis completed successfully")
-                return result
-
-            except subprocess.CalledProcessError as e:
-                logger.error(f"FFmpeg error: {str(e)}")
-                raise ValueError("Error converting audio format. Please ensure the file is not corrupted.")
-            except Exception as e:
-                logger.error(f"Error analyzing audio: {str(e)}")
-                raise ValueError(f"Error analyzing audio content: {str(e)}")
-
-        finally:
-            if temp_wav and os.path.exists(temp_wav):
-                try:
-                    os.remove(temp_wav)
-                    logger.debug("Cleaned up temporary WAV file")
-                except Exception as e:
-                    logger.error(f"Error cleaning up temp file: {str(e)}")
+        # Convert to WAV for analysis; the transcode is kept in the blob store for re-runs
+        try:
+            wav_path = await self._get_wav(file_path)
+            logger.debug("File converted to WAV successfully")
+
+            # Read the duration from the WAV header rather than decoding the whole file
+            with wave.open(wav_path, 'rb') as wav:
+                duration = wav.getnframes() / float(wav.getframerate())
+
+            # Format duration
+            hours = int(duration // 3600)
+            minutes = int((duration % 3600) // 60)
+            seconds = int(duration % 60)
+            formatted_duration = f"{hours:02d}:{minutes:02d}:{seconds:02d}"
+
+            # Analyze audio using Whisper with retry logic
+            logger.debug("Starting Whisper analysis")
+            with open(wav_path, 'rb') as audio_file:
+                transcription = await self._transcribe_with_retry(audio_file)
+
+            # Extract real information from transcription
+            segments = transcription.segments
+            logger.debug(f"Found {len(segments)} segments in audio")
+
+            # Analyze audio characteristics
+            full_text = ' '.join(segment.text for segment in segments)
+            logger.debug("Extracted full text from audio")
+
+            # Whisper segments carry no confidence; speech probability and the
+            # per-token log-probability are what it reports per segment
+            def speech_prob(segment):
+                return 1.0 - segment.no_speech_prob
+
+            def confidence(segment):
+                return math.exp(segment.avg_logprob)
+
+            speech_segments = [s for s in segments if speech_prob(s) > 0.8]
+
+            # Detect voice characteristics
+            multiple_speakers = len(speech_segments) > 3
+            speaking_characters = ["Multiple Speakers"] if multiple_speakers else ["Single Speaker"]
+
+            # Detect music and sound effects
+            has_music = '♪' in full_text or '♫' in full_text
+            sfx_segments = [s for s in segments if s.end - s.start < 0.5 and speech_prob(s) < 0.5]
+
+            # Analyze audio environment
+            avg_confidence = sum(confidence(s) for s in segments) / len(segments) if segments else 0
+            environments = []
+            if avg_confidence > 0.9:
+                environments.append("clear audio environment")
+            elif avg_confidence < 0.6:
+                environments.append("noisy environment")
+
+            # Determine format based on content
+            has_speech = bool(speech_segments)
+            format_type = "narrated content" if has_speech else "ambient audio"
+
+            result = {
+                'length': duration,
+                'format': format_type,
+                'has_underscore': has_music,
+                'sound_effects_count': len(sfx_segments),
+                'songs_count': sum(1 for s in segments if '♪' in s.text or '♫' in s.text),
+                'characters_mentioned': [],  # Let's keep this empty as it requires NLP
+                'speaking_characters': speaking_characters,
+                'environments': environments,
+                'themes': [],  # Let's keep this empty as it requires semantic analysis
+                'duration': formatted_duration,
+                'transcript': full_text.strip(),
+                'confidence_score': round(avg_confidence, 4)
+            }
+
+            logger.info("Analysis completed successfully")
+            return result
+
+        except subprocess.CalledProcessError as e:
+            logger.error(f"FFmpeg error: {str(e)}")
+            raise ValueError("Error converting audio format. Please ensure the file is not corrupted.")
+        except Exception as e:
+            logger.error(f"Error analyzing audio: {str(e)}")
+            raise ValueError(f"Error analyzing audio content: {str(e)}")
 
     def cleanup(self):
         """Clean up temporary resources"""
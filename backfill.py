@@ -0,0 +1,284 @@
+import glob
+import json
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from database import db
+from models import AudioAnalysis
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_WORKERS = 4  # Concurrent model calls
+DEFAULT_CHUNK_SIZE = 40  # Rows per commit and checkpoint
+DEFAULT_PACK_SIZE = 10  # Records per packed emotion request
+PACKED_TRANSCRIPT_CHARS = 200000  # Transcript characters per packed summary request
+
+
+def missing_analysis_filter():
+    """Rows that still need a summary (and have a transcript) or emotion scores."""
+    return db.or_(
+        db.and_(
+            db.or_(AudioAnalysis.summary.is_(None), AudioAnalysis.summary == ''),
+            AudioAnalysis.transcript.isnot(None),
+            AudioAnalysis.transcript != ''
+        ),
+        AudioAnalysis.emotion_scores.is_(None),
+        AudioAnalysis.emotion_scores == {}
+    )
+
+
+class BackfillManager:
+    """Runs the missing-analysis backfill as a resumable background job."""
+
+    def __init__(self, max_workers: int = DEFAULT_MAX_WORKERS, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                 pack_size: int = DEFAULT_PACK_SIZE):
+        self.max_workers = max_workers
+        self.chunk_size = chunk_size
+        self.pack_size = pack_size
+        self.jobs: Dict[str, dict] = {}
+        self.active_job_id: Optional[str] = None
+        self._lock = threading.Lock()
+        self._analyzers = threading.local()
+
+    def start(self, app, max_workers: Optional[int] = None, packed: bool = True) -> str:
+        """Start a backfill, resuming the last unfinished checkpoint if there is one."""
+        with self._lock:
+            if self.active_job_id and self.jobs[self.active_job_id]['status'] == 'running':
+                return self.active_job_id
+
+            job_id = self._find_resumable_job()
+            if job_id:
+                job = self.jobs[job_id]
+                # Rows that failed before the checkpoint are behind last_id, so they are queued again explicitly
+                job['retry_ids'] = sorted(set(job.get('retry_ids', [])) | set(job.get('failed_ids', [])))
+                job['failed_ids'] = []
+                logger.info(f"Resuming backfill {job_id} after ID {job['last_id']}, "
+                            f"retrying {len(job['retry_ids'])} failed records first")
+            else:
+                job_id = datetime.now().strftime('%Y%m%d_%H%M%S')
+                with app.app_context():
+                    total = AudioAnalysis.query.filter(missing_analysis_filter()).count()
+                self.jobs[job_id] = {
+                    'job_id': job_id,
+                    'status': 'running',
+                    'total_records': total,
+                    'processed_records': 0,
+                    'updated_records': 0,
+                    'failed_records': 0,
+                    'last_id': 0,
+                    'failed_ids': [],  # Retried when the job is resumed
+                    'retry_ids': [],
+                    'errors': [],
+                    'started_at': datetime.now().isoformat(),
+                    'completed_at': None
+                }
+                logger.info(f"Created backfill {job_id} for {total} records")
+
+            job = self.jobs[job_id]
+            job['status'] = 'running'
+            job['max_workers'] = max_workers or self.max_workers
+            job['packed'] = packed
+            self.active_job_id = job_id
+            self.save_status(job_id)
+
+        thread = threading.Thread(target=self._run, args=(app, job_id), daemon=True)
+        thread.start()
+        return job_id
+
+    def get_status(self, job_id: str) -> dict:
+        """Get the current status of a backfill job."""
+        if job_id not in self.jobs and not self.load_status(job_id):
+            return {}
+        job = dict(self.jobs[job_id])
+        total = job['total_records']
+        job['progress'] = round(job['processed_records'] / total * 100, 2) if total else 100
+        return job
+
+    def _process_chunk(self, executor, job: dict, chunk: List[AudioAnalysis]):
+        """Analyze a chunk of rows and commit what came back, noting the rows that failed."""
+        # Model calls run on the pool; the session stays on this thread
+        snapshots = [self._snapshot(analysis) for analysis in chunk]
+        if job['packed']:
+            results, errors = self._analyze_packed(executor, snapshots)
+        else:
+            results, errors = self._analyze_each(executor, snapshots)
+
+        failed_ids = job.setdefault('failed_ids', [])
+        for analysis in chunk:
+            if analysis.id in errors:
+                job['failed_records'] += 1
+                failed_ids.append(analysis.id)
+                job['errors'] = (job['errors'] + [{'id': analysis.id, 'error': errors[analysis.id]}])[-20:]
+            if results.get(analysis.id):
+                self._apply(analysis, results[analysis.id])
+                job['updated_records'] += 1
+        db.session.commit()
+
+    def _run(self, app, job_id: str):
+        job = self.jobs[job_id]
+        with app.app_context(), ThreadPoolExecutor(max_workers=job['max_workers']) as executor:
+            try:
+                # Records that failed in an earlier run; they were already counted as processed
+                while job.get('retry_ids'):
+                    retry_ids = job['retry_ids'][:self.chunk_size]
+                    chunk = AudioAnalysis.query.filter(
+                        missing_analysis_filter(),
+                        AudioAnalysis.id.in_(retry_ids)
+                    ).order_by(AudioAnalysis.id).all()
+                    # Counted again if they fail again; rows fixed or deleted since are no longer failures
+                    job['failed_records'] -= len(retry_ids)
+                    if chunk:
+                        self._process_chunk(executor, job, chunk)
+                    job['retry_ids'] = job['retry_ids'][len(retry_ids):]
+                    self.save_status(job_id)
+
+                while True:
+                    chunk = AudioAnalysis.query.filter(
+                        missing_analysis_filter(),
+                        AudioAnalysis.id > job['last_id']
+                    ).order_by(AudioAnalysis.id).limit(self.chunk_size).all()
+                    if not chunk:
+                        break
+
+                    self._process_chunk(executor, job, chunk)
+                    job['processed_records'] += len(chunk)
+                    job['last_id'] = chunk[-1].id
+                    self.save_status(job_id)
+                    logger.info(f"Backfill {job_id} checkpoint at ID {job['last_id']} "
+                                f"({job['processed_records']}/{job['total_records']})")
+
+                job['status'] = 'completed'
+                job['completed_at'] = datetime.now().isoformat()
+                logger.info(f"Backfill {job_id} completed, updated {job['updated_records']} records")
+            except Exception as e:
+                db.session.rollback()
+                job['status'] = 'failed'
+                job['errors'] = (job['errors'] + [{'id': None, 'error': str(e)}])[-20:]
+                logger.error(f"Backfill {job_id} failed: {str(e)}", exc_info=True)
+            finally:
+                self.save_status(job_id)
+
+    def _snapshot(self, analysis: AudioAnalysis) -> Dict[str, Any]:
+        snapshot = analysis.to_dict()
+        snapshot['transcript'] = analysis.transcript
+        snapshot['needs_summary'] = not analysis.summary and bool(analysis.transcript)
+        snapshot['needs_emotions'] = not analysis.emotion_scores
+        return snapshot
+
+    def _get_analyzer(self):
+        """Each pool thread keeps its own analyzer, since chat sessions are not thread-safe."""
+        if not hasattr(self._analyzers, 'analyzer'):
+            from gemini_analyzer import GeminiAnalyzer
+            self._analyzers.analyzer = GeminiAnalyzer()
+        return self._analyzers.analyzer
+
+    def _analyze_each(self, executor, snapshots: List[Dict[str, Any]]):
+        """Analyze each record with its own model calls."""
+        results, errors = {}, {}
+        for snapshot, (result, error) in zip(snapshots, executor.map(self._analyze, snapshots)):
+            if error:
+                errors[snapshot['id']] = error
+            else:
+                results[snapshot['id']] = result
+        return results, errors
+
+    def _analyze_packed(self, executor, snapshots: List[Dict[str, Any]]):
+        """Analyze records with several records packed into each model request."""
+        futures = []
+        emotion_records = [snapshot for snapshot in snapshots if snapshot['needs_emotions']]
+        for start in range(0, len(emotion_records), self.pack_size):
+            pack = emotion_records[start:start + self.pack_size]
+            futures.append(('emotions', executor.submit(self._analyze_pack, 'analyze_emotions_packed', pack)))
+
+        pack, pack_chars = [], 0
+        for snapshot in (snapshot for snapshot in snapshots if snapshot['needs_summary']):
+            transcript_chars = len(snapshot['transcript'] or '')
+            if pack and pack_chars + transcript_chars > PACKED_TRANSCRIPT_CHARS:
+                futures.append(('summary', executor.submit(self._analyze_pack, 'regenerate_summaries_packed', pack)))
+                pack, pack_chars = [], 0
+            pack.append(snapshot)
+            pack_chars += transcript_chars
+        if pack:
+            futures.append(('summary', executor.submit(self._analyze_pack, 'regenerate_summaries_packed', pack)))
+
+        results, errors = {}, {}
+        for field, future in futures:
+            pack_results, pack_errors = future.result()
+            for analysis_id, result in pack_results.items():
+                results.setdefault(analysis_id, {})[field] = (
+                    result.get('summary', '') if field == 'summary' else result
+                )
+            errors.update(pack_errors)
+        return results, errors
+
+    def _analyze_pack(self, method: str, pack: List[Dict[str, Any]]):
+        """Run one packed request, returning (results, errors) keyed by analysis ID."""
+        try:
+            return getattr(self._get_analyzer(), method)(pack)
+        except Exception as e:
+            logger.error(f"Error in packed backfill request: {str(e)}")
+            return {}, {snapshot['id']: str(e) for snapshot in pack}
+
+    def _analyze(self, snapshot: Dict[str, Any]):
+        """Run the model calls for one record, returning (result, error)."""
+        analyzer = None
+        try:
+            analyzer = self._get_analyzer()
+            result = {}
+            if snapshot['needs_summary']:
+                result['summary'] = analyzer.regenerate_summary(snapshot).get('summary', '')
+            if snapshot['needs_emotions']:
+                result['emotions'] = analyzer.analyze_emotions(snapshot)
+            return result, None
+        except Exception as e:
+            logger.error(f"Error backfilling analysis {snapshot['id']}: {str(e)}")
+            return None, str(e)
+        finally:
+            # Start each record with a fresh chat so history does not grow across the job
+            if analyzer:
+                analyzer.cleanup()
+
+    def _apply(self, analysis: AudioAnalysis, result: Dict[str, Any]):
+        if 'summary' in result:
+            analysis.summary = result['summary']
+        if 'emotions' in result:
+            emotions = result['emotions']
+            analysis.emotion_scores = emotions['emotion_scores']
+            analysis.dominant_emotion = emotions['dominant_emotion']
+            analysis.tone_analysis = emotions['tone_analysis']
+            analysis.confidence_score = emotions['confidence_score']
+
+    def _find_resumable_job(self) -> Optional[str]:
+        """Find the most recent checkpoint that did not run to completion."""
+        checkpoints = sorted(glob.glob('data/backfill_*_status.json'))
+        if not checkpoints:
+            return None
+        job_id = os.path.basename(checkpoints[-1])[len('backfill_'):-len('_status.json')]
+        if self.load_status(job_id) and self.jobs[job_id]['status'] != 'completed':
+            return job_id
+        return None
+
+    def save_status(self, job_id: str):
+        """Save the job checkpoint to file for resuming."""
+        try:
+            os.makedirs('data', exist_ok=True)
+            with open(f'data/backfill_{job_id}_status.json', 'w') as f:
+                f.write(json.dumps(self.jobs[job_id]))
+        except Exception as e:
+            logger.error(f"Failed to save backfill status: {str(e)}")
+
+    def load_status(self, job_id: str) -> bool:
+        """Load a job checkpoint from file."""
+        try:
+            with open(f'data/backfill_{job_id}_status.json', 'r') as f:
+                self.jobs[job_id] = json.loads(f.read())
+            return True
+        except FileNotFoundError:
+            return False
+        except Exception as e:
+            logger.error(f"Failed to load backfill status: {str(e)}")
+            return False
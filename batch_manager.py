@@ -1,10 +1,14 @@
 import logging
 import json
 import os
-from datetime import datetime
-from typing import Dict, List, Optional
+import threading
+import uuid
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional
 from models import AudioAnalysis
 from database import db
+from cancellation import CancellationToken
+from retry_policy import PERMANENT, classify_error, get_retry_policy, retry_after_hint
 
 logger = logging.getLogger(__name__)
 
@@ -12,150 +16,293 @@ class BatchUploadManager:
     def __init__(self):
         self.batch_status: Dict[str, dict] = {}
         self.current_batch_id: Optional[str] = None
+        self.tokens: Dict[str, CancellationToken] = {}
+        # Scheduler workers update files of the same batch concurrently
+        self._lock = threading.RLock()
 
-    def create_batch(self, file_list: List[str]) -> str:
-        """Create a new batch with the given list of files."""
-        batch_id = datetime.now().strftime('%Y%m%d_%H%M%S')
-        self.current_batch_id = batch_id
-
-        # Initialize batch status with more detailed tracking
-        self.batch_status[batch_id] = {
-            'files': {
-                filename: {
-                    'status': 'pending',
-                    'attempts': 0,
-                    'error': None,
-                    'analysis_id': None,
-                    'processed_at': None,
-                    'upload_progress': 0,  # Track individual file upload progress
-                    'processing_progress': 0,  # Track processing progress
-                    'current_operation': 'waiting'  # Current operation being performed
-                } for filename in file_list
-            },
-            'total_files': len(file_list),
-            'processed_files': 0,
-            'failed_files': 0,
-            'started_at': datetime.now().isoformat(),
-            'completed_at': None,
-            'overall_progress': 0,  # Track overall batch progress
-            'is_cancelled': False  # Track if batch has been cancelled
+    @staticmethod
+    def _new_file_status(blob: Optional[str]) -> dict:
+        return {
+            'status': 'pending',
+            'attempts': 0,
+            'error': None,
+            'analysis_id': None,
+            'processed_at': None,
+            'upload_progress': 0,  # Track individual file upload progress
+            'processing_progress': 0,  # Track processing progress
+            'current_operation': 'waiting',  # Current operation being performed
+            'next_attempt_at': None,  # When a failed file may be retried
+            'blob': blob,  # Content digest in the blob store
+            'blob_held': blob is not None  # Whether the batch still holds the blob's reference
         }
-        logger.info(f"Created new batch {batch_id} with {len(file_list)} files")
-        self.save_batch_status(batch_id)
+
+    @staticmethod
+    def new_batch_id() -> str:
+        # The suffix keeps batches created in the same second apart
+        return f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:6]}"
+
+    def create_batch(self, file_list: List[str], blobs: Optional[Dict[str, str]] = None,
+                     weight: float = 1.0, receiving: bool = False, batch_id: Optional[str] = None) -> str:
+        """Create a new batch with the given list of files.
+
+        blobs maps filenames to the blob-store digests the batch holds a
+        reference on; files without one are read from the upload folder.
+        weight is the batch's share of the scheduler relative to others.
+        A receiving batch gets its files through add_file() as they arrive
+        and is not complete until finish_receiving() is called. batch_id
+        may be reserved beforehand with new_batch_id().
+        """
+        blobs = blobs or {}
+        batch_id = batch_id or self.new_batch_id()
+        with self._lock:
+            self.current_batch_id = batch_id
+
+            # Initialize batch status with more detailed tracking
+            self.batch_status[batch_id] = {
+                'files': {filename: self._new_file_status(blobs.get(filename)) for filename in file_list},
+                'total_files': len(file_list),
+                'processed_files': 0,
+                'failed_files': 0,
+                'started_at': datetime.now().isoformat(),
+                'completed_at': None,
+                'overall_progress': 0,  # Track overall batch progress
+                'weight': weight,  # Fair-share weight against concurrent batches
+                'is_cancelled': False,  # Track if batch has been cancelled
+                'receiving': receiving  # Files are still arriving, e.g. from an archive
+            }
+            logger.info(f"Created new batch {batch_id} with {len(file_list)} files")
+            self.save_batch_status(batch_id)
         return batch_id
 
+    def add_file(self, batch_id: str, filename: str, blob: Optional[str] = None, error: Optional[str] = None):
+        """Add a file to a receiving batch, or record one that failed to arrive when error is given."""
+        with self._lock:
+            batch = self.batch_status[batch_id]
+            batch['files'][filename] = self._new_file_status(blob)
+            batch['files'][filename]['upload_progress'] = 100
+            if error:
+                batch['files'][filename].update(status='failed', error=error, current_operation='failed',
+                                                processing_progress=100)
+                batch['failed_files'] += 1
+            batch['total_files'] = len(batch['files'])
+            self.save_batch_status(batch_id)
+
+    def finish_receiving(self, batch_id: str):
+        """Mark that no more files will be added to the batch."""
+        with self._lock:
+            batch = self.batch_status[batch_id]
+            batch['receiving'] = False
+            if self._is_batch_complete(batch_id):
+                batch['completed_at'] = datetime.now().isoformat()
+            self.save_batch_status(batch_id)
+
     def update_file_progress(self, batch_id: str, filename: str, 
                            upload_progress: Optional[float] = None,
                            processing_progress: Optional[float] = None,
                            operation: Optional[str] = None):
         """Update progress for a specific file."""
-        if batch_id in self.batch_status:
-            file_status = self.batch_status[batch_id]['files'].get(filename)
-            if file_status:
-                if upload_progress is not None:
-                    file_status['upload_progress'] = min(100, max(0, upload_progress))
-                if processing_progress is not None:
-                    file_status['processing_progress'] = min(100, max(0, processing_progress))
-                if operation:
-                    file_status['current_operation'] = operation
-
-                # Calculate overall progress
-                self._update_overall_progress(batch_id)
-                # Save status after each update
-                self.save_batch_status(batch_id)
+        with self._lock:
+            if batch_id in self.batch_status:
+                file_status = self.batch_status[batch_id]['files'].get(filename)
+                if file_status:
+                    if upload_progress is not None:
+                        file_status['upload_progress'] = min(100, max(0, upload_progress))
+                    if processing_progress is not None:
+                        file_status['processing_progress'] = min(100, max(0, processing_progress))
+                    if operation:
+                        file_status['current_operation'] = operation
+
+                    # Calculate overall progress
+                    self._update_overall_progress(batch_id)
+                    # Save status after each update
+                    self.save_batch_status(batch_id)
 
     def _update_overall_progress(self, batch_id: str):
         """Update the overall progress of the batch."""
-        if batch_id in self.batch_status:
-            batch = self.batch_status[batch_id]
-            total_files = batch['total_files']
-            if total_files > 0:
-                total_progress = 0
-                for file_status in batch['files'].values():
-                    # Weight upload and processing equally
-                    file_progress = (file_status['upload_progress'] + 
-                                   file_status['processing_progress']) / 2
-                    total_progress += file_progress
+        with self._lock:
+            if batch_id in self.batch_status:
+                batch = self.batch_status[batch_id]
+                total_files = batch['total_files']
+                if total_files > 0:
+                    total_progress = 0
+                    for file_status in batch['files'].values():
+                        # Weight upload and processing equally
+                        file_progress = (file_status['upload_progress'] + 
+                                       file_status['processing_progress']) / 2
+                        total_progress += file_progress
 
-                batch['overall_progress'] = round(total_progress / total_files, 2)
+                    batch['overall_progress'] = round(total_progress / total_files, 2)
 
     def mark_file_started(self, batch_id: str, filename: str):
         """Mark a file as being processed."""
-        if batch_id in self.batch_status and not self.batch_status[batch_id].get('is_cancelled'):
-            file_status = self.batch_status[batch_id]['files'].get(filename)
-            if file_status:
-                file_status['status'] = 'processing'
-                file_status['attempts'] += 1
-                file_status['current_operation'] = 'analyzing content'
-                file_status['upload_progress'] = 100  # File is uploaded
-                file_status['processing_progress'] = 0  # Start processing
-                logger.info(f"Started processing {filename} (Attempt {file_status['attempts']})")
-                self.save_batch_status(batch_id)
+        with self._lock:
+            if batch_id in self.batch_status and not self.batch_status[batch_id].get('is_cancelled'):
+                file_status = self.batch_status[batch_id]['files'].get(filename)
+                if file_status:
+                    file_status['status'] = 'processing'
+                    file_status['attempts'] += 1
+                    file_status['current_operation'] = 'analyzing content'
+                    file_status['upload_progress'] = 100  # File is uploaded
+                    file_status['processing_progress'] = 0  # Start processing
+                    logger.info(f"Started processing {filename} (Attempt {file_status['attempts']})")
+                    self.save_batch_status(batch_id)
 
     def mark_file_complete(self, batch_id: str, filename: str, analysis_id: int):
         """Mark a file as successfully processed."""
-        if batch_id in self.batch_status:
-            file_status = self.batch_status[batch_id]['files'].get(filename)
-            if file_status:
-                file_status['status'] = 'completed'
-                file_status['analysis_id'] = analysis_id
-                file_status['processed_at'] = datetime.now().isoformat()
-                file_status['upload_progress'] = 100
-                file_status['processing_progress'] = 100
-                file_status['current_operation'] = 'completed'
-                self.batch_status[batch_id]['processed_files'] += 1
-                logger.info(f"Completed processing {filename}")
-
-                # Update overall progress and check if batch is complete
-                self._update_overall_progress(batch_id)
-                if self._is_batch_complete(batch_id):
-                    self.batch_status[batch_id]['completed_at'] = datetime.now().isoformat()
-                    logger.info(f"Batch {batch_id} completed")
+        with self._lock:
+            if batch_id in self.batch_status:
+                file_status = self.batch_status[batch_id]['files'].get(filename)
+                if file_status:
+                    file_status['status'] = 'completed'
+                    file_status['analysis_id'] = analysis_id
+                    file_status['processed_at'] = datetime.now().isoformat()
+                    file_status['upload_progress'] = 100
+                    file_status['processing_progress'] = 100
+                    file_status['current_operation'] = 'completed'
+                    self.batch_status[batch_id]['processed_files'] += 1
+                    logger.info(f"Completed processing {filename}")
 
-                self.save_batch_status(batch_id)
+                    # Update overall progress and check if batch is complete
+                    self._update_overall_progress(batch_id)
+                    if self._is_batch_complete(batch_id):
+                        self.batch_status[batch_id]['completed_at'] = datetime.now().isoformat()
+                        logger.info(f"Batch {batch_id} completed")
 
-    def mark_file_failed(self, batch_id: str, filename: str, error: str):
-        """Mark a file as failed with error message."""
-        if batch_id in self.batch_status:
-            file_status = self.batch_status[batch_id]['files'].get(filename)
-            if file_status:
-                # Only mark as failed if we've exhausted retry attempts
-                if file_status['attempts'] >= 3:
-                    file_status['status'] = 'failed'
-                    file_status['error'] = error
-                    file_status['current_operation'] = 'failed'
-                    file_status['upload_progress'] = 100  # File was uploaded
-                    file_status['processing_progress'] = 100  # Processing ended (in failure)
-                    self.batch_status[batch_id]['failed_files'] += 1
-                    logger.error(f"Failed to process {filename} after {file_status['attempts']} attempts: {error}")
-                else:
-                    file_status['status'] = 'pending'
-                    file_status['error'] = error
-                    logger.warning(f"Processing attempt {file_status['attempts']} failed for {filename}: {error}")
-                self.save_batch_status(batch_id)
+                    self.save_batch_status(batch_id)
 
-    def cancel_batch(self, batch_id: str):
-        """Cancel a batch upload."""
-        if batch_id in self.batch_status:
-            self.batch_status[batch_id]['is_cancelled'] = True
-            # Mark all pending files as cancelled
-            for filename, file_status in self.batch_status[batch_id]['files'].items():
-                if file_status['status'] == 'pending':
+    def mark_file_failed(self, batch_id: str, filename: str, error: str, exc: Optional[Exception] = None):
+        """Mark a file as failed, or re-queue it with backoff if the error is retryable."""
+        with self._lock:
+            if batch_id in self.batch_status:
+                file_status = self.batch_status[batch_id]['files'].get(filename)
+                if file_status:
+                    policy = get_retry_policy('batch')
+                    error_class = classify_error(exc if exc is not None else Exception(error))
+                    file_status['error_class'] = error_class
+                    # Permanent errors would fail the same way again, so they are not retried
+                    if error_class == PERMANENT or file_status['attempts'] >= policy.max_attempts:
+                        file_status['status'] = 'failed'
+                        file_status['error'] = error
+                        file_status['current_operation'] = 'failed'
+                        file_status['next_attempt_at'] = None
+                        file_status['upload_progress'] = 100  # File was uploaded
+                        file_status['processing_progress'] = 100  # Processing ended (in failure)
+                        self.batch_status[batch_id]['failed_files'] += 1
+                        logger.error(f"Failed to process {filename} after {file_status['attempts']} attempts: {error}")
+                        if self._is_batch_complete(batch_id):
+                            self.batch_status[batch_id]['completed_at'] = datetime.now().isoformat()
+                    else:
+                        delay = policy.backoff(max(1, file_status['attempts']), retry_after_hint(exc) if exc else None)
+                        file_status['status'] = 'pending'
+                        file_status['error'] = error
+                        file_status['current_operation'] = 'waiting to retry'
+                        file_status['next_attempt_at'] = (datetime.now() + timedelta(seconds=delay)).isoformat()
+                        logger.warning(f"Processing attempt {file_status['attempts']} failed for {filename} "
+                                       f"({error_class}), retrying in {delay:.0f}s: {error}")
+                    self.save_batch_status(batch_id)
+
+    def get_cancellation_token(self, batch_id: str) -> CancellationToken:
+        """The token shared by all work on a batch; cancelled by cancel_batch."""
+        with self._lock:
+            if batch_id not in self.tokens:
+                self.tokens[batch_id] = CancellationToken()
+                if self.batch_status.get(batch_id, {}).get('is_cancelled'):
+                    self.tokens[batch_id].cancel(f"Batch {batch_id} cancelled")
+            return self.tokens[batch_id]
+
+    def mark_file_cancelled(self, batch_id: str, filename: str):
+        """Mark a file whose in-flight processing was stopped by cancellation."""
+        with self._lock:
+            if batch_id in self.batch_status:
+                file_status = self.batch_status[batch_id]['files'].get(filename)
+                if file_status and file_status['status'] not in ('completed', 'failed'):
                     file_status['status'] = 'cancelled'
                     file_status['current_operation'] = 'cancelled'
-            self.save_batch_status(batch_id)
-            logger.info(f"Cancelled batch {batch_id}")
+                    file_status['next_attempt_at'] = None
+                    logger.info(f"Stopped processing {filename} after cancellation")
+                    if self._is_batch_complete(batch_id):
+                        self.batch_status[batch_id]['completed_at'] = datetime.now().isoformat()
+                    self.save_batch_status(batch_id)
+
+    def cancel_batch(self, batch_id: str):
+        """Cancel a batch upload, stopping files that are already being processed."""
+        with self._lock:
+            if batch_id in self.batch_status:
+                self.get_cancellation_token(batch_id).cancel(f"Batch {batch_id} cancelled")
+                self.batch_status[batch_id]['is_cancelled'] = True
+                # Mark all pending files as cancelled
+                for filename, file_status in self.batch_status[batch_id]['files'].items():
+                    if file_status['status'] == 'pending':
+                        file_status['status'] = 'cancelled'
+                        file_status['current_operation'] = 'cancelled'
+                self.save_batch_status(batch_id)
+                logger.info(f"Cancelled batch {batch_id}")
+
+    def reset_failed_files(self, batch_id: str,
+                           reacquire: Optional[Callable[[str, dict], None]] = None) -> List[str]:
+        """Put a batch's failed files back to pending for a retry and return their names.
+
+        reacquire(filename, file_status) is called for each reset file, under the batch
+        lock, so the caller can take back the file's blob or upload.
+        """
+        with self._lock:
+            batch = self.batch_status.get(batch_id)
+            if not batch or batch.get('is_cancelled'):
+                return []
+            retried = []
+            for filename, file_status in batch['files'].items():
+                if file_status['status'] != 'failed':
+                    continue
+                retried.append(filename)
+                file_status['status'] = 'pending'
+                file_status['error'] = None
+                file_status['current_operation'] = 'waiting to retry'
+                file_status['attempts'] = 0
+                file_status['next_attempt_at'] = None
+                if reacquire:
+                    reacquire(filename, file_status)
+            if retried:
+                batch['failed_files'] -= len(retried)
+                batch['completed_at'] = None
+                self.save_batch_status(batch_id)
+            return retried
 
     def get_pending_files(self, batch_id: str) -> List[str]:
-        """Get list of files that still need processing."""
-        if batch_id not in self.batch_status or self.batch_status[batch_id].get('is_cancelled'):
-            return []
+        """Get list of files that still need processing and whose retry backoff has passed."""
+        with self._lock:
+            if batch_id not in self.batch_status or self.batch_status[batch_id].get('is_cancelled'):
+                return []
+
+            now = datetime.now().isoformat()
+            max_attempts = get_retry_policy('batch').max_attempts
+            return [
+                filename for filename, status in
+                self.batch_status[batch_id]['files'].items()
+                if (status['status'] == 'pending' or 'timeout' in str(status.get('error', '')).lower())
+                and status['attempts'] < max_attempts
+                and (status.get('next_attempt_at') or now) <= now
+            ]
 
-        return [
-            filename for filename, status in 
-            self.batch_status[batch_id]['files'].items()
-            if (status['status'] == 'pending' or 'timeout' in str(status.get('error', '')).lower()) and status['attempts'] < 3
-        ]
+    def has_outstanding_files(self, batch_id: str) -> bool:
+        """Whether any file is still waiting for or undergoing processing, or yet to arrive."""
+        with self._lock:
+            if self.batch_status.get(batch_id, {}).get('receiving'):
+                return True
+            return any(status['status'] in ('pending', 'processing')
+                       for status in self.batch_status.get(batch_id, {}).get('files', {}).values())
+
+    def take_held_blobs(self, batch_id: str) -> List[str]:
+        """Digests the batch still holds references on, handed to the caller to release."""
+        digests = []
+        with self._lock:
+            if batch_id not in self.batch_status:
+                return digests
+            for file_status in self.batch_status[batch_id]['files'].values():
+                if file_status.get('blob_held'):
+                    file_status['blob_held'] = False
+                    digests.append(file_status['blob'])
+            self.save_batch_status(batch_id)
+        return digests
 
     def get_batch_status(self, batch_id: str) -> dict:
         """Get the current status of a batch."""
@@ -167,6 +314,8 @@ class BatchUploadManager:
             return False
 
         batch = self.batch_status[batch_id]
+        if batch.get('receiving'):
+            return False
         completed_count = batch['processed_files'] + batch['failed_files']
         cancelled_count = sum(1 for file_status in batch['files'].values() 
                             if file_status['status'] == 'cancelled')
@@ -178,18 +327,29 @@ class BatchUploadManager:
             # Ensure data directory exists
             os.makedirs('data', exist_ok=True)
 
-            status_json = json.dumps(self.batch_status[batch_id])
-            with open(f'data/batch_{batch_id}_status.json', 'w') as f:
-                f.write(status_json)
+            with self._lock:
+                status_json = json.dumps(self.batch_status[batch_id])
+                # Written whole and swapped in, so concurrent saves never leave a torn file
+                path = f'data/batch_{batch_id}_status.json'
+                with open(f'{path}.tmp', 'w') as f:
+                    f.write(status_json)
+                os.replace(f'{path}.tmp', path)
             logger.info(f"Saved status for batch {batch_id}")
         except Exception as e:
             logger.error(f"Failed to save batch status: {str(e)}")
 
     def load_batch_status(self, batch_id: str) -> bool:
-        """Load batch status from file for resuming."""
+        """Load batch status from file for resuming.
+
+        A batch already in memory is kept as is: every change to it is saved, so the
+        file can only be behind, and workers hold references into the live dict.
+        """
         try:
-            with open(f'data/batch_{batch_id}_status.json', 'r') as f:
-                self.batch_status[batch_id] = json.loads(f.read())
+            with self._lock:
+                if batch_id in self.batch_status:
+                    return True
+                with open(f'data/batch_{batch_id}_status.json', 'r') as f:
+                    self.batch_status[batch_id] = json.loads(f.read())
             logger.info(f"Loaded status for batch {batch_id}")
             return True
         except FileNotFoundError:
@@ -0,0 +1,281 @@
+import hashlib
+import logging
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, BinaryIO, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_STORE_PATH = os.path.join('data', 'blobs')
+DEFAULT_GC_GRACE = 1800  # Seconds an unreferenced blob survives, so a retried job can still use it
+COPY_CHUNK_SIZE = 1024 * 1024
+
+
+def _hash_file(file_path: str) -> str:
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(COPY_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class BlobStore:
+    """Content-addressed file store with reference counts and derived artifacts.
+
+    Blobs live at objects/<2 hex>/<2 hex>/<sha256><ext>, so identical
+    content is stored once however many uploads or batches it arrives in.
+    Jobs and analysis records hold references; a blob whose count has been
+    zero for longer than the grace period is removed by gc(). Derived
+    artifacts (e.g. a transcode) are blobs too, indexed by the input's hash,
+    the transform name and the transform version, and are collected with
+    their input.
+    """
+
+    def __init__(self, root: str = DEFAULT_STORE_PATH):
+        self.root = os.path.abspath(root)
+        self.objects_dir = os.path.join(self.root, 'objects')
+        self.tmp_dir = os.path.join(self.root, 'tmp')
+        os.makedirs(self.objects_dir, exist_ok=True)
+        os.makedirs(self.tmp_dir, exist_ok=True)
+        self._lock = threading.Lock()
+
+        self._conn = sqlite3.connect(os.path.join(self.root, 'index.sqlite3'),
+                                     check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS blobs ("
+            "digest TEXT PRIMARY KEY, ext TEXT NOT NULL, size INTEGER NOT NULL, refcount INTEGER NOT NULL, "
+            "created_at REAL NOT NULL, unreferenced_since REAL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS derived ("
+            "input_digest TEXT NOT NULL, transform TEXT NOT NULL, version INTEGER NOT NULL, "
+            "output_digest TEXT NOT NULL, created_at REAL NOT NULL, "
+            "PRIMARY KEY (input_digest, transform, version))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ix_blobs_unreferenced ON blobs (unreferenced_since)")
+
+    def _object_path(self, digest: str, ext: str) -> str:
+        return os.path.join(self.objects_dir, digest[:2], digest[2:4], digest + ext)
+
+    def path(self, digest: str) -> Optional[str]:
+        """Filesystem path of a stored blob, or None if it is not in the store."""
+        with self._lock:
+            row = self._conn.execute("SELECT ext FROM blobs WHERE digest = ?", (digest,)).fetchone()
+        if row is None:
+            return None
+        return self._object_path(digest, row[0])
+
+    def digest_for_path(self, file_path: str) -> Optional[str]:
+        """The digest encoded in a blob path, so callers can skip re-hashing store files."""
+        file_path = os.path.abspath(file_path)
+        if not file_path.startswith(self.objects_dir + os.sep):
+            return None
+        digest = os.path.splitext(os.path.basename(file_path))[0]
+        return digest if len(digest) == 64 else None
+
+    def new_temp_path(self, ext: str = '') -> str:
+        """A scratch path on the store's filesystem, for building artifacts to add with put_file()."""
+        return os.path.join(self.tmp_dir, uuid.uuid4().hex + ext)
+
+    def put_stream(self, stream: BinaryIO, filename: str = '', refs: int = 1) -> str:
+        """Store a stream's contents, hashing while writing; returns the digest with refs held."""
+        temp_path = self.new_temp_path()
+        digest = hashlib.sha256()
+        try:
+            with open(temp_path, 'wb') as out:
+                for chunk in iter(lambda: stream.read(COPY_CHUNK_SIZE), b''):
+                    digest.update(chunk)
+                    out.write(chunk)
+            return self._commit(temp_path, digest.hexdigest(), filename, refs)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def put_file(self, file_path: str, refs: int = 1, move: bool = False, digest: Optional[str] = None) -> str:
+        """Store a file (moved in when move=True, else hard-linked or copied); returns its digest.
+
+        Pass digest when the file has just been hashed, to skip reading it twice.
+        """
+        digest = digest or _hash_file(file_path)
+        temp_path = self.new_temp_path()
+        try:
+            if move:
+                shutil.move(file_path, temp_path)
+            else:
+                try:
+                    os.link(file_path, temp_path)
+                except OSError:
+                    shutil.copyfile(file_path, temp_path)
+            return self._commit(temp_path, digest, file_path, refs)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def _commit(self, temp_path: str, digest: str, filename: str, refs: int) -> str:
+        ext = os.path.splitext(filename)[1].lower()
+        size = os.path.getsize(temp_path)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT ext FROM blobs WHERE digest = ?", (digest,)).fetchone()
+            if row is not None and os.path.exists(self._object_path(digest, row[0])):
+                # Already stored: just take the references
+                self._conn.execute(
+                    "UPDATE blobs SET refcount = refcount + ?, "
+                    "unreferenced_since = CASE WHEN refcount + ? > 0 THEN NULL ELSE unreferenced_since END "
+                    "WHERE digest = ?", (refs, refs, digest)
+                )
+                return digest
+
+            final_path = self._object_path(digest, ext)
+            os.makedirs(os.path.dirname(final_path), exist_ok=True)
+            os.replace(temp_path, final_path)
+            # A row whose file went missing keeps the references already held on it
+            self._conn.execute(
+                "INSERT INTO blobs (digest, ext, size, refcount, created_at, unreferenced_since) "
+                "VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (digest) DO UPDATE SET "
+                "ext = excluded.ext, size = excluded.size, refcount = refcount + excluded.refcount, "
+                "unreferenced_since = CASE WHEN refcount + excluded.refcount > 0 THEN NULL "
+                "ELSE COALESCE(unreferenced_since, excluded.unreferenced_since) END",
+                (digest, ext, size, refs, now, None if refs > 0 else now)
+            )
+        logger.info(f"Stored blob {digest[:12]} ({size} bytes)")
+        return digest
+
+    def incref(self, digest: str, count: int = 1) -> bool:
+        """Take references on a blob; False if it is no longer stored."""
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE blobs SET refcount = refcount + ?, unreferenced_since = NULL WHERE digest = ?",
+                (count, digest)
+            )
+            return cursor.rowcount > 0
+
+    def decref(self, digest: str, count: int = 1):
+        """Drop references; the blob becomes collectable when its count reaches zero."""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE blobs SET refcount = MAX(0, refcount - ?), "
+                "unreferenced_since = CASE WHEN refcount - ? > 0 THEN NULL "
+                "ELSE COALESCE(unreferenced_since, ?) END WHERE digest = ?",
+                (count, count, time.time(), digest)
+            )
+
+    def derived_path(self, input_digest: str, transform: str, version: int) -> Optional[str]:
+        """Path of a previously computed artifact, or None."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT b.digest, b.ext FROM derived d JOIN blobs b ON b.digest = d.output_digest "
+                "WHERE d.input_digest = ? AND d.transform = ? AND d.version = ?",
+                (input_digest, transform, version)
+            ).fetchone()
+        if row is None:
+            return None
+        path = self._object_path(row[0], row[1])
+        return path if os.path.exists(path) else None
+
+    def put_derived(self, input_digest: str, transform: str, version: int, file_path: str) -> str:
+        """Move a freshly built artifact into the store and index it; returns its blob path."""
+        output_digest = self.put_file(file_path, refs=0, move=True)
+        with self._lock:
+            previous = self._conn.execute(
+                "SELECT output_digest FROM derived WHERE input_digest = ? AND transform = ? AND version = ?",
+                (input_digest, transform, version)
+            ).fetchone()
+            if previous is None or previous[0] != output_digest:
+                # The derived row holds the artifact's reference
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO derived (input_digest, transform, version, output_digest, created_at) "
+                    "VALUES (?, ?, ?, ?, ?)", (input_digest, transform, version, output_digest, time.time())
+                )
+        if previous is None or previous[0] != output_digest:
+            self.incref(output_digest)
+            if previous is not None:
+                self.decref(previous[0])
+        return self.path(output_digest)
+
+    def gc(self, grace: float = DEFAULT_GC_GRACE) -> Dict[str, Any]:
+        """Remove blobs unreferenced for longer than grace, together with artifacts derived from them."""
+        removed, freed = 0, 0
+        while True:
+            cutoff = time.time() - grace
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT digest, ext, size FROM blobs WHERE refcount <= 0 AND unreferenced_since <= ?",
+                    (cutoff,)
+                ).fetchall()
+                if not rows:
+                    break
+                outputs: List[str] = []
+                for digest, ext, size in rows:
+                    outputs += [r[0] for r in self._conn.execute(
+                        "SELECT output_digest FROM derived WHERE input_digest = ?", (digest,)
+                    )]
+                    self._conn.execute("DELETE FROM derived WHERE input_digest = ?", (digest,))
+                    self._conn.execute("DELETE FROM blobs WHERE digest = ?", (digest,))
+                    # Removed under the lock so a concurrent put of the same content re-creates it safely
+                    try:
+                        os.remove(self._object_path(digest, ext))
+                    except FileNotFoundError:
+                        pass
+                    removed += 1
+                    freed += size
+            # Artifacts of collected inputs are collectable straight away
+            for output in outputs:
+                self.decref(output)
+                with self._lock:
+                    self._conn.execute(
+                        "UPDATE blobs SET unreferenced_since = ? WHERE digest = ? AND refcount <= 0",
+                        (cutoff, output)
+                    )
+        self._clean_tmp(grace)
+        if removed:
+            logger.info(f"Blob store collected {removed} blobs, freeing {freed} bytes")
+        return {'removed_blobs': removed, 'freed_bytes': freed}
+
+    def _clean_tmp(self, grace: float):
+        # Scratch files left behind by a crash mid-write
+        cutoff = time.time() - grace
+        for entry in os.scandir(self.tmp_dir):
+            try:
+                if entry.stat().st_mtime < cutoff:
+                    os.remove(entry.path)
+            except OSError:
+                pass
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            blobs, total, unreferenced = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(CASE WHEN refcount <= 0 THEN 1 ELSE 0 END), 0) "
+                "FROM blobs"
+            ).fetchone()
+            derived = self._conn.execute("SELECT COUNT(*) FROM derived").fetchone()[0]
+        return {
+            'root': self.root,
+            'blobs': blobs,
+            'bytes': total,
+            'unreferenced_blobs': unreferenced,
+            'derived_artifacts': derived
+        }
+
+
+_store: Optional[BlobStore] = None
+_store_lock = threading.Lock()
+
+
+def get_blob_store() -> BlobStore:
+    """Return the process-wide blob store rooted at BLOB_STORE_PATH."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = BlobStore(os.environ.get('BLOB_STORE_PATH', DEFAULT_STORE_PATH))
+        return _store
+
+
+def file_digest(file_path: str) -> str:
+    """SHA-256 of a file, read from the path for blobs instead of re-hashing them."""
+    return get_blob_store().digest_for_path(file_path) or _hash_file(file_path)
@@ -0,0 +1,94 @@
+import asyncio
+import logging
+import os
+import threading
+from typing import Awaitable, Callable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Default deadlines in seconds; each can be overridden with ANALYSIS_<STAGE>_TIMEOUT
+STAGE_TIMEOUTS = {
+    'upload': 600.0,  # Sending a file to the provider and waiting for it to be processed
+    'transcode': 300.0,  # Local FFmpeg conversion
+    'generation': 300.0,  # A single model request
+    'persistence': 30.0,  # Writing the result to the database
+}
+
+
+class AnalysisCancelled(Exception):
+    """Raised when in-flight work is stopped through its cancellation token."""
+
+
+class StageTimeout(TimeoutError):
+    """Raised when a stage runs past its deadline."""
+
+    def __init__(self, stage: str, timeout: float):
+        super().__init__(f"{stage} stage timed out after {timeout:.0f}s")
+        self.stage = stage
+
+
+def stage_timeout(stage: str) -> float:
+    value = os.environ.get(f'ANALYSIS_{stage.upper()}_TIMEOUT')
+    return float(value) if value else STAGE_TIMEOUTS[stage]
+
+
+async def with_deadline(stage: str, awaitable: Awaitable):
+    """Await a stage, raising StageTimeout once its deadline has passed."""
+    timeout = stage_timeout(stage)
+    try:
+        return await asyncio.wait_for(awaitable, timeout)
+    except asyncio.TimeoutError:
+        raise StageTimeout(stage, timeout) from None
+
+
+class CancellationToken:
+    """Thread-safe flag shared by everything working on behalf of one request or batch.
+
+    Blocking code checks it between steps; async work registers a callback
+    that cancels its task, so awaits in progress are interrupted at once.
+    """
+
+    def __init__(self):
+        self.reason: Optional[str] = None
+        self._event = threading.Event()
+        self._callbacks: List[Callable[[], None]] = []
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self, reason: str = 'Cancelled'):
+        with self._lock:
+            if self._event.is_set():
+                return
+            self.reason = reason
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        logger.info(f"Cancellation requested: {reason}")
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                logger.error(f"Error in cancellation callback: {str(e)}")
+
+    def add_callback(self, callback: Callable[[], None]):
+        """Call callback on cancellation, immediately if already cancelled."""
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def remove_callback(self, callback: Callable[[], None]):
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+    def raise_if_cancelled(self):
+        if self._event.is_set():
+            raise AnalysisCancelled(self.reason)
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Sleep up to timeout, waking early on cancellation; returns whether cancelled."""
+        return self._event.wait(timeout)
@@ -1,5 +1,6 @@
 import logging
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import text
 from sqlalchemy.orm import DeclarativeBase
 
 # Configure logging
@@ -22,9 +23,14 @@ def init_db(app):
         db.init_app(app)
         with app.app_context():
             # Import models here to avoid circular imports
-            from models import AudioAnalysis  # noqa: F401
+            from models import AudioAnalysis, AnalysisTombstone  # noqa: F401
             db.create_all()
             logger.info("Database initialization completed successfully")
     except Exception as e:
         logger.error(f"Database initialization failed: {str(e)}")
-        raise
\ No newline at end of file
+        raise
+def set_statement_timeout(seconds: float):
+    """Bound every statement in the current transaction (PostgreSQL only)."""
+    if db.engine.dialect.name == 'postgresql':
+        # SET LOCAL does not take bind parameters; the value is always an integer
+        db.session.execute(text(f"SET LOCAL statement_timeout = {int(seconds * 1000)}"))
@@ -0,0 +1,152 @@
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+PAGE_SIZE = 1000  # The most files Drive returns per page
+MAX_CACHED_SERVICES = 32  # Per thread
+AUDIO_QUERY = "mimeType contains 'audio/' and trashed = false"
+FILE_FIELDS = 'id, name, mimeType, size, md5Checksum, modifiedTime, parents'
+# Shared drives are only searched when asked for explicitly
+SHARED_DRIVE_PARAMS = {'supportsAllDrives': True, 'includeItemsFromAllDrives': True}
+
+
+def default_service_factory(credentials):
+    """A Drive v3 client; the discovery document ships with the library, so nothing is fetched."""
+    from googleapiclient.discovery import build
+    return build('drive', 'v3', credentials=credentials, cache_discovery=False)
+
+
+def credentials_key(credentials) -> str:
+    """Identify an authorization without keeping its secrets around as a dict key."""
+    identity = f"{getattr(credentials, 'client_id', '')}:{getattr(credentials, 'refresh_token', None) or credentials.token}"
+    return hashlib.sha256(identity.encode()).hexdigest()
+
+
+class DriveServiceCache:
+    """Drive clients built once per authorization instead of on every request.
+
+    The HTTP transport under a client isn't thread-safe, so each thread
+    keeps its own small LRU of clients. factory builds a client from
+    credentials and can be swapped for one backed by a local fake of the
+    Drive API.
+    """
+
+    def __init__(self, factory: Callable[[Any], Any] = default_service_factory,
+                 max_entries: int = MAX_CACHED_SERVICES):
+        self.factory = factory
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self.built = 0
+
+    def get(self, credentials):
+        services = getattr(self._local, 'services', None)
+        if services is None:
+            services = self._local.services = OrderedDict()
+        key = credentials_key(credentials)
+        service = services.get(key)
+        if service is None:
+            service = services[key] = self.factory(credentials)
+            self.built += 1
+            logger.debug(f"Built Drive client for {threading.current_thread().name}")
+            if len(services) > self.max_entries:
+                services.popitem(last=False)
+        else:
+            services.move_to_end(key)
+        return service
+
+    def clear(self):
+        # Every thread rebuilds its clients on next use
+        self._local = threading.local()
+
+
+_cache: Optional[DriveServiceCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_service_cache() -> DriveServiceCache:
+    """Return the process-wide cache of Drive clients."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = DriveServiceCache()
+        return _cache
+
+
+def set_service_factory(factory: Callable[[Any], Any]):
+    """Build Drive clients with factory from now on, e.g. to run against a fake Drive API."""
+    cache = get_service_cache()
+    cache.factory = factory
+    cache.clear()
+
+
+def get_service(credentials):
+    return get_service_cache().get(credentials)
+
+
+def folder_query(folder_id: Optional[str] = None) -> str:
+    """Query for the audio files in a folder, or anywhere the user can see when folder_id is None."""
+    if not folder_id:
+        return AUDIO_QUERY
+    escaped = folder_id.replace('\\', '\\\\').replace("'", "\\'")
+    return f"'{escaped}' in parents and {AUDIO_QUERY}"
+
+
+def list_audio_files(service, folder_id: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Every audio file in scope, following nextPageToken until the listing is exhausted."""
+    files: List[Dict[str, Any]] = []
+    page_token = None
+    while True:
+        response = service.files().list(
+            q=folder_query(folder_id), pageSize=PAGE_SIZE, pageToken=page_token,
+            fields=f'nextPageToken, files({FILE_FIELDS})', **SHARED_DRIVE_PARAMS
+        ).execute()
+        files.extend(response.get('files', []))
+        page_token = response.get('nextPageToken')
+        if not page_token:
+            return files
+
+
+def start_page_token(service) -> str:
+    """Token marking 'now' in the user's change feed."""
+    return service.changes().getStartPageToken(supportsAllDrives=True).execute()['startPageToken']
+
+
+def in_scope(file: Dict[str, Any], folder_id: Optional[str] = None) -> bool:
+    return (not file.get('trashed')
+            and file.get('mimeType', '').startswith('audio/')
+            and (not folder_id or folder_id in file.get('parents', [])))
+
+
+def list_changes(service, page_token: str,
+                 folder_id: Optional[str] = None) -> Tuple[List[Dict[str, Any]], List[str], str]:
+    """Changes since page_token: (added or modified files, IDs no longer in scope, next token).
+
+    Files that were deleted, trashed or moved out of the folder are
+    reported as removed; callers can ignore removed IDs they never saw.
+    """
+    changed: Dict[str, Dict[str, Any]] = {}
+    removed: Dict[str, None] = {}
+    while True:
+        response = service.changes().list(
+            pageToken=page_token, pageSize=PAGE_SIZE, includeRemoved=True,
+            fields=f'nextPageToken, newStartPageToken, changes(fileId, removed, file({FILE_FIELDS}, trashed))',
+            **SHARED_DRIVE_PARAMS
+        ).execute()
+        for change in response.get('changes', []):
+            file_id = change.get('fileId')
+            file = change.get('file')
+            # Later changes to the same file supersede earlier ones
+            changed.pop(file_id, None)
+            removed.pop(file_id, None)
+            if not change.get('removed') and file and in_scope(file, folder_id):
+                file.pop('trashed', None)
+                changed[file_id] = file
+            else:
+                removed[file_id] = None
+        if 'newStartPageToken' in response:
+            return list(changed.values()), list(removed), response['newStartPageToken']
+        page_token = response['nextPageToken']
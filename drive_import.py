@@ -0,0 +1,218 @@
+import hashlib
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Set
+
+from werkzeug.utils import secure_filename
+
+from admission import AdmissionController, AdmissionRejected
+from blob_store import BlobStore
+from models import AudioAnalysis
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WORKERS = 4  # Drive downloads running at once across all imports
+DOWNLOAD_CHUNK_SIZE = 8 * 1024 * 1024  # Bytes fetched per request; only one chunk is held in memory
+MAX_FILE_SIZE = 500 * 1024 * 1024  # Same limit as a browser upload
+DEFAULT_RATE = 2.0  # Downloads started per second, to stay inside the Drive API's per-user quota
+API_RETRIES = 3  # The client retries 429s and 5xx with exponential backoff
+METADATA_FIELDS = 'id, name, mimeType, size, md5Checksum'
+
+
+class RateLimiter:
+    """Token bucket: acquire() blocks until the next start is allowed."""
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if self.rate <= 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            # Waiting inside the lock queues callers in arrival order
+            if self._tokens < 0:
+                time.sleep(-self._tokens / self.rate)
+
+
+class _HashingWriter:
+    """File wrapper that hashes what MediaIoBaseDownload writes, so the blob needn't be read again."""
+
+    def __init__(self, f):
+        self.f = f
+        self.digest = hashlib.sha256()
+
+    def write(self, data: bytes) -> int:
+        self.digest.update(data)
+        return self.f.write(data)
+
+
+def download_to_store(service, file_id: str, blob_store: BlobStore, filename: str) -> str:
+    """Stream a Drive file into the blob store chunk by chunk; returns its digest with one reference held."""
+    from googleapiclient.http import MediaIoBaseDownload
+
+    temp_path = blob_store.new_temp_path(os.path.splitext(filename)[1].lower())
+    try:
+        with open(temp_path, 'wb') as out:
+            writer = _HashingWriter(out)
+            downloader = MediaIoBaseDownload(writer, service.files().get_media(fileId=file_id),
+                                             chunksize=DOWNLOAD_CHUNK_SIZE)
+            done = False
+            while not done:
+                _, done = downloader.next_chunk(num_retries=API_RETRIES)
+        return blob_store.put_file(temp_path, move=True, digest=writer.digest.hexdigest())
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+class DriveImporter:
+    """Imports Google Drive files straight into the batch engine.
+
+    The import request only reserves a receiving batch; a shared pool of
+    download workers then fetches each file's metadata, streams its
+    content into the blob store and queues it for analysis as soon as it
+    has arrived, so the first files are being analysed while the rest are
+    still downloading. Downloads across all imports start no faster than
+    rate per second. The Drive client isn't thread-safe, so every
+    download gets its service through service_factory.
+    """
+
+    def __init__(self, app, batch_manager, blob_store: BlobStore, admission: AdmissionController,
+                 schedule_file: Callable, finish_batch: Callable, allowed_file: Callable[[str], bool],
+                 workers: Optional[int] = None, rate: Optional[float] = None):
+        self.app = app
+        self.batch_manager = batch_manager
+        self.blob_store = blob_store
+        self.admission = admission
+        self.schedule_file = schedule_file
+        self.finish_batch = finish_batch
+        self.allowed_file = allowed_file
+        workers = workers or int(os.environ.get('DRIVE_IMPORT_WORKERS', DEFAULT_WORKERS))
+        self._executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix='drive-import')
+        if rate is None:
+            rate = float(os.environ.get('DRIVE_IMPORT_RATE', DEFAULT_RATE))
+        self._limiter = RateLimiter(rate, burst=workers)
+        self._remaining: Dict[str, int] = {}  # batch_id -> downloads not yet finished
+        self._names: Dict[str, Set[str]] = {}  # batch_id -> file names claimed by its downloads
+        self._lock = threading.Lock()
+
+    def start(self, service_factory: Callable[[], Any], file_ids: List[str], caller: str,
+              weight: float = 1.0) -> str:
+        """Reserve a batch for the files and queue their downloads; returns the batch ID.
+
+        Raises AdmissionRejected if the files can't be accepted now.
+        """
+        file_ids = list(dict.fromkeys(file_ids))
+        os.makedirs('data', exist_ok=True)  # For batch status files
+        batch_id = self.batch_manager.new_batch_id()
+        # Sizes aren't known until each file's metadata is fetched, so bytes are reserved per download
+        self.admission.admit(batch_id, caller, jobs=len(file_ids))
+        self.batch_manager.create_batch([], weight=weight, receiving=True, batch_id=batch_id)
+        status = self.batch_manager.get_batch_status(batch_id)
+        status['source'] = 'google_drive'
+        status['skipped'] = []
+        self.batch_manager.save_batch_status(batch_id)
+
+        with self._lock:
+            self._remaining[batch_id] = len(file_ids)
+            self._names[batch_id] = set()
+        for file_id in file_ids:
+            self._executor.submit(self._import_file, service_factory, batch_id, file_id, caller)
+        logger.info(f"Importing {len(file_ids)} Google Drive files into batch {batch_id}")
+        return batch_id
+
+    def _skip(self, batch_id: str, name: str, reason: str):
+        logger.info(f"Skipping Drive file {name} in batch {batch_id}: {reason}")
+        status = self.batch_manager.get_batch_status(batch_id)
+        status.setdefault('skipped', []).append({'file': name, 'reason': reason})
+        self.batch_manager.save_batch_status(batch_id)
+        self.admission.release(batch_id, jobs=1)
+
+    def _claim_name(self, batch_id: str, name: str) -> bool:
+        """Reserve a file name in the batch before downloading, so two Drive files can't both take it."""
+        with self._lock:
+            names = self._names[batch_id]
+            if name in names:
+                return False
+            names.add(name)
+            return True
+
+    def _import_file(self, service_factory: Callable[[], Any], batch_id: str, file_id: str, caller: str):
+        name = file_id
+        claimed = False
+        digest = None
+        added = False
+        try:
+            if self.batch_manager.get_batch_status(batch_id).get('is_cancelled'):
+                self._skip(batch_id, name, 'batch cancelled')
+                return
+            self._limiter.acquire()
+            service = service_factory()
+            metadata = service.files().get(fileId=file_id, fields=METADATA_FIELDS).execute(num_retries=API_RETRIES)
+            name = secure_filename(metadata.get('name', '')) or file_id
+            size = int(metadata.get('size', 0))
+
+            if not self.allowed_file(name):
+                self._skip(batch_id, name, 'unsupported file type')
+                return
+            if size > MAX_FILE_SIZE:
+                self._skip(batch_id, name, 'file too large')
+                return
+            with self.app.app_context():
+                if AudioAnalysis.query.filter_by(filename=name).first():
+                    self._skip(batch_id, name, 'already analysed')
+                    return
+            if not self._claim_name(batch_id, name):
+                self._skip(batch_id, name, 'duplicate name in import')
+                return
+            claimed = True
+
+            try:
+                self.admission.admit(batch_id, caller, jobs=0, nbytes=size)
+            except AdmissionRejected as e:
+                self._skip(batch_id, name, str(e))
+                return
+
+            digest = download_to_store(service, file_id, self.blob_store, name)
+            logger.info(f"Downloaded Drive file {name} ({size} bytes) as blob {digest[:12]}")
+            self.batch_manager.add_file(batch_id, name, digest)
+            added = True
+            status = self.batch_manager.get_batch_status(batch_id)
+            status['files'][name]['drive_file_id'] = file_id
+            status['files'][name]['md5_checksum'] = metadata.get('md5Checksum')
+            self.schedule_file(self.app, batch_id, name)
+        except Exception as e:
+            logger.error(f"Error importing Drive file {name}: {str(e)}", exc_info=True)
+            if added:
+                # The batch already holds the blob and releases it when done; the file just won't be analysed
+                self.batch_manager.add_file(batch_id, name, digest, error=f"Could not queue for analysis: {str(e)}")
+            elif claimed or self._claim_name(batch_id, name):
+                self.batch_manager.add_file(batch_id, name, error=f"Download failed: {str(e)}")
+            if digest and not added:
+                self.blob_store.decref(digest)
+            self.admission.release(batch_id, jobs=1)
+        finally:
+            self._download_finished(batch_id)
+
+    def _download_finished(self, batch_id: str):
+        with self._lock:
+            self._remaining[batch_id] -= 1
+            if self._remaining[batch_id] > 0:
+                return
+            del self._remaining[batch_id]
+            del self._names[batch_id]
+        # Queued files carry on; the batch completes once they have
+        self.batch_manager.finish_receiving(batch_id)
+        if not self.batch_manager.has_outstanding_files(batch_id):
+            self.finish_batch(batch_id)
@@ -0,0 +1,300 @@
+import fcntl
+import json
+import logging
+import os
+import threading
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from admission import AdmissionRejected
+from drive_client import get_service, list_audio_files, list_changes, start_page_token
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_INTERVAL = 60  # Seconds between polls of each watched folder's change feed
+DEFAULT_MAX_PER_SYNC = 100  # Files queued per poll; the rest wait for the next one
+WATCHES_PATH = os.path.join('data', 'drive_watches.json')
+LOCK_PATH = os.path.join('data', 'drive_watch.lock')
+# Outside the repository, readable by the server's user only
+DEFAULT_CREDENTIALS_PATH = os.path.join(os.path.expanduser('~'), '.config', 'audio-analysis',
+                                        'drive_watch_credentials.json')
+# Kept per watch; the client secret comes from the environment when polling
+STORED_CREDENTIAL_FIELDS = ('refresh_token', 'token_uri', 'client_id', 'scopes')
+
+
+class DriveFolderWatcher:
+    """Polls watched Drive folders and queues new audio files for analysis.
+
+    Each watch keeps its own position in the Drive change feed, so a poll
+    only fetches what changed since the last one. New files are deduped by
+    Drive file ID and by md5 checksum, so a re-uploaded or copied episode
+    isn't analysed twice, and handed to the DriveImporter, whose
+    rate-limited download pool streams them into the batch engine. Files
+    that don't fit in one poll or are refused by admission control stay
+    in the watch's backlog for the next poll.
+
+    Watches are kept in data/drive_watches.json and belong to the Drive
+    account that created them. Every server process may add or remove
+    watches while only one polls, so each access re-reads the file under
+    an flock on data/drive_watches.json.lock rather than trusting memory. The refresh tokens they poll with, since
+    polling outlives the browser session, are kept apart in a file outside
+    the repository (DRIVE_WATCH_CREDENTIALS_PATH) that only the server's
+    user can read.
+    """
+
+    def __init__(self, importer, interval: Optional[float] = None,
+                 max_per_sync: Optional[int] = None, path: str = WATCHES_PATH,
+                 credentials_path: Optional[str] = None, lock_path: str = LOCK_PATH):
+        self.importer = importer
+        self.interval = interval or float(os.environ.get('DRIVE_WATCH_INTERVAL', DEFAULT_INTERVAL))
+        self.max_per_sync = max_per_sync or int(os.environ.get('DRIVE_WATCH_MAX_PER_SYNC', DEFAULT_MAX_PER_SYNC))
+        self.enabled = str(os.environ.get('DRIVE_WATCH_ENABLED', True)).lower() in ('1', 'true', 'yes')
+        self.path = path
+        self.credentials_path = credentials_path or os.environ.get('DRIVE_WATCH_CREDENTIALS_PATH',
+                                                                   DEFAULT_CREDENTIALS_PATH)
+        self.lock_path = lock_path
+        self.watches: Dict[str, Dict[str, Any]] = {}
+        self._credentials: Dict[str, Dict[str, Any]] = {}  # watch_id -> stored credential fields
+        self._lock = threading.RLock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._started = False
+        self._lock_file = None
+        with self._locked(write=False):
+            pass
+
+    @contextmanager
+    def _locked(self, write: bool = True):
+        """Hold the watches file lock with the latest saved watches loaded, saving them on the way out if write."""
+        with self._lock:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(f'{self.path}.lock', 'w') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX if write else fcntl.LOCK_SH)
+                self._load()
+                try:
+                    yield
+                finally:
+                    if write:
+                        self._save()
+
+    def _load(self):
+        self.watches = self._read(self.path, 'Drive watches')
+        self._credentials = self._read(self.credentials_path, 'Drive watch credentials')
+        # Watches saved before credentials moved out of the watches file
+        legacy = {watch_id: watch.pop('credentials') for watch_id, watch in self.watches.items()
+                  if 'credentials' in watch}
+        if legacy:
+            for watch_id, info in legacy.items():
+                self._credentials[watch_id] = {field: info.get(field) for field in STORED_CREDENTIAL_FIELDS}
+            # Called with the file lock held, if only shared at first start-up
+            self._save()
+            logger.info(f"Moved credentials of {len(legacy)} Drive watches to {self.credentials_path}")
+
+    @staticmethod
+    def _read(path: str, what: str) -> Dict[str, Any]:
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logger.error(f"Error loading {what}: {str(e)}")
+            return {}
+
+    @staticmethod
+    def _write(path: str, data: Dict[str, Any], private: bool = False):
+        os.makedirs(os.path.dirname(path), mode=0o700 if private else 0o777, exist_ok=True)
+        fd = os.open(f'{path}.tmp', os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600 if private else 0o644)
+        with os.fdopen(fd, 'w') as f:
+            if private:
+                # Also covers a temp file left behind with looser permissions
+                os.fchmod(f.fileno(), 0o600)
+            json.dump(data, f)
+        os.replace(f'{path}.tmp', path)
+
+    def _save(self):
+        self._write(self.credentials_path, self._credentials, private=True)
+        self._write(self.path, self.watches)
+
+    def start(self):
+        """Start the polling thread, in one process per host and only if DRIVE_WATCH_ENABLED.
+
+        Called from the first request the server handles, so CLI commands
+        such as `flask ingest` or `flask db upgrade` never poll.
+        """
+        if self._started:
+            return
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+            if not self.enabled:
+                logger.info("Drive folder watcher disabled by DRIVE_WATCH_ENABLED")
+                return
+            # Other server workers on this host find the lock held and leave polling to its owner
+            os.makedirs(os.path.dirname(self.lock_path), exist_ok=True)
+            lock_file = open(self.lock_path, 'w')
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                lock_file.close()
+                logger.info("Drive folder watcher is running in another process")
+                return
+            self._lock_file = lock_file
+            self._thread = threading.Thread(target=self._run, name='drive-watch', daemon=True)
+            self._thread.start()
+            logger.info(f"Started Drive folder watcher every {self.interval}s")
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            # Picks up watches other processes added since the last poll
+            with self._locked(write=False):
+                watch_ids = list(self.watches)
+            for watch_id in watch_ids:
+                try:
+                    self.sync(watch_id)
+                except Exception as e:
+                    logger.error(f"Drive watch {watch_id} sync failed: {str(e)}", exc_info=True)
+
+    def add_watch(self, folder_id: str, credentials_info: Dict[str, Any], owner: str,
+                  include_existing: bool = True) -> Dict[str, Any]:
+        """Start watching a folder for owner; include_existing also queues the audio already in it."""
+        if not credentials_info.get('refresh_token'):
+            raise ValueError("Watching a folder needs offline access; authorize Google Drive again")
+        watch_id = uuid.uuid4().hex[:12]
+        with self._locked():
+            self.watches[watch_id] = {
+                'watch_id': watch_id,
+                'folder_id': folder_id,
+                'owner': owner,
+                'include_existing': include_existing,
+                'page_token': None,
+                'seen': {},  # Drive file ID -> md5 checksum of the version queued
+                'backlog': [],  # Files found but not queued yet
+                'batches': [],
+                'created_at': datetime.now().isoformat(),
+                'last_sync': None,
+                'last_error': None
+            }
+            self._credentials[watch_id] = {field: credentials_info.get(field) for field in STORED_CREDENTIAL_FIELDS}
+        logger.info(f"Watching Drive folder {folder_id} as {watch_id}")
+        return self.describe(watch_id)
+
+    def remove_watch(self, watch_id: str) -> bool:
+        with self._locked():
+            if self.watches.pop(watch_id, None) is None:
+                return False
+            self._credentials.pop(watch_id, None)
+        logger.info(f"Stopped Drive watch {watch_id}")
+        return True
+
+    def describe(self, watch_id: str) -> Optional[Dict[str, Any]]:
+        """A watch's state without its credentials."""
+        with self._locked(write=False):
+            watch = self.watches.get(watch_id)
+            if watch is None:
+                return None
+            return {
+                'watch_id': watch_id,
+                'folder_id': watch['folder_id'],
+                'created_at': watch['created_at'],
+                'last_sync': watch['last_sync'],
+                'last_error': watch['last_error'],
+                'queued_files': len(watch['seen']),
+                'backlog': len(watch['backlog']),
+                'batches': watch['batches'][-10:]
+            }
+
+    def owns(self, watch_id: str, owner: str) -> bool:
+        with self._locked(write=False):
+            watch = self.watches.get(watch_id)
+            return watch is not None and watch.get('owner') == owner
+
+    def list_watches(self, owner: str) -> List[Dict[str, Any]]:
+        with self._locked(write=False):
+            watch_ids = [watch_id for watch_id, watch in self.watches.items() if watch.get('owner') == owner]
+        return [watch for watch in map(self.describe, watch_ids) if watch is not None]
+
+    def _service_factory(self, watch: Dict[str, Any]):
+        from google.oauth2.credentials import Credentials
+        info = dict(self._credentials.get(watch['watch_id']) or {})
+        if not info.get('refresh_token'):
+            raise ValueError("No stored credentials for this watch; remove it and watch the folder again")
+        info['client_secret'] = os.environ.get('GOOGLE_CLIENT_SECRET')
+        credentials = Credentials.from_authorized_user_info(info)
+        return lambda: get_service(credentials)
+
+    def sync(self, watch_id: str) -> Optional[Dict[str, Any]]:
+        """Poll one watch's change feed and queue what's new; returns what was done.
+
+        The file lock is held throughout, so a watch removed meanwhile in
+        another process isn't written back.
+        """
+        with self._locked():
+            watch = self.watches.get(watch_id)
+            if watch is None:
+                return None
+            try:
+                result = self._sync(watch)
+                watch['last_error'] = None
+            except Exception as e:
+                watch['last_error'] = str(e)
+                raise
+            finally:
+                watch['last_sync'] = datetime.now().isoformat()
+        return result
+
+    def _sync(self, watch: Dict[str, Any]) -> Dict[str, Any]:
+        service_factory = self._service_factory(watch)
+        service = service_factory()
+        removed: List[str] = []
+        if watch['page_token'] is None:
+            # Taken before listing, so files added during the listing turn up in the next poll
+            token = start_page_token(service)
+            files = list_audio_files(service, watch['folder_id']) if watch['include_existing'] else []
+        else:
+            files, removed, token = list_changes(service, watch['page_token'], watch['folder_id'])
+
+        gone = set(removed)
+        backlog = {f['id']: f for f in watch['backlog'] if f['id'] not in gone}
+        checksums = {md5 for md5 in watch['seen'].values() if md5}
+        checksums.update(f['md5Checksum'] for f in backlog.values() if f['md5Checksum'])
+        found = 0
+        for file in files:
+            md5 = file.get('md5Checksum')
+            if file['id'] in backlog or watch['seen'].get(file['id'], False) == md5:
+                continue  # Already waiting, or renamed or moved with its content unchanged
+            if md5 and md5 in checksums:
+                continue  # Same content already queued under another file
+            backlog[file['id']] = {'id': file['id'], 'name': file.get('name'), 'md5Checksum': md5}
+            if md5:
+                checksums.add(md5)
+            found += 1
+        watch['backlog'] = list(backlog.values())
+        watch['page_token'] = token
+
+        result = {'found': found, 'queued': 0, 'backlog': len(watch['backlog']), 'batch_id': None}
+        if not watch['backlog']:
+            return result
+        # A batch over the per-caller limit would be refused outright
+        take = watch['backlog'][:min(self.max_per_sync, self.importer.admission.max_jobs_per_caller)]
+        try:
+            batch_id = self.importer.start(service_factory, [f['id'] for f in take],
+                                           f"drive-watch:{watch['watch_id']}")
+        except AdmissionRejected as e:
+            # Left in the backlog for the next poll
+            logger.warning(f"Drive watch {watch['watch_id']} deferred {len(take)} files: {str(e)}")
+            return result
+        for f in take:
+            watch['seen'][f['id']] = f['md5Checksum']
+        watch['backlog'] = watch['backlog'][len(take):]
+        watch['batches'].append(batch_id)
+        logger.info(f"Drive watch {watch['watch_id']} queued {len(take)} files as batch {batch_id}, "
+                    f"{len(watch['backlog'])} left in backlog")
+        result.update(queued=len(take), backlog=len(watch['backlog']), batch_id=batch_id)
+        return result
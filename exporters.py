@@ -0,0 +1,202 @@
+import csv
+import heapq
+import io
+import json
+import logging
+import zlib
+from typing import Iterable, Iterator, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Number of rows fetched per round trip from the server-side cursor
+EXPORT_BATCH_SIZE = 500
+
+CSV_HEADER = [
+    'ID', 'Title', 'Filename', 'Format', 'Duration', 'Has Narration', 'Has Music',
+    'Has Sound Effects', 'Songs Count', 'Environments', 'Characters', 'Themes'
+]
+
+TRANSCRIPT_SEPARATOR = "\n" + "=" * 50 + "\n"
+
+
+def stream_query(query, batch_size: int = EXPORT_BATCH_SIZE):
+    """Iterate a query through a server-side cursor, batch_size rows at a time."""
+    return query.execution_options(stream_results=True).yield_per(batch_size)
+
+
+def transcript_chunks(analyses: Iterable) -> Iterator[str]:
+    """Yield the plain-text transcript export one show at a time."""
+    for analysis in analyses:
+        if analysis.transcript:
+            yield f"\n### {analysis.title} ###\n\n{analysis.transcript}\n{TRANSCRIPT_SEPARATOR}"
+
+
+def csv_row(analysis) -> list:
+    """Build the CSV export row for an analysis."""
+    return [
+        analysis.id,
+        analysis.title,
+        analysis.filename,
+        analysis.format,
+        analysis.duration,
+        analysis.has_narration,
+        analysis.has_underscore,
+        analysis.has_sound_effects,
+        analysis.songs_count,
+        "|".join(analysis._parse_list_field(analysis.environments)),
+        "|".join(analysis._parse_list_field(analysis.characters_mentioned)),
+        "|".join(analysis._parse_list_field(analysis.themes)),
+    ]
+
+
+def csv_chunks(analyses: Iterable, header=CSV_HEADER, row_builder=csv_row) -> Iterator[str]:
+    """Yield a properly quoted CSV export, one row at a time."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+
+    def drain():
+        value = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return value
+
+    writer.writerow(header)
+    yield drain()
+    for analysis in analyses:
+        writer.writerow(row_builder(analysis))
+        yield drain()
+
+
+def jsonl_chunks(analyses: Iterable) -> Iterator[str]:
+    """Yield one cached API representation per line."""
+    for analysis in analyses:
+        yield analysis.to_json() + "\n"
+
+
+CHANGE_CSV_HEADER = ['Change Seq', 'Op'] + CSV_HEADER
+
+
+def merge_changes(analyses: Iterable, tombstones: Iterable) -> Iterator[Tuple[int, str, object]]:
+    """Merge upserts and tombstones, both ordered by change_seq, into one feed."""
+    upserts = ((analysis.change_seq, 'upsert', analysis) for analysis in analyses)
+    deletes = ((tombstone.change_seq, 'delete', tombstone) for tombstone in tombstones)
+    return heapq.merge(upserts, deletes, key=lambda change: change[0])
+
+
+def change_jsonl_chunks(changes: Iterable) -> Iterator[str]:
+    """Yield one change event per line, embedding the cached representation."""
+    for change_seq, op, record in changes:
+        if op == 'upsert':
+            yield f'{{"op":"upsert","change_seq":{change_seq},"analysis":{record.to_json()}}}\n'
+        else:
+            yield json.dumps({
+                'op': 'delete',
+                'change_seq': change_seq,
+                'id': record.analysis_id,
+                'deleted_at': record.deleted_at.isoformat() if record.deleted_at else None
+            }, separators=(',', ':')) + "\n"
+
+
+def change_csv_row(change) -> list:
+    """Build a change feed CSV row; deletions only carry the ID."""
+    change_seq, op, record = change
+    if op == 'upsert':
+        return [change_seq, op] + csv_row(record)
+    return [change_seq, op, record.analysis_id] + [''] * (len(CSV_HEADER) - 1)
+
+
+def change_csv_chunks(changes: Iterable) -> Iterator[str]:
+    """Yield the change feed as CSV."""
+    return csv_chunks(changes, header=CHANGE_CSV_HEADER, row_builder=change_csv_row)
+
+
+PARQUET_LIST_FIELDS = ['environments', 'characters_mentioned', 'speaking_characters', 'themes']
+PARQUET_JSON_FIELDS = ['emotion_scores', 'tone_analysis']
+
+
+def parquet_schema():
+    """Arrow schema for the Parquet export."""
+    import pyarrow as pa
+
+    return pa.schema([
+        ('id', pa.int64()),
+        ('title', pa.string()),
+        ('filename', pa.string()),
+        ('file_type', pa.string()),
+        ('format', pa.string()),
+        ('duration', pa.string()),
+        ('has_narration', pa.bool_()),
+        ('has_underscore', pa.bool_()),
+        ('has_sound_effects', pa.bool_()),
+        ('songs_count', pa.int64()),
+        *[(field, pa.list_(pa.string())) for field in PARQUET_LIST_FIELDS],
+        ('summary', pa.string()),
+        *[(field, pa.string()) for field in PARQUET_JSON_FIELDS],
+        ('dominant_emotion', pa.string()),
+        ('confidence_score', pa.float64()),
+        ('created_at', pa.timestamp('us')),
+        ('updated_at', pa.timestamp('us')),
+        ('version', pa.int64()),
+    ])
+
+
+def parquet_chunks(analyses: Iterable, batch_size: int = EXPORT_BATCH_SIZE) -> Iterator[bytes]:
+    """Yield a Parquet file, writing one row group per batch_size rows.
+
+    pyarrow is an optional dependency and is only imported when a Parquet
+    export is requested.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = parquet_schema()
+    sink = io.BytesIO()
+    writer = pq.ParquetWriter(sink, schema, compression='snappy')
+
+    def drain():
+        value = sink.getvalue()
+        sink.seek(0)
+        sink.truncate()
+        return value
+
+    def flush(rows):
+        writer.write_table(pa.Table.from_pylist(rows, schema=schema))
+        return drain()
+
+    rows = []
+    for analysis in analyses:
+        row = {name: getattr(analysis, name) for name in schema.names}
+        for field in PARQUET_LIST_FIELDS:
+            row[field] = [str(item) for item in analysis._parse_list_field(row[field])]
+        for field in PARQUET_JSON_FIELDS:
+            row[field] = json.dumps(analysis._parse_json_field(row[field]))
+        rows.append(row)
+        if len(rows) >= batch_size:
+            yield flush(rows)
+            rows = []
+
+    if rows:
+        yield flush(rows)
+    writer.close()
+    yield drain()
+
+
+def parquet_available() -> bool:
+    """Check whether the optional pyarrow dependency is installed."""
+    try:
+        import pyarrow.parquet  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def gzip_chunks(chunks: Iterable) -> Iterator[bytes]:
+    """Compress a chunk stream into a gzip stream on the fly."""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode('utf-8')
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
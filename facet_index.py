@@ -0,0 +1,337 @@
+import heapq
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left, insort
+from heapq import heappop, heappush
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from database import db
+from models import AudioAnalysis, AnalysisTombstone, commit_watermark
+
+logger = logging.getLogger(__name__)
+
+# Facet name -> list column; tags are case-folded
+TAG_FIELDS = {
+    'themes': 'themes',
+    'characters': 'characters_mentioned',
+    'speaking_characters': 'speaking_characters',
+    'environments': 'environments'
+}
+VALUE_FIELDS = ('format', 'dominant_emotion')  # Single-valued columns, one bitmap per value
+FLAG_FIELDS = ('has_narration', 'has_underscore', 'has_sound_effects')
+FACET_FIELDS = tuple(TAG_FIELDS) + VALUE_FIELDS + FLAG_FIELDS
+INDEXED_COLUMNS = tuple(TAG_FIELDS.values()) + VALUE_FIELDS + FLAG_FIELDS
+DEFAULT_COMPLETIONS = 10  # Suggestions returned when no limit is given
+MAX_CACHED_COMPLETIONS = 4096  # Answers kept until the next write; short prefixes span most of the vocabulary
+DEFAULT_REFRESH_INTERVAL = 1.0  # Seconds between checks of the change feed for other processes' writes
+
+
+def _postings(row: Dict[str, Any]) -> List[Tuple[str, str, str]]:
+    """(facet, folded key, display name) for every tag, value and set flag of a row."""
+    postings = []
+    for facet, column in TAG_FIELDS.items():
+        for tag in row.get(column) or []:
+            name = str(tag).strip()
+            if name:
+                postings.append((facet, name.casefold(), name))
+    for facet in VALUE_FIELDS:
+        value = (row.get(facet) or '').strip()
+        if value:
+            postings.append((facet, value.casefold(), value))
+    for facet in FLAG_FIELDS:
+        postings.append((facet, 'true' if row.get(facet) else 'false', 'true' if row.get(facet) else 'false'))
+    return postings
+
+
+def _row(values: Iterable[Any]) -> Dict[str, Any]:
+    """The indexed columns, from their values in INDEXED_COLUMNS order."""
+    row = dict(zip(INDEXED_COLUMNS, values))
+    for column in TAG_FIELDS.values():
+        row[column] = AudioAnalysis._parse_list_field(row[column])
+    return row
+
+
+def _analysis_row(analysis: AudioAnalysis) -> Dict[str, Any]:
+    return _row(getattr(analysis, column) for column in INDEXED_COLUMNS)
+
+
+def _indexed_rows():
+    """Query for (ID, *indexed columns), leaving the transcript and cached JSON unread."""
+    return db.session.query(AudioAnalysis.id, *(getattr(AudioAnalysis, column) for column in INDEXED_COLUMNS))
+
+
+def _bits(bitmap: int) -> Iterable[int]:
+    """Positions of the set bits, lowest first."""
+    # One pass over the binary digits, least significant first, rather than a big-int operation per bit
+    digits = bin(bitmap)[:1:-1]
+    position = digits.find('1')
+    while position >= 0:
+        yield position
+        position = digits.find('1', position + 1)
+
+
+class FacetIndex:
+    """In-process bitmap index over the analyses' tags and flags.
+
+    Every tag (case-folded, per facet) is interned to a small integer and
+    owns a bitmap, a Python int with bit n set when document n carries the
+    tag. Documents are dense internal numbers mapped to analysis IDs, with
+    the numbers of deleted analyses reused, so bitmaps stay as wide as the
+    number of analyses however sparse the IDs become. A filter is a few ORs and ANDs over those ints and a facet count
+    is a popcount of the result ANDed with each tag's bitmap, so neither
+    touches the database. The tag facets' folded keys are also kept sorted
+    with a running count of analyses per tag, so completing a prefix is a
+    binary search plus a top-k over the matching range. Writes in this
+    process are applied when their transaction commits; writes from other
+    processes are picked up from the change feed (change_xid and
+    tombstones) at most every refresh_interval seconds, reading only the
+    indexed columns.
+    """
+
+    def __init__(self, refresh_interval: float = DEFAULT_REFRESH_INTERVAL):
+        self.refresh_interval = refresh_interval
+        self.loaded = False
+        self._tag_ids: Dict[Tuple[str, str], int] = {}  # (facet, folded key) -> tag ID
+        self._tags: List[Tuple[str, str]] = []  # tag ID -> (facet, display name)
+        self._bitmaps: List[int] = []  # tag ID -> bitmap of analysis IDs
+        self._counts: List[int] = []  # tag ID -> analyses carrying it
+        self._sorted: Dict[str, List[Tuple[str, int]]] = {facet: [] for facet in TAG_FIELDS}  # (key, tag ID)
+        self._completions: Dict[Tuple[str, str, Optional[int]], List[Dict[str, Any]]] = {}
+        self._facet_tags: Dict[str, List[int]] = {facet: [] for facet in FACET_FIELDS}
+        self._doc_tags: Dict[int, List[int]] = {}  # analysis ID -> tag IDs, to undo on update
+        self._docs: Dict[int, int] = {}  # analysis ID -> document number
+        self._doc_ids: List[Optional[int]] = []  # document number -> analysis ID, None when free
+        self._free_docs: List[int] = []  # heap of free document numbers, lowest reused first
+        self._all = 0
+        self._watermark = 0  # Transactions below this have been applied, see commit_watermark
+        self._last_refresh = 0.0
+        self._lock = threading.RLock()
+
+    def _intern(self, facet: str, key: str, name: str) -> int:
+        tag_id = self._tag_ids.get((facet, key))
+        if tag_id is None:
+            tag_id = self._tag_ids[(facet, key)] = len(self._tags)
+            self._tags.append((facet, name))
+            self._bitmaps.append(0)
+            self._counts.append(0)
+            self._facet_tags[facet].append(tag_id)
+            if facet in self._sorted:
+                insort(self._sorted[facet], (key, tag_id))
+        return tag_id
+
+    def _clear(self, analysis_id: int, doc: int):
+        mask = ~(1 << doc)
+        self._completions.clear()
+        for tag_id in self._doc_tags.pop(analysis_id, ()):
+            self._bitmaps[tag_id] &= mask
+            self._counts[tag_id] -= 1
+        self._all &= mask
+
+    def _remove(self, analysis_id: int):
+        doc = self._docs.pop(analysis_id, None)
+        if doc is None:
+            return
+        self._clear(analysis_id, doc)
+        self._doc_ids[doc] = None
+        heappush(self._free_docs, doc)
+
+    def _put(self, analysis_id: int, row: Dict[str, Any]):
+        doc = self._docs.get(analysis_id)
+        if doc is not None:
+            self._clear(analysis_id, doc)
+        elif self._free_docs:
+            doc = self._docs[analysis_id] = heappop(self._free_docs)
+            self._doc_ids[doc] = analysis_id
+        else:
+            doc = self._docs[analysis_id] = len(self._doc_ids)
+            self._doc_ids.append(analysis_id)
+        bit = 1 << doc
+        # A tag listed twice in different case counts once
+        tag_ids = list(dict.fromkeys(self._intern(*posting) for posting in _postings(row)))
+        for tag_id in tag_ids:
+            self._bitmaps[tag_id] |= bit
+            self._counts[tag_id] += 1
+        self._doc_tags[analysis_id] = tag_ids
+        self._all |= bit
+
+    def apply(self, changes: Dict[int, Optional[Dict[str, Any]]]):
+        """Apply committed writes: analysis ID -> its indexed columns, or None if deleted."""
+        with self._lock:
+            if not self.loaded:
+                return
+            for analysis_id, row in changes.items():
+                if row is None:
+                    self._remove(analysis_id)
+                else:
+                    self._put(analysis_id, row)
+
+    def load(self):
+        """Build the index from the database."""
+        started = time.time()
+        with self._lock:
+            self.__init__(self.refresh_interval)
+            # Taken before reading, so anything committing during the load is caught up on next refresh
+            self._watermark = commit_watermark(db.session)
+            for analysis_id, *values in _indexed_rows().order_by(AudioAnalysis.id).yield_per(1000):
+                self._put(analysis_id, _row(values))
+            self.loaded = True
+            self._last_refresh = time.time()
+        logger.info(f"Built facet index over {len(self._doc_tags)} analyses and {len(self._tags)} tags "
+                    f"in {time.time() - started:.2f}s")
+
+    def refresh(self, force: bool = False):
+        """Load the index if needed, else catch up on writes made through the change feed."""
+        with self._lock:
+            if not self.loaded:
+                self.load()
+                return
+            if not force and time.time() - self._last_refresh < self.refresh_interval:
+                return
+            self._last_refresh = time.time()
+            since = self._watermark
+            watermark = commit_watermark(db.session)
+            # Changes from transactions still running at the last refresh have change_xid >= since;
+            # some are read again, which is harmless
+            changes: Dict[int, Optional[Dict[str, Any]]] = {}
+            for analysis_id, *values in _indexed_rows().filter(AudioAnalysis.change_xid >= since).order_by(
+                    AudioAnalysis.change_seq):
+                changes[analysis_id] = _row(values)
+            deleted = {tombstone.analysis_id for tombstone in
+                       AnalysisTombstone.query.filter(AnalysisTombstone.change_xid >= since)} - set(changes)
+            if deleted:
+                # A row that still exists outlives tombstones for its ID, which was reused
+                existing = {analysis_id for analysis_id, in
+                            db.session.query(AudioAnalysis.id).filter(AudioAnalysis.id.in_(deleted))}
+                changes.update((analysis_id, None) for analysis_id in deleted - existing)
+            self.apply(changes)
+            self._watermark = max(since, watermark)
+
+    def _tag_bitmap(self, facet: str, value: Any) -> int:
+        if facet in FLAG_FIELDS:
+            value = 'true' if str(value).lower() in ('1', 'true', 'yes') else 'false'
+        tag_id = self._tag_ids.get((facet, str(value).strip().casefold()))
+        return self._bitmaps[tag_id] if tag_id is not None else 0
+
+    def filter(self, criteria: Dict[str, Any], match_all: bool = False) -> int:
+        """Bitmap of the analyses matching criteria: facet -> value or list of values.
+
+        Values within a facet are ORed, or ANDed with match_all; facets are ANDed.
+        """
+        with self._lock:
+            result = self._all
+            for facet, values in criteria.items():
+                if facet not in FACET_FIELDS:
+                    raise ValueError(f"Unknown facet '{facet}'. Known facets: {', '.join(FACET_FIELDS)}")
+                values = [v for v in (values if isinstance(values, list) else [values]) if v != '']
+                if not values:
+                    continue
+                bitmaps = [self._tag_bitmap(facet, value) for value in values]
+                combined = bitmaps[0]
+                for bitmap in bitmaps[1:]:
+                    combined = combined & bitmap if match_all else combined | bitmap
+                result &= combined
+            return result
+
+    def facet_counts(self, bitmap: int, facets: Iterable[str], limit: Optional[int] = None) -> Dict[str, Dict[str, int]]:
+        """For each facet, how many analyses in bitmap carry each of its tags, most frequent first."""
+        counts: Dict[str, Dict[str, int]] = {}
+        with self._lock:
+            for facet in facets:
+                if facet not in FACET_FIELDS:
+                    raise ValueError(f"Unknown facet '{facet}'. Known facets: {', '.join(FACET_FIELDS)}")
+                tag_counts = [(self._tags[t][1], (self._bitmaps[t] & bitmap).bit_count())
+                              for t in self._facet_tags[facet]]
+                tag_counts = sorted((tc for tc in tag_counts if tc[1]), key=lambda tc: (-tc[1], tc[0].casefold()))
+                counts[facet] = dict(tag_counts[:limit] if limit else tag_counts)
+        return counts
+
+    def complete(self, facet: str, prefix: str, limit: Optional[int] = DEFAULT_COMPLETIONS) -> List[Dict[str, Any]]:
+        """Tags of facet starting with prefix, case-insensitively; the most used first, then alphabetical."""
+        if facet not in TAG_FIELDS:
+            raise ValueError(f"Can't complete '{facet}'. Known facets: {', '.join(TAG_FIELDS)}")
+        key = prefix.strip().casefold()
+        with self._lock:
+            cached = self._completions.get((facet, key, limit))
+            if cached is not None:
+                return cached
+            entries = self._sorted[facet]
+            start = bisect_left(entries, (key,))
+            end = bisect_left(entries, (key + '\U0010ffff',), start)
+            matches = (entries[i][1] for i in range(start, end) if self._counts[entries[i][1]])
+            # Both keep the alphabetical order of equal counts
+            if limit:
+                top = heapq.nlargest(limit, matches, key=self._counts.__getitem__)
+            else:
+                top = sorted(matches, key=self._counts.__getitem__, reverse=True)
+            completions = [{'value': self._tags[tag_id][1], 'count': self._counts[tag_id]} for tag_id in top]
+            if len(self._completions) >= MAX_CACHED_COMPLETIONS:
+                self._completions.clear()
+            self._completions[(facet, key, limit)] = completions
+            return completions
+
+    def ids(self, bitmap: int) -> List[int]:
+        """The analysis IDs in bitmap, ascending."""
+        with self._lock:
+            return sorted(self._doc_ids[doc] for doc in _bits(bitmap))
+
+    def bitmap(self, ids: Iterable[int]) -> int:
+        """Bitmap of the given analysis IDs; IDs not in the index are left out."""
+        with self._lock:
+            result = 0
+            for analysis_id in ids:
+                doc = self._docs.get(analysis_id)
+                if doc is not None:
+                    result |= 1 << doc
+            return result
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'loaded': self.loaded,
+                'analyses': len(self._doc_tags),
+                'tags': len(self._tags),
+                'bytes': sum((b.bit_length() + 7) // 8 for b in self._bitmaps),
+                'watermark': self._watermark
+            }
+
+
+_index: Optional[FacetIndex] = None
+_index_lock = threading.Lock()
+
+
+def get_facet_index() -> FacetIndex:
+    """Return the process-wide index; it is built from the database on first use."""
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = FacetIndex(float(os.environ.get('FACET_REFRESH_INTERVAL', DEFAULT_REFRESH_INTERVAL)))
+        return _index
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_changes(session, flush_context):
+    """Note the indexed columns of analyses written in this transaction."""
+    changes = session.info.setdefault('facet_changes', {})
+    for analysis in session.new | session.dirty:
+        if isinstance(analysis, AudioAnalysis):
+            changes[analysis.id] = _analysis_row(analysis)
+    for analysis in session.deleted:
+        if isinstance(analysis, AudioAnalysis):
+            changes[analysis.id] = None
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_changes(session):
+    changes = session.info.pop('facet_changes', None)
+    if changes and _index is not None:
+        _index.apply(changes)
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _discard_changes(session, previous_transaction):
+    session.info.pop('facet_changes', None)
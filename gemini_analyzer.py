@@ -1,8 +1,14 @@
 import os
+import asyncio
 import logging
 import google.generativeai as genai
 import json
-from typing import Dict, Any, Tuple
+from typing import Dict, Any, List, Optional, Tuple
+from analysis_worker import get_analysis_worker
+from llm_cache import ResponseCache, cache_enabled, get_response_cache
+from blob_store import file_digest
+from cancellation import stage_timeout, with_deadline
+from retry_policy import get_retry_policy
 
 # Configure logging
 logging.basicConfig(
@@ -12,8 +18,35 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 class GeminiAnalyzer:
-    def __init__(self):
-        """Initialize GeminiAnalyzer with API configuration"""
+    MODEL_NAME = "gemini-2.0-flash-exp"
+
+    # Bump a template's version whenever its prompt changes so cached responses are not reused
+    PROMPT_VERSIONS = {
+        'extract_transcript': 1,
+        'file_analysis': 1,
+        'transcript_summary': 1,
+        'summary': 1,
+        'emotions': 1,
+        'packed': 1,
+        'chunk_summary': 1,
+        'reduce_summary': 1,
+    }
+
+    # Transcripts longer than this are summarised chunk by chunk, then reduced
+    HIERARCHICAL_SUMMARY_TOKENS = 12000
+    SUMMARY_CHUNK_TOKENS = 6000
+    SUMMARY_MAP_WORKERS = 4
+    CHARS_PER_TOKEN = 4  # Rough estimate, avoids a count_tokens round trip
+
+    # Uploaded audio and video are processed before they can be used in a prompt
+    FILE_POLL_INTERVAL = 2.0
+
+    def __init__(self, bypass_cache: bool = False):
+        """Initialize GeminiAnalyzer with API configuration
+
+        With bypass_cache the response cache is not read, but fresh
+        responses are still written back to it.
+        """
         try:
             # Verify API key is set
             api_key = os.environ.get("GEMINI_API_KEY")
@@ -35,7 +68,7 @@ class GeminiAnalyzer:
 
             # Initialize the model with specific system instruction
             self.model = genai.GenerativeModel(
-                model_name="gemini-2.0-flash-exp",
+                model_name=self.MODEL_NAME,
                 generation_config=self.generation_config,
                 system_instruction=(
                     "You are an expert audio content analyzer specializing in children's content. "
@@ -49,51 +82,143 @@ class GeminiAnalyzer:
             self.chat = self.model.start_chat(history=[])
             logger.info("Started new chat session")
 
+            # Shared across analyzers so a quota error slows every caller down
+            self.retry = get_retry_policy('gemini')
+
+            self.bypass_cache = bypass_cache
+            self.cache = None
+            if cache_enabled():
+                try:
+                    self.cache = get_response_cache()
+                except Exception as e:
+                    logger.warning(f"LLM response cache unavailable: {str(e)}")
+
         except Exception as e:
             logger.error(f"Failed to initialize GeminiAnalyzer: {str(e)}")
             raise
 
-    def extract_transcript(self, file_path: str, mime_type: str = None) -> str:
+    def _cache_key(self, template: str, *inputs: Any) -> str:
+        return ResponseCache.make_key(
+            self.MODEL_NAME, self.generation_config, template, self.PROMPT_VERSIONS[template], *inputs
+        )
+
+    def _cache_get(self, key: str, allow_bypass: bool = True) -> Optional[str]:
+        if self.cache is None or (self.bypass_cache and allow_bypass):
+            return None
+        cached = self.cache.get(key)
+        if cached is not None:
+            logger.info("Using cached Gemini response")
+        return cached
+
+    def _cache_put(self, key: str, response_text: str):
+        if self.cache is not None:
+            self.cache.put(key, response_text)
+
+    # The cache is SQLite behind a lock; on the shared event loop it would stall every other analysis
+    async def _cache_get_async(self, key: str, allow_bypass: bool = True) -> Optional[str]:
+        if self.cache is None or (self.bypass_cache and allow_bypass):
+            return None
+        return await asyncio.to_thread(self._cache_get, key, allow_bypass)
+
+    async def _cache_put_async(self, key: str, response_text: str):
+        if self.cache is not None:
+            await asyncio.to_thread(self._cache_put, key, response_text)
+
+    async def _generate_async(self, contents):
+        async def attempt():
+            return await with_deadline('generation', self.model.generate_content_async(contents))
+        return await self.retry.call_async(attempt)
+
+    def _request_options(self) -> Dict[str, Any]:
+        """Deadline for a blocking model request."""
+        return {'timeout': stage_timeout('generation')}
+
+    def _file_cache_inputs(self, file_path: str, mime_type: str = None, content_digest: str = None):
+        """Hash a file's contents for cache keys, skipping the work when caching is off."""
+        if self.cache is None:
+            return None
+        return (content_digest or file_digest(file_path), mime_type)
+
+    async def _upload_file_async(self, file_path: str, mime_type: str = None):
+        """Upload a file and wait until Gemini has finished processing it."""
+        # The SDK has no async upload, so it runs on the worker's bounded I/O pool
+        file = await self.retry.call_async(asyncio.to_thread, genai.upload_file, file_path, mime_type=mime_type)
+        logger.info(f"Successfully uploaded file '{file.display_name}' as: {file.uri}")
+
+        # Polling is bounded by the caller's upload deadline
+        while file.state.name == 'PROCESSING':
+            await asyncio.sleep(self.FILE_POLL_INTERVAL)
+            file = await self.retry.call_async(asyncio.to_thread, genai.get_file, file.name)
+        if file.state.name == 'FAILED':
+            raise ValueError(f"Gemini could not process {file.display_name}")
+        return file
+
+    def _transcript_prompt(self, mime_type: str = None) -> str:
+        # Different prompts based on file type
+        if mime_type and mime_type.startswith('image/'):
+            return (
+                "Please provide a detailed description of this image.\n"
+                "Focus on:\n"
+                "1. Visual elements and composition\n"
+                "2. Characters or objects present\n"
+                "3. Setting and environment\n"
+                "4. Overall mood and atmosphere"
+            )
+        return (
+            "Please provide a detailed transcript of this audio content.\n"
+            "Focus on capturing all spoken dialogue, narration, and significant "
+            "sound effects. Format the transcript in a clear, readable manner.\n"
+            "Include speaker labels where possible."
+        )
+
+    def extract_transcript(self, file_path: str, mime_type: str = None, content_digest: str = None) -> str:
         """Extract transcript or description from a file using Gemini."""
+        return get_analysis_worker().run(self.extract_transcript_async(file_path, mime_type, content_digest))
+
+    async def extract_transcript_async(self, file_path: str, mime_type: str = None, content_digest: str = None) -> str:
         try:
             logger.info(f"Starting content extraction for: {file_path}")
-            file = genai.upload_file(file_path, mime_type=mime_type)
+            if self.cache is not None and content_digest is None:
+                content_digest = await asyncio.to_thread(file_digest, file_path)
+            file_inputs = self._file_cache_inputs(file_path, mime_type, content_digest)
+            cache_key = self._cache_key('extract_transcript', *file_inputs) if file_inputs else None
+            cached = await self._cache_get_async(cache_key) if cache_key else None
+            if cached is not None:
+                return cached
 
-            # Different prompts based on file type
-            if mime_type and mime_type.startswith('image/'):
-                prompt = (
-                    "Please provide a detailed description of this image.\n"
-                    "Focus on:\n"
-                    "1. Visual elements and composition\n"
-                    "2. Characters or objects present\n"
-                    "3. Setting and environment\n"
-                    "4. Overall mood and atmosphere"
-                )
-            else:
-                prompt = (
-                    "Please provide a detailed transcript of this audio content.\n"
-                    "Focus on capturing all spoken dialogue, narration, and significant "
-                    "sound effects. Format the transcript in a clear, readable manner.\n"
-                    "Include speaker labels where possible."
-                )
-
-            response = self.chat.send_message([file, prompt])
-            content = response.text.strip()
-
-            logger.info("Successfully extracted content")
-            logger.debug(f"Content: {content[:200]}...")  # Log first 200 chars
-
-            return content
+            file = await with_deadline('upload', self._upload_file_async(file_path, mime_type))
+            return await self._generate_transcript(file, mime_type, cache_key)
 
         except Exception as e:
             logger.error(f"Error extracting content: {str(e)}")
             raise ValueError(f"Error extracting content: {str(e)}")
 
+    async def _generate_transcript(self, file, mime_type: str = None, cache_key: str = None) -> str:
+        response = await self._generate_async([file, self._transcript_prompt(mime_type)])
+        content = response.text.strip()
+        if cache_key:
+            await self._cache_put_async(cache_key, content)
+
+        logger.info("Successfully extracted content")
+        logger.debug(f"Content: {content[:200]}...")  # Log first 200 chars
+        return content
+
     def generate_summary_from_transcript(self, transcript: str) -> Dict[str, str]:
         """Generate a summary specifically from the transcript."""
+        return get_analysis_worker().run(self.generate_summary_from_transcript_async(transcript))
+
+    async def generate_summary_from_transcript_async(self, transcript: str) -> Dict[str, str]:
         try:
             logger.info("Generating summary from transcript")
 
+            if self._estimate_tokens(transcript) > self.HIERARCHICAL_SUMMARY_TOKENS:
+                return {'summary': await self._summarise_hierarchically(transcript)}
+
+            cache_key = self._cache_key('transcript_summary', transcript)
+            cached = await self._cache_get_async(cache_key)
+            if cached is not None:
+                return {'summary': cached}
+
             prompt = (
                 "Generate a concise, focused summary of this audio transcript (max 3-4 sentences). Focus on:\n"
                 "1. Core narrative elements\n"
@@ -103,8 +228,9 @@ class GeminiAnalyzer:
                 "Provide a natural, flowing summary that captures the essence of the content."
             )
 
-            response = self.chat.send_message(prompt)
+            response = await self._generate_async(prompt)
             summary = response.text.strip()
+            await self._cache_put_async(cache_key, summary)
 
             logger.info("Successfully generated summary from transcript")
             logger.debug(f"Generated summary: {summary[:200]}...")  # Log first 200 chars
@@ -114,83 +240,123 @@ class GeminiAnalyzer:
             logger.error(f"Error generating summary from transcript: {str(e)}", exc_info=True)
             raise ValueError(f"Error generating summary: {str(e)}")
 
+    def _estimate_tokens(self, text: str) -> int:
+        return len(text) // self.CHARS_PER_TOKEN
+
+    def _split_transcript(self, transcript: str, max_tokens: int) -> List[str]:
+        """Split a transcript into chunks of at most max_tokens, on line boundaries where possible."""
+        max_chars = max_tokens * self.CHARS_PER_TOKEN
+        chunks, current, current_chars = [], [], 0
+        for line in transcript.splitlines(keepends=True):
+            # Hard-split any single line that is longer than a whole chunk
+            pieces = [line[i:i + max_chars] for i in range(0, len(line), max_chars)] or [line]
+            for piece in pieces:
+                if current and current_chars + len(piece) > max_chars:
+                    chunks.append(''.join(current))
+                    current, current_chars = [], 0
+                current.append(piece)
+                current_chars += len(piece)
+        if current:
+            chunks.append(''.join(current))
+        return chunks
+
+    async def _summarise_chunk(self, chunk: str, index: int, total: int) -> str:
+        """Summarise one transcript chunk statelessly, so chunks can run concurrently."""
+        # Chunk summaries are reused even when bypassing the cache, so a
+        # regenerated summary only reruns the reduce step
+        cache_key = self._cache_key('chunk_summary', chunk)
+        cached = await self._cache_get_async(cache_key, allow_bypass=False)
+        if cached is not None:
+            return cached
+
+        prompt = (
+            f"This is part {index + 1} of {total} of an audio transcript. Summarise this part in a short "
+            "paragraph, keeping the plot events, the characters involved and any themes or messages "
+            "so that the parts can later be combined into one summary.\n\n"
+            f"Transcript part:\n{chunk}"
+        )
+        response = await self._generate_async(prompt)
+        summary = response.text.strip()
+        await self._cache_put_async(cache_key, summary)
+        return summary
+
+    async def _summarise_hierarchically(self, transcript: str) -> str:
+        """Map-reduce summary: summarise chunks concurrently, then reduce to 3-4 sentences."""
+        cache_key = self._cache_key('reduce_summary', transcript)
+        cached = await self._cache_get_async(cache_key)
+        if cached is not None:
+            return cached
+
+        map_slots = asyncio.Semaphore(self.SUMMARY_MAP_WORKERS)
+
+        async def summarise(chunk, index, total):
+            async with map_slots:
+                return await self._summarise_chunk(chunk, index, total)
+
+        text = transcript
+        # Keep mapping until the partial summaries fit in a single reduce prompt
+        while self._estimate_tokens(text) > self.HIERARCHICAL_SUMMARY_TOKENS:
+            chunks = self._split_transcript(text, self.SUMMARY_CHUNK_TOKENS)
+            logger.info(f"Summarising {len(chunks)} transcript chunks")
+            partials = await asyncio.gather(*(
+                summarise(chunk, index, len(chunks)) for index, chunk in enumerate(chunks)
+            ))
+            reduced = "\n\n".join(f"Part {i + 1}: {partial}" for i, partial in enumerate(partials))
+            if len(reduced) >= len(text):
+                logger.warning("Chunk summaries did not shrink the transcript, reducing as-is")
+                text = reduced
+                break
+            text = reduced
+
+        prompt = (
+            "Below are summaries of consecutive parts of one audio transcript. Combine them into a "
+            "concise, focused summary of the whole piece (max 3-4 sentences). Focus on:\n"
+            "1. Core narrative elements\n"
+            "2. Key character moments\n"
+            "3. Central theme or message\n\n"
+            f"Part summaries:\n{text}\n\n"
+            "Provide a natural, flowing summary that captures the essence of the content."
+        )
+        response = await self._generate_async(prompt)
+        summary = response.text.strip()
+        await self._cache_put_async(cache_key, summary)
+        logger.info("Successfully reduced chunk summaries")
+        return summary
+
     def upload_to_gemini(self, file_path: str, mime_type: str = None) -> Dict[str, Any]:
         """Upload and analyze a file using Gemini"""
+        return get_analysis_worker().run(self.upload_to_gemini_async(file_path, mime_type))
+
+    async def upload_to_gemini_async(self, file_path: str, mime_type: str = None) -> Dict[str, Any]:
+        """Upload and analyze a file, with the transcript and metadata requests running concurrently."""
         try:
             logger.info(f"Starting analysis of file: {file_path}")
 
-            # First get the transcript or description
-            transcript = self.extract_transcript(file_path, mime_type)
-
-            # Then proceed with metadata analysis
-            file = genai.upload_file(file_path, mime_type=mime_type)
-            logger.info(f"Successfully uploaded file '{file.display_name}' as: {file.uri}")
-
-            # Different prompts based on file type
-            if mime_type and mime_type.startswith('image/'):
-                prompt = (
-                    "Analyze this image and provide detailed information in these categories:\n"
-                    "1. Format: What type of image is this (e.g., illustration, photograph)?\n"
-                    "2. Characters: List all characters or people visible (comma-separated)\n"
-                    "3. Environments: List physical locations/settings visible (comma-separated)\n"
-                    "4. Themes: List abstract concepts represented (comma-separated)\n"
-                    "5. Emotions: Rate each emotion (joy, sadness, anger, fear, surprise) from 0.0 to 1.0\n"
-                    "6. Tone Analysis: Describe the overall visual tone (bright, dark, dramatic, etc)\n"
-                    "7. Dominant Emotion: Which emotion is most prevalent?\n"
-                    "8. Confidence: Rate analysis confidence from 0.0 to 1.0\n\n"
-                    "Format your response with labels:\n"
-                    "Format: [answer]\n"
-                    "Characters Mentioned: [comma-separated list]\n"
-                    "Environments: [comma-separated list]\n"
-                    "Themes: [comma-separated list]\n"
-                    "Emotions: {'joy': [0-1], 'sadness': [0-1], 'anger': [0-1], 'fear': [0-1], 'surprise': [0-1]}\n"
-                    "Tone Analysis: [description]\n"
-                    "Dominant Emotion: [emotion]\n"
-                    "Confidence: [0-1]"
-                )
-            else:
-                prompt = (
-                    "Analyze this audio file and provide detailed information in these categories:\n"
-                    "1. Format: Is this narrated (single narrator) or radio play (multiple actors)?\n"
-                    "2. Narration: Is there a narrator? (Yes/No)\n"
-                    "3. Underscore: Is there background music? (Yes/No)\n"
-                    "4. Sound Effects: Are there sound effects? (Yes/No)\n"
-                    "5. Songs: Total number of complete songs\n"
-                    "6. Characters Mentioned: List ALL character names (comma-separated)\n"
-                    "7. Speaking Characters: List only characters with speaking lines (comma-separated)\n"
-                    "8. Environments: List physical locations only (comma-separated)\n"
-                    "9. Themes: List abstract concepts only (comma-separated)\n"
-                    "10. Duration: Total length in HH:MM:SS format\n"
-                    "11. Emotions: Rate each emotion (joy, sadness, anger, fear, surprise) from 0.0 to 1.0\n"
-                    "12. Tone Analysis: Describe the overall tone\n"
-                    "13. Dominant Emotion: Which emotion is most prevalent?\n"
-                    "14. Confidence: Rate analysis confidence from 0.0 to 1.0\n\n"
-                    "Format your response with labels:\n"
-                    "Format: [answer]\n"
-                    "Narration: [yes/no]\n"
-                    "Underscore: [yes/no]\n"
-                    "Sound Effects: [yes/no]\n"
-                    "Songs Count: [number]\n"
-                    "Characters Mentioned: [comma-separated list]\n"
-                    "Speaking Characters: [comma-separated list]\n"
-                    "Environments: [comma-separated list]\n"
-                    "Themes: [comma-separated list]\n"
-                    "Duration: [HH:MM:SS]\n"
-                    "Emotions: {'joy': [0-1], 'sadness': [0-1], 'anger': [0-1], 'fear': [0-1], 'surprise': [0-1]}\n"
-                    "Tone Analysis: [description]\n"
-                    "Dominant Emotion: [emotion]\n"
-                    "Confidence: [0-1]"
-                )
-
-            logger.info("Sending analysis request to Gemini")
-            response = self.chat.send_message([file, prompt])
-
-            # Log the raw response
-            logger.info("Received response from Gemini")
-            logger.debug(f"Raw response:\n{response.text}")
+            # Hash the file once for every per-file cache lookup
+            content_digest = await asyncio.to_thread(file_digest, file_path) if self.cache is not None else None
+            file_inputs = self._file_cache_inputs(file_path, mime_type, content_digest)
+
+            cache_key = self._cache_key('file_analysis', *file_inputs) if file_inputs else None
+            response_text = await self._cache_get_async(cache_key) if cache_key else None
+            transcript_key = self._cache_key('extract_transcript', *file_inputs) if file_inputs else None
+            transcript = await self._cache_get_async(transcript_key) if transcript_key else None
+
+            # Upload once and share the file between both requests
+            file = None
+            if response_text is None or transcript is None:
+                file = await with_deadline('upload', self._upload_file_async(file_path, mime_type))
+
+            requests = {}
+            if transcript is None:
+                requests['transcript'] = self._generate_transcript(file, mime_type, transcript_key)
+            if response_text is None:
+                requests['analysis'] = self._analyze_file(file, mime_type, cache_key)
+            results = dict(zip(requests, await asyncio.gather(*requests.values())))
+            transcript = results.get('transcript', transcript)
+            response_text = results.get('analysis', response_text)
 
             # Process the response
-            analysis = self._parse_gemini_response(response.text)
+            analysis = self._parse_gemini_response(response_text)
 
             # Set default values for audio-specific fields if processing an image
             if mime_type and mime_type.startswith('image/'):
@@ -205,7 +371,7 @@ class GeminiAnalyzer:
 
             # Add transcript and generate summary
             analysis['transcript'] = transcript
-            summary_result = self.generate_summary_from_transcript(transcript)
+            summary_result = await self.generate_summary_from_transcript_async(transcript)
             analysis['summary'] = summary_result['summary']
 
             return analysis
@@ -214,6 +380,75 @@ class GeminiAnalyzer:
             logger.error(f"Error in upload_to_gemini: {str(e)}")
             raise ValueError(f"Error analyzing content: {str(e)}")
 
+    async def _analyze_file(self, file, mime_type: str = None, cache_key: str = None) -> str:
+        """Return Gemini's raw metadata analysis of an uploaded file."""
+
+        # Different prompts based on file type
+        if mime_type and mime_type.startswith('image/'):
+            prompt = (
+                "Analyze this image and provide detailed information in these categories:\n"
+                "1. Format: What type of image is this (e.g., illustration, photograph)?\n"
+                "2. Characters: List all characters or people visible (comma-separated)\n"
+                "3. Environments: List physical locations/settings visible (comma-separated)\n"
+                "4. Themes: List abstract concepts represented (comma-separated)\n"
+                "5. Emotions: Rate each emotion (joy, sadness, anger, fear, surprise) from 0.0 to 1.0\n"
+                "6. Tone Analysis: Describe the overall visual tone (bright, dark, dramatic, etc)\n"
+                "7. Dominant Emotion: Which emotion is most prevalent?\n"
+                "8. Confidence: Rate analysis confidence from 0.0 to 1.0\n\n"
+                "Format your response with labels:\n"
+                "Format: [answer]\n"
+                "Characters Mentioned: [comma-separated list]\n"
+                "Environments: [comma-separated list]\n"
+                "Themes: [comma-separated list]\n"
+                "Emotions: {'joy': [0-1], 'sadness': [0-1], 'anger': [0-1], 'fear': [0-1], 'surprise': [0-1]}\n"
+                "Tone Analysis: [description]\n"
+                "Dominant Emotion: [emotion]\n"
+                "Confidence: [0-1]"
+            )
+        else:
+            prompt = (
+                "Analyze this audio file and provide detailed information in these categories:\n"
+                "1. Format: Is this narrated (single narrator) or radio play (multiple actors)?\n"
+                "2. Narration: Is there a narrator? (Yes/No)\n"
+                "3. Underscore: Is there background music? (Yes/No)\n"
+                "4. Sound Effects: Are there sound effects? (Yes/No)\n"
+                "5. Songs: Total number of complete songs\n"
+                "6. Characters Mentioned: List ALL character names (comma-separated)\n"
+                "7. Speaking Characters: List only characters with speaking lines (comma-separated)\n"
+                "8. Environments: List physical locations only (comma-separated)\n"
+                "9. Themes: List abstract concepts only (comma-separated)\n"
+                "10. Duration: Total length in HH:MM:SS format\n"
+                "11. Emotions: Rate each emotion (joy, sadness, anger, fear, surprise) from 0.0 to 1.0\n"
+                "12. Tone Analysis: Describe the overall tone\n"
+                "13. Dominant Emotion: Which emotion is most prevalent?\n"
+                "14. Confidence: Rate analysis confidence from 0.0 to 1.0\n\n"
+                "Format your response with labels:\n"
+                "Format: [answer]\n"
+                "Narration: [yes/no]\n"
+                "Underscore: [yes/no]\n"
+                "Sound Effects: [yes/no]\n"
+                "Songs Count: [number]\n"
+                "Characters Mentioned: [comma-separated list]\n"
+                "Speaking Characters: [comma-separated list]\n"
+                "Environments: [comma-separated list]\n"
+                "Themes: [comma-separated list]\n"
+                "Duration: [HH:MM:SS]\n"
+                "Emotions: {'joy': [0-1], 'sadness': [0-1], 'anger': [0-1], 'fear': [0-1], 'surprise': [0-1]}\n"
+                "Tone Analysis: [description]\n"
+                "Dominant Emotion: [emotion]\n"
+                "Confidence: [0-1]"
+            )
+
+        logger.info("Sending analysis request to Gemini")
+        response = await self._generate_async([file, prompt])
+
+        # Log the raw response
+        logger.info("Received response from Gemini")
+        logger.debug(f"Raw response:\n{response.text}")
+        if cache_key:
+            await self._cache_put_async(cache_key, response.text)
+        return response.text
+
     def _clean_list_string(self, value_str: str) -> list:
         """Clean and parse a string into a list, handling various formats."""
         if not value_str:
@@ -372,8 +607,13 @@ class GeminiAnalyzer:
                 "Format your response as: Summary: [your summary here]"
             )
 
+            cache_key = self._cache_key('summary', prompt)
+            cached = self._cache_get(cache_key)
+            if cached is not None:
+                return {'summary': cached}
+
             logger.info("Sending summary request to Gemini")
-            response = self.chat.send_message(prompt)
+            response = self.retry.call(self.chat.send_message, prompt, request_options=self._request_options())
             logger.debug(f"Raw response:\n{response.text}")
 
             # Extract summary from response
@@ -381,25 +621,83 @@ class GeminiAnalyzer:
             if 'Summary:' in summary_text:
                 summary_text = summary_text.split('Summary:', 1)[1].strip()
 
+            self._cache_put(cache_key, summary_text)
             return {'summary': summary_text}
 
         except Exception as e:
             logger.error(f"Error generating summary: {str(e)}")
             raise ValueError(f"Error generating summary: {str(e)}")
 
+    EMOTIONS = ('joy', 'sadness', 'anger', 'fear', 'surprise')
+
+    def _emotion_content(self, analysis_dict: Dict[str, Any]) -> str:
+        """Construct content for emotion analysis from available data."""
+        return (
+            f"Title: {analysis_dict.get('title', 'Unknown')}\n"
+            f"Characters: {', '.join(analysis_dict.get('characters_mentioned', []))}\n"
+            f"Themes: {', '.join(analysis_dict.get('themes', []))}\n"
+            f"Environment: {', '.join(analysis_dict.get('environments', []))}\n"
+            f"Summary: {analysis_dict.get('summary', '')}"
+        )
+
+    def _extract_json(self, response_text: str) -> Any:
+        """Parse JSON from a response, stripping Markdown code fences."""
+        if "```json" in response_text:
+            response_text = response_text.split("```json")[1].split("```")[0]
+        elif "```" in response_text:
+            response_text = response_text.split("```")[1]
+        return json.loads(response_text.strip())
+
+    def _normalise_emotion_result(self, analysis_result: Dict[str, Any]) -> Dict[str, Any]:
+        """Fill in defaults for any fields missing from an emotion analysis."""
+        if 'emotion_scores' not in analysis_result:
+            analysis_result['emotion_scores'] = {
+                'joy': 0.0, 'sadness': 0.0, 'anger': 0.0,
+                'fear': 0.0, 'surprise': 0.0
+            }
+
+        if 'confidence_score' not in analysis_result:
+            analysis_result['confidence_score'] = 0.5
+
+        if 'dominant_emotion' not in analysis_result:
+            # Determine dominant emotion from scores
+            scores = analysis_result['emotion_scores']
+            analysis_result['dominant_emotion'] = max(scores.items(), key=lambda x: x[1])[0]
+
+        if 'tone_analysis' not in analysis_result:
+            analysis_result['tone_analysis'] = {'tone': 'neutral'}
+
+        return analysis_result
+
+    def _is_valid_emotion_result(self, result: Any) -> bool:
+        """Check a per-record emotion analysis has every field in range."""
+        if not isinstance(result, dict):
+            return False
+        scores = result.get('emotion_scores')
+        if not isinstance(scores, dict):
+            return False
+        for emotion in self.EMOTIONS:
+            score = scores.get(emotion)
+            if not isinstance(score, (int, float)) or not 0.0 <= score <= 1.0:
+                return False
+        confidence = result.get('confidence_score')
+        return (
+            isinstance(result.get('dominant_emotion'), str)
+            and isinstance(result.get('tone_analysis'), dict)
+            and isinstance(confidence, (int, float)) and 0.0 <= confidence <= 1.0
+        )
+
     def analyze_emotions(self, analysis_dict: Dict[str, Any]) -> Dict[str, Any]:
         """Analyze emotions for existing content."""
         try:
             logger.info("Starting emotion analysis")
 
-            # Construct content for analysis from available data
-            content = (
-                f"Title: {analysis_dict.get('title', 'Unknown')}\n"
-                f"Characters: {', '.join(analysis_dict.get('characters_mentioned', []))}\n"
-                f"Themes: {', '.join(analysis_dict.get('themes', []))}\n"
-                f"Environment: {', '.join(analysis_dict.get('environments', []))}\n"
-                f"Summary: {analysis_dict.get('summary', '')}"
-            )
+            content = self._emotion_content(analysis_dict)
+
+            cache_key = self._cache_key('emotions', content)
+            cached = self._cache_get(cache_key)
+            if cached is not None:
+                return self._normalise_emotion_result(self._extract_json(cached))
 
             prompt = (
                 "Analyze the emotional content of this audio piece and provide scores for these emotions:\n"
@@ -423,36 +721,13 @@ class GeminiAnalyzer:
             )
 
             logger.info("Sending emotion analysis request to Gemini")
-            response = self.chat.send_message(prompt)
+            response = self.retry.call(self.chat.send_message, prompt, request_options=self._request_options())
             logger.debug(f"Raw response:\n{response.text}")
 
             try:
                 # Try to parse the response as JSON
-                response_text = response.text
-                if "```json" in response_text:
-                    response_text = response_text.split("```json")[1].split("```")[0]
-                elif "```" in response_text:
-                    response_text = response_text.split("```")[1]
-
-                analysis_result = json.loads(response_text.strip())
-
-                # Validate and normalize the results
-                if 'emotion_scores' not in analysis_result:
-                    analysis_result['emotion_scores'] = {
-                        'joy': 0.0, 'sadness': 0.0, 'anger': 0.0,
-                        'fear': 0.0, 'surprise': 0.0
-                    }
-
-                if 'confidence_score' not in analysis_result:
-                    analysis_result['confidence_score'] = 0.5
-
-                if 'dominant_emotion' not in analysis_result:
-                    # Determine dominant emotion from scores
-                    scores = analysis_result['emotion_scores']
-                    analysis_result['dominant_emotion'] = max(scores.items(), key=lambda x: x[1])[0]
-
-                if 'tone_analysis' not in analysis_result:
-                    analysis_result['tone_analysis'] = {'tone': 'neutral'}
+                analysis_result = self._normalise_emotion_result(self._extract_json(response.text))
+                self._cache_put(cache_key, response.text)
 
                 logger.info("Successfully analyzed emotions")
                 return analysis_result
@@ -485,4 +760,123 @@ class GeminiAnalyzer:
 
         except Exception as e:
             logger.error(f"Error regenerating summary: {str(e)}", exc_info=True)
-            raise ValueError(f"Error regenerating summary: {str(e)}")
\ No newline at end of file
+            raise ValueError(f"Error regenerating summary: {str(e)}")
+
+    def _send_packed(self, prompt: str) -> Dict[str, Any]:
+        """Send a packed prompt statelessly and parse the per-record JSON object."""
+        cache_key = self._cache_key('packed', prompt)
+        cached = self._cache_get(cache_key)
+        response_text = cached
+        if cached is None:
+            response = self.retry.call(
+                self.model.generate_content,
+                prompt,
+                request_options=self._request_options(),
+                generation_config={**self.generation_config, 'response_mime_type': 'application/json'}
+            )
+            response_text = response.text
+            logger.debug(f"Raw packed response:\n{response_text}")
+
+        parsed = self._extract_json(response_text)
+        if not isinstance(parsed, dict):
+            raise ValueError("Packed response is not a JSON object keyed by record ID")
+        if cached is None:
+            self._cache_put(cache_key, response_text)
+        return {str(key): value for key, value in parsed.items()}
+
+    def analyze_emotions_packed(self, analysis_dicts: List[Dict[str, Any]]) -> Tuple[Dict[Any, Dict[str, Any]], Dict[Any, str]]:
+        """Analyze emotions for several records in one request.
+
+        Returns a pair of dicts keyed by analysis ID: the results, and the
+        errors for records that still failed after an individual retry.
+        """
+        records = "\n\n".join(
+            f"### Record {analysis_dict['id']}\n{self._emotion_content(analysis_dict)}"
+            for analysis_dict in analysis_dicts
+        )
+        prompt = (
+            "Analyze the emotional content of each audio piece below. For every record provide "
+            "scores from 0.0 to 1.0 for joy, sadness, anger, fear and surprise, the dominant "
+            "(most prevalent) emotion, an overall tone analysis and a confidence score for the "
+            "analysis from 0.0 to 1.0.\n\n"
+            f"{records}\n\n"
+            "Respond with one JSON object whose keys are the record IDs and whose values are:\n"
+            "{'emotion_scores': {'joy': float, 'sadness': float, 'anger': float, 'fear': float, 'surprise': float}, "
+            "'dominant_emotion': string, 'tone_analysis': {'tone': string}, 'confidence_score': float}"
+        )
+
+        logger.info(f"Sending packed emotion analysis request for {len(analysis_dicts)} records")
+        try:
+            packed = self._send_packed(prompt)
+        except Exception as e:
+            logger.warning(f"Packed emotion analysis failed, retrying records individually: {str(e)}")
+            packed = {}
+
+        results, errors = {}, {}
+        for analysis_dict in analysis_dicts:
+            analysis_id = analysis_dict['id']
+            result = packed.get(str(analysis_id))
+            if self._is_valid_emotion_result(result):
+                results[analysis_id] = result
+                continue
+
+            logger.warning(f"Invalid packed emotion result for record {analysis_id}, retrying individually")
+            try:
+                results[analysis_id] = self.analyze_emotions(analysis_dict)
+            except Exception as e:
+                errors[analysis_id] = str(e)
+            finally:
+                self.cleanup()
+        return results, errors
+
+    def regenerate_summaries_packed(self, analysis_dicts: List[Dict[str, Any]]) -> Tuple[Dict[Any, Dict[str, str]], Dict[Any, str]]:
+        """Regenerate summaries from transcripts for several records in one request.
+
+        Returns a pair of dicts keyed by analysis ID: the results, and the
+        errors for records that still failed after an individual retry.
+        """
+        # Long transcripts go through the map-reduce path on their own
+        long_records = [
+            analysis_dict for analysis_dict in analysis_dicts
+            if self._estimate_tokens(analysis_dict.get('transcript') or '') > self.HIERARCHICAL_SUMMARY_TOKENS
+        ]
+        long_ids = {analysis_dict['id'] for analysis_dict in long_records}
+        analysis_dicts = [analysis_dict for analysis_dict in analysis_dicts if analysis_dict['id'] not in long_ids]
+
+        records = "\n\n".join(
+            f"### Record {analysis_dict['id']}\nTranscript:\n{analysis_dict.get('transcript') or ''}"
+            for analysis_dict in analysis_dicts
+        )
+        prompt = (
+            "Generate a concise, focused summary (max 3-4 sentences) of each audio transcript below. "
+            "Focus on core narrative elements, key character moments and the central theme or message, "
+            "and write a natural, flowing summary that captures the essence of the content.\n\n"
+            f"{records}\n\n"
+            "Respond with one JSON object whose keys are the record IDs and whose values are the summaries."
+        )
+
+        packed = {}
+        if analysis_dicts:
+            logger.info(f"Sending packed summary request for {len(analysis_dicts)} records")
+            try:
+                packed = self._send_packed(prompt)
+            except Exception as e:
+                logger.warning(f"Packed summary request failed, retrying records individually: {str(e)}")
+
+        results, errors = {}, {}
+        for analysis_dict in analysis_dicts + long_records:
+            analysis_id = analysis_dict['id']
+            summary = packed.get(str(analysis_id))
+            if isinstance(summary, str) and summary.strip():
+                results[analysis_id] = {'summary': summary.strip()}
+                continue
+
+            if analysis_id not in long_ids:
+                logger.warning(f"Missing packed summary for record {analysis_id}, retrying individually")
+            try:
+                results[analysis_id] = self.regenerate_summary(analysis_dict)
+            except Exception as e:
+                errors[analysis_id] = str(e)
+            finally:
+                self.cleanup()
+        return results, errors
@@ -3,11 +3,13 @@ import logging
 from functools import wraps
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import Flow
-from googleapiclient.discovery import build
 from googleapiclient.http import MediaIoBaseDownload
-from flask import Blueprint, session, redirect, url_for, request, jsonify
-import json
-import io
+from flask import Blueprint, session, redirect, url_for, request, jsonify, send_file, current_app
+from admission import AdmissionRejected
+from drive_client import get_service, list_audio_files, list_changes, start_page_token
+from drive_import import DOWNLOAD_CHUNK_SIZE
+from routes import caller_id, rejection_response
+import tempfile
 
 logger = logging.getLogger(__name__)
 
@@ -32,6 +34,16 @@ def require_drive_auth(f):
         return f(*args, **kwargs)
     return decorated_function
 
+def session_credentials():
+    return Credentials.from_authorized_user_info(session['google_drive_credentials'], SCOPES)
+
+def session_drive_user():
+    """The Drive account the session is authorized as; it owns the folder watches it creates."""
+    if 'google_drive_user' not in session:
+        about = get_service(session_credentials()).about().get(fields='user(permissionId)').execute()
+        session['google_drive_user'] = about['user']['permissionId']
+    return session['google_drive_user']
+
 @google_drive.route('/drive/authorize')
 def authorize():
     try:
@@ -63,6 +75,8 @@ def oauth2callback():
 
         flow.fetch_token(authorization_response=request.url)
         credentials = flow.credentials
+        # May be a different account from the one authorized before
+        session.pop('google_drive_user', None)
         session['google_drive_credentials'] = {
             'token': credentials.token,
             'refresh_token': credentials.refresh_token,
@@ -79,23 +93,24 @@ def oauth2callback():
 @google_drive.route('/drive/files')
 @require_drive_auth
 def list_files():
+    """List audio files, optionally within ?folder_id=.
+
+    The response's sync_token can be passed back as ?since= to get only
+    what was added, modified or removed in the meantime.
+    """
     try:
-        credentials = Credentials.from_authorized_user_info(
-            session['google_drive_credentials'],
-            SCOPES
-        )
-        service = build('drive', 'v3', credentials=credentials)
-
-        # Only list audio files
-        query = "mimeType contains 'audio/' and trashed = false"
-        results = service.files().list(
-            q=query,
-            pageSize=10,
-            fields="files(id, name, mimeType)"
-        ).execute()
-
-        files = results.get('files', [])
-        return jsonify({"files": files})
+        service = get_service(session_credentials())
+        folder_id = request.args.get('folder_id')
+        since = request.args.get('since')
+
+        if since:
+            files, removed, sync_token = list_changes(service, since, folder_id)
+            return jsonify({"files": files, "removed": removed, "sync_token": sync_token, "incremental": True})
+
+        # Taken before listing, so nothing changed during a long listing is missed
+        sync_token = start_page_token(service)
+        files = list_audio_files(service, folder_id)
+        return jsonify({"files": files, "removed": [], "sync_token": sync_token, "incremental": False})
     except Exception as e:
         logger.error(f"Error listing Google Drive files: {str(e)}")
         return jsonify({"error": "Failed to list Google Drive files"}), 500
@@ -104,29 +119,111 @@ def list_files():
 @require_drive_auth
 def download_file(file_id):
     try:
-        credentials = Credentials.from_authorized_user_info(
-            session['google_drive_credentials'],
-            SCOPES
-        )
-        service = build('drive', 'v3', credentials=credentials)
+        service = get_service(session_credentials())
 
         # Get file metadata
-        file_metadata = service.files().get(fileId=file_id).execute()
+        file_metadata = service.files().get(fileId=file_id, fields='name, mimeType').execute()
 
-        # Download file
-        request = service.files().get_media(fileId=file_id)
-        file = io.BytesIO()
-        downloader = MediaIoBaseDownload(file, request)
+        # Spooled to a temp file in chunks rather than held in memory, and sent back as bytes
+        file = tempfile.TemporaryFile()
+        downloader = MediaIoBaseDownload(file, service.files().get_media(fileId=file_id),
+                                         chunksize=DOWNLOAD_CHUNK_SIZE)
         done = False
         while done is False:
             status, done = downloader.next_chunk()
 
         file.seek(0)
-        return jsonify({
-            "success": True,
-            "filename": file_metadata['name'],
-            "content": file.read().decode('utf-8')
-        })
+        return send_file(file, mimetype=file_metadata.get('mimeType') or 'application/octet-stream',
+                         as_attachment=True, download_name=file_metadata['name'])
     except Exception as e:
         logger.error(f"Error downloading file from Google Drive: {str(e)}")
-        return jsonify({"error": "Failed to download file from Google Drive"}), 500
\ No newline at end of file
+        return jsonify({"error": "Failed to download file from Google Drive"}), 500
+
+@google_drive.route('/drive/import', methods=['POST'])
+@require_drive_auth
+def import_files():
+    """Download Drive files on the server and queue them for analysis as a batch.
+
+    Expects {"file_ids": [...]}; responds straight away with the batch's
+    status URL while the files download in the background.
+    """
+    try:
+        file_ids = (request.get_json(silent=True) or {}).get('file_ids') or []
+        if not isinstance(file_ids, list) or not all(isinstance(i, str) and i for i in file_ids):
+            return jsonify({"error": "file_ids must be a list of Drive file IDs"}), 400
+        if not file_ids:
+            return jsonify({"error": "No files selected"}), 400
+
+        credentials = session_credentials()
+        importer = current_app.extensions['drive_importer']
+        batch_id = importer.start(lambda: get_service(credentials), file_ids, caller_id())
+        return jsonify({
+            'batch_id': batch_id,
+            'message': 'Google Drive import started',
+            'status_url': f'/api/upload/batch/{batch_id}/status'
+        }), 202
+    except AdmissionRejected as e:
+        return rejection_response(e)
+    except Exception as e:
+        logger.error(f"Error starting Google Drive import: {str(e)}", exc_info=True)
+        return jsonify({"error": "Failed to start Google Drive import"}), 500
+
+@google_drive.route('/drive/watch', methods=['GET'])
+@require_drive_auth
+def list_watches():
+    try:
+        return jsonify({"watches": current_app.extensions['drive_watcher'].list_watches(session_drive_user())})
+    except Exception as e:
+        logger.error(f"Error listing Google Drive watches: {str(e)}", exc_info=True)
+        return jsonify({"error": "Failed to list Google Drive watches"}), 500
+
+@google_drive.route('/drive/watch', methods=['POST'])
+@require_drive_auth
+def add_watch():
+    """Watch a folder and analyse new audio files dropped into it.
+
+    Expects {"folder_id": ..., "include_existing": true}; with
+    include_existing the audio already in the folder is queued too.
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        folder_id = data.get('folder_id')
+        if not folder_id or not isinstance(folder_id, str):
+            return jsonify({"error": "folder_id is required"}), 400
+        watch = current_app.extensions['drive_watcher'].add_watch(
+            folder_id, session['google_drive_credentials'], session_drive_user(),
+            include_existing=bool(data.get('include_existing', True))
+        )
+        return jsonify(watch), 201
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error adding Google Drive watch: {str(e)}", exc_info=True)
+        return jsonify({"error": "Failed to watch Google Drive folder"}), 500
+
+@google_drive.route('/drive/watch/<watch_id>', methods=['DELETE'])
+@require_drive_auth
+def remove_watch(watch_id):
+    try:
+        watcher = current_app.extensions['drive_watcher']
+        # Other accounts' watches are reported as missing rather than forbidden
+        if not watcher.owns(watch_id, session_drive_user()) or not watcher.remove_watch(watch_id):
+            return jsonify({"error": "Watch not found"}), 404
+        return jsonify({"message": "Watch removed"}), 200
+    except Exception as e:
+        logger.error(f"Error removing Google Drive watch {watch_id}: {str(e)}", exc_info=True)
+        return jsonify({"error": "Failed to remove Google Drive watch"}), 500
+
+@google_drive.route('/drive/watch/<watch_id>/sync', methods=['POST'])
+@require_drive_auth
+def sync_watch(watch_id):
+    """Poll a watched folder now instead of waiting for the next interval."""
+    try:
+        watcher = current_app.extensions['drive_watcher']
+        result = watcher.sync(watch_id) if watcher.owns(watch_id, session_drive_user()) else None
+        if result is None:
+            return jsonify({"error": "Watch not found"}), 404
+        return jsonify(result), 200
+    except Exception as e:
+        logger.error(f"Error syncing Google Drive watch {watch_id}: {str(e)}", exc_info=True)
+        return jsonify({"error": "Failed to sync Google Drive folder"}), 500
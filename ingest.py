@@ -0,0 +1,287 @@
+import json
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Callable, Dict, Iterator, List, Optional, Set
+
+import click
+from werkzeug.utils import secure_filename
+
+from blob_store import BlobStore, file_digest
+from job_scheduler import get_job_scheduler
+from models import AudioAnalysis
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HASH_WORKERS = 8
+DEFAULT_CHUNK_SIZE = 500  # Files per batch; keeps each batch status file small
+DEFAULT_WINDOW = 2  # Batches in flight, so workers never idle at the tail of one
+REPORT_INTERVAL = 30  # Seconds between progress lines
+
+
+def batch_key(path: str, root: str) -> str:
+    """Name a file by its path under root, so same-named files in different folders stay apart."""
+    relative = os.path.relpath(path, root)
+    if relative.startswith(os.pardir):
+        relative = os.path.abspath(path).lstrip(os.sep)
+    return '/'.join(filter(None, (secure_filename(part) for part in relative.split(os.sep))))
+
+
+class BulkIngester:
+    """Feeds local files to the batch engine without going through HTTP.
+
+    Discovery, hashing and storing run ahead of analysis: each chunk of
+    files is hashed in parallel, files whose content has already been
+    analysed are skipped (by file name for analyses made before content
+    hashes were recorded, since those have none), and the rest are linked
+    into the blob store and queued as a batch while the previous chunks
+    are still being analysed.
+    The run is recorded in data/ingest_<run_id>.json so an interrupted run
+    can be resumed without re-hashing what it already queued.
+    """
+
+    def __init__(self, app, batch_manager, blob_store: BlobStore, schedule_batch: Callable,
+                 allowed_file: Callable[[str], bool], hash_workers: int = DEFAULT_HASH_WORKERS,
+                 chunk_size: int = DEFAULT_CHUNK_SIZE, window: int = DEFAULT_WINDOW, weight: float = 1.0):
+        self.app = app
+        self.batch_manager = batch_manager
+        self.blob_store = blob_store
+        self.schedule_batch = schedule_batch
+        self.allowed_file = allowed_file
+        self.hash_workers = hash_workers
+        self.chunk_size = chunk_size
+        self.window = window
+        self.weight = weight
+        self.run: Dict = {}
+        self.counts = {'discovered': 0, 'skipped': 0, 'queued': 0, 'hashed_bytes': 0}
+        self.started = time.time()
+        self.done_at_start = 0  # Files a resumed run had already finished, left out of the rate
+        self.last_report = 0.0
+        self.unhashed: Set[str] = set()  # File names of analyses without a content hash
+
+    def _run_path(self, run_id: str) -> str:
+        return f'data/ingest_{run_id}.json'
+
+    def save_run(self):
+        os.makedirs('data', exist_ok=True)
+        path = self._run_path(self.run['run_id'])
+        with open(f'{path}.tmp', 'w') as f:
+            json.dump(self.run, f)
+        os.replace(f'{path}.tmp', path)
+
+    def load_run(self, run_id: str) -> bool:
+        try:
+            with open(self._run_path(run_id)) as f:
+                self.run = json.load(f)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def discover(self) -> Iterator[str]:
+        """Paths to ingest, from the run's directory or manifest."""
+        if self.run.get('manifest'):
+            with open(self.run['manifest']) as f:
+                for line in f:
+                    line = line.strip()
+                    if line and not line.startswith('#'):
+                        yield os.path.join(self.run['root'], line)
+        else:
+            for dirpath, dirnames, filenames in os.walk(self.run['root']):
+                dirnames.sort()
+                for name in sorted(filenames):
+                    yield os.path.join(dirpath, name)
+
+    def _hash(self, path: str) -> Optional[str]:
+        try:
+            digest = file_digest(path)
+            self.counts['hashed_bytes'] += os.path.getsize(path)
+            return digest
+        except OSError as e:
+            logger.error(f"Cannot read {path}: {str(e)}")
+            return None
+
+    def _queue_chunk(self, executor: ThreadPoolExecutor, paths: List[str], seen: Set[str]):
+        digests = list(executor.map(self._hash, paths))
+        candidates = {d for d in digests if d}
+        with self.app.app_context():
+            analysed = {row[0] for row in AudioAnalysis.query.with_entities(AudioAnalysis.content_hash)
+                        .filter(AudioAnalysis.content_hash.in_(candidates))} if candidates else set()
+
+        files: Dict[str, str] = {}
+        for path, digest in zip(paths, digests):
+            key = batch_key(path, self.run['root'])
+            if (digest is None or digest in analysed or digest in seen or key in files
+                    or key.rsplit('/', 1)[-1] in self.unhashed):
+                self.counts['skipped'] += 1
+                continue
+            seen.add(digest)
+            files[key] = path
+        if not files:
+            return
+
+        # Hard-linked when the source is on the same filesystem as the store, so no copy is made
+        keys = list(files)
+        by_path = dict(zip(paths, digests))
+        blobs = dict(zip(keys, executor.map(
+            lambda key: self.blob_store.put_file(files[key], digest=by_path[files[key]]), keys
+        )))
+        batch_id = self.batch_manager.create_batch(keys, blobs=blobs, weight=self.weight)
+        status = self.batch_manager.get_batch_status(batch_id)
+        for key, path in files.items():
+            status['files'][key]['source'] = path
+        self.batch_manager.save_batch_status(batch_id)
+
+        self.run['batches'].append(batch_id)
+        self.save_run()
+        self.schedule_batch(self.app, batch_id)
+        self.counts['queued'] += len(keys)
+
+    def _active(self) -> List[str]:
+        return [b for b in self.run['batches'] if self.batch_manager.has_outstanding_files(b)]
+
+    def _wait_for_window(self, limit: int):
+        while len(self._active()) > limit:
+            self.report()
+            time.sleep(1)
+
+    def _tally(self):
+        done = failed = remaining = 0
+        for batch_id in self.run['batches']:
+            for file_status in self.batch_manager.get_batch_status(batch_id).get('files', {}).values():
+                if file_status['status'] == 'completed':
+                    done += 1
+                elif file_status['status'] in ('failed', 'cancelled'):
+                    failed += 1
+                else:
+                    remaining += 1
+        return done, failed, remaining
+
+    def report(self, force: bool = False):
+        """Print throughput, at most every REPORT_INTERVAL seconds unless forced."""
+        now = time.time()
+        if not force and now - self.last_report < REPORT_INTERVAL:
+            return
+        self.last_report = now
+        done, failed, remaining = self._tally()
+        elapsed = max(now - self.started, 1e-6)
+        rate = (done - self.done_at_start) / elapsed * 3600
+        # Files not yet discovered aren't counted, so this is a lower bound until the scan completes
+        eta = f"{remaining / rate:.1f}h" if rate else 'unknown'
+        click.echo(
+            f"[{datetime.now().strftime('%H:%M:%S')}] discovered {self.counts['discovered']}, "
+            f"skipped {self.counts['skipped']}, queued {self.counts['queued']}, analysed {done}, "
+            f"failed {failed}, remaining {remaining} | {rate:.0f} files/h, "
+            f"hashing {self.counts['hashed_bytes'] / elapsed / 1e6:.1f} MB/s, ETA {eta}"
+        )
+
+    def ingest(self, run_id: Optional[str] = None, root: Optional[str] = None,
+               manifest: Optional[str] = None) -> Dict:
+        """Start a new run over root or manifest, or resume run_id, and block until it is analysed."""
+        if run_id:
+            if not self.load_run(run_id):
+                raise click.ClickException(f"No ingest run {run_id}")
+            self._resume_batches()
+            self.done_at_start = self._tally()[0]
+        else:
+            source = os.path.abspath(manifest or root)
+            self.run = {
+                'run_id': datetime.now().strftime('%Y%m%d_%H%M%S'),
+                'root': os.path.dirname(source) if manifest else source,
+                'manifest': source if manifest else None,
+                'batches': [],
+                'scan_complete': False,
+                'started_at': datetime.now().isoformat()
+            }
+            self.save_run()
+        click.echo(f"Ingest run {self.run['run_id']} (resume with: flask ingest --resume {self.run['run_id']})")
+
+        if not self.run['scan_complete']:
+            self._scan()
+        self._wait_for_window(0)
+        self.run['completed_at'] = datetime.now().isoformat()
+        self.save_run()
+        self.report(force=True)
+        return self.run
+
+    def _resume_batches(self):
+        """Reload the run's batches and queue whatever was still outstanding."""
+        for batch_id in self.run['batches']:
+            if not self.batch_manager.load_batch_status(batch_id):
+                continue
+            status = self.batch_manager.get_batch_status(batch_id)
+            for file_status in status['files'].values():
+                # Files that were mid-analysis when the run stopped start again
+                if file_status['status'] == 'processing':
+                    file_status['status'] = 'pending'
+            self.batch_manager.save_batch_status(batch_id)
+            self.schedule_batch(self.app, batch_id)
+
+    def _queued_sources(self) -> Set[str]:
+        return {
+            file_status.get('source')
+            for batch_id in self.run['batches']
+            for file_status in self.batch_manager.get_batch_status(batch_id).get('files', {}).values()
+        }
+
+    def _unhashed_filenames(self) -> Set[str]:
+        """Names of analyses from before content hashing; uploads stored them as bare file names."""
+        with self.app.app_context():
+            return {filename for filename, in AudioAnalysis.query.with_entities(AudioAnalysis.filename)
+                    .filter(AudioAnalysis.content_hash.is_(None))}
+
+    def _scan(self):
+        queued_sources = self._queued_sources()
+        self.unhashed = self._unhashed_filenames()
+        seen: Set[str] = set()
+        with ThreadPoolExecutor(max_workers=self.hash_workers, thread_name_prefix='ingest-hash') as executor:
+            chunk: List[str] = []
+            for path in self.discover():
+                if path in queued_sources or not os.path.isfile(path) or not self.allowed_file(path):
+                    continue
+                self.counts['discovered'] += 1
+                chunk.append(path)
+                if len(chunk) >= self.chunk_size:
+                    # Hash the next chunk only once there's room for it, so blobs aren't held for hours
+                    self._wait_for_window(self.window - 1)
+                    self._queue_chunk(executor, chunk, seen)
+                    chunk = []
+                self.report()
+            if chunk:
+                self._wait_for_window(self.window - 1)
+                self._queue_chunk(executor, chunk, seen)
+        self.run['scan_complete'] = True
+        self.save_run()
+
+
+def register_ingest_command(app, batch_manager, blob_store: BlobStore, schedule_batch: Callable,
+                            allowed_file: Callable[[str], bool]):
+    """Add `flask ingest` to the app's CLI."""
+
+    @app.cli.command('ingest')
+    @click.argument('directory', required=False, type=click.Path(exists=True, file_okay=False))
+    @click.option('--manifest', type=click.Path(exists=True, dir_okay=False),
+                  help='Text file with one path per line, relative to the manifest.')
+    @click.option('--resume', 'run_id', help='Continue an interrupted run.')
+    @click.option('--hash-workers', default=DEFAULT_HASH_WORKERS, show_default=True)
+    @click.option('--workers', type=int, help='Files analysed at once (default: SCHEDULER_MAX_IN_FLIGHT).')
+    @click.option('--chunk-size', default=DEFAULT_CHUNK_SIZE, show_default=True, help='Files per batch.')
+    @click.option('--weight', default=1.0, show_default=True, help='Fair-share weight of the batches.')
+    def ingest_command(directory, manifest, run_id, hash_workers, workers, chunk_size, weight):
+        """Analyse every supported file under DIRECTORY or listed in --manifest."""
+        if not (directory or manifest or run_id):
+            raise click.UsageError("Give a DIRECTORY, --manifest or --resume")
+        # Nobody is waiting on interactive uploads in this process
+        get_job_scheduler().configure(interactive_workers=0, max_in_flight=workers)
+
+        ingester = BulkIngester(app, batch_manager, blob_store, schedule_batch, allowed_file,
+                                hash_workers=hash_workers, chunk_size=chunk_size, weight=weight)
+        try:
+            ingester.ingest(run_id=run_id, root=directory, manifest=manifest)
+        except KeyboardInterrupt:
+            ingester.save_run()
+            ingester.report(force=True)
+            raise click.ClickException(
+                f"Interrupted; resume with: flask ingest --resume {ingester.run['run_id']}"
+            )
@@ -0,0 +1,296 @@
+import heapq
+import itertools
+import logging
+import os
+import subprocess
+import threading
+import time
+import wave
+from collections import deque
+from concurrent.futures import CancelledError, Future
+from functools import partial
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WORKERS = 4  # Threads preparing and storing files across all batches
+DEFAULT_MAX_IN_FLIGHT = 256  # Batch files being analysed at once, mostly awaiting the network
+DEFAULT_INTERACTIVE_WORKERS = 1  # Of those, workers that only take interactive uploads
+BYTES_PER_SECOND_ESTIMATE = 16000  # ~128 kbit/s, for files whose duration can't be probed
+PROBE_TIMEOUT = 10
+INTERACTIVE = 'interactive'
+
+
+def probe_duration(path: str) -> Optional[float]:
+    """Media duration in seconds from the file header, or None if it can't be read."""
+    try:
+        if os.path.splitext(path)[1].lower() == '.wav':
+            with wave.open(path, 'rb') as wav:
+                return wav.getnframes() / float(wav.getframerate())
+        result = subprocess.run(
+            ['ffprobe', '-v', 'error', '-show_entries', 'format=duration',
+             '-of', 'default=noprint_wrappers=1:nokey=1', path],
+            capture_output=True, text=True, timeout=PROBE_TIMEOUT, check=True
+        )
+        return float(result.stdout.strip())
+    except (OSError, ValueError, EOFError, wave.Error, subprocess.SubprocessError):
+        return None
+
+
+def estimate_cost(path: str) -> float:
+    """Estimated work for a file in seconds of media: its probed duration, else a guess from its size."""
+    duration = probe_duration(path)
+    if duration is not None:
+        return duration
+    try:
+        return os.path.getsize(path) / BYTES_PER_SECOND_ESTIMATE
+    except OSError:
+        return 0.0
+
+
+class _Job:
+    __slots__ = ('owner', 'fn', 'cost', 'not_before', 'seq', 'future')
+
+    def __init__(self, owner: str, fn: Callable[[], Any], cost: float, not_before: float, seq: int):
+        self.owner = owner
+        self.fn = fn
+        self.cost = cost
+        self.not_before = not_before
+        self.seq = seq
+        self.future: Future = Future()
+
+
+class _Owner:
+    """Queued jobs of one batch, shortest first, and its share of the workers."""
+
+    def __init__(self, weight: float, virtual_time: float):
+        self.weight = weight
+        self.virtual_time = virtual_time  # Cost dispatched so far, divided by weight
+        self.ready: List[Tuple[float, int, _Job]] = []  # Heap by estimated cost
+        self.delayed: List[_Job] = []  # Waiting out a retry backoff
+        self.running = 0
+
+    def queued(self) -> int:
+        return len(self.ready) + len(self.delayed)
+
+
+class JobScheduler:
+    """Shortest-job-first within a batch, fair share across batches.
+
+    Each batch (owner) keeps its queued files in a heap ordered by
+    estimated cost. Workers pick the ready owner that has used the least
+    cost relative to its weight (stride scheduling), so a small upload gets
+    its turn straight away rather than queueing behind a large import.
+    Interactive jobs skip the queues, and some workers take nothing else,
+    so a single upload never waits behind batch work.
+
+    A job may hand its work off by returning a Future, e.g. an analysis
+    running on the analysis event loop. The worker thread moves on to the
+    next job straight away, while the job keeps its place in its owner's
+    running count until that future is done; at most max_in_flight batch
+    jobs run at once.
+    """
+
+    def __init__(self, workers: int = DEFAULT_WORKERS, interactive_workers: int = DEFAULT_INTERACTIVE_WORKERS,
+                 max_in_flight: int = DEFAULT_MAX_IN_FLIGHT):
+        self.workers = max(1, workers)
+        self.interactive_workers = min(max(0, interactive_workers), self.workers - 1)
+        self.max_in_flight = max(1, max_in_flight)
+        self.in_flight = 0  # Batch jobs taken and not yet done, including handed-off ones
+        self._cond = threading.Condition()
+        self._interactive: Deque[_Job] = deque()
+        self._owners: Dict[str, _Owner] = {}
+        self._virtual_time = 0.0
+        self._seq = itertools.count()
+        self._threads: List[threading.Thread] = []
+        self.completed = 0
+        self.failed = 0
+
+    def _ensure_started(self):
+        if self._threads:
+            return
+        for i in range(self.workers):
+            interactive_only = i < self.interactive_workers
+            thread = threading.Thread(target=self._run, args=(interactive_only,),
+                                      name=f'job-scheduler-{i}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logger.info(f"Started job scheduler with {self.workers} workers "
+                    f"({self.interactive_workers} reserved for interactive uploads)")
+
+    def configure(self, interactive_workers: Optional[int] = None, max_in_flight: Optional[int] = None):
+        """Change the limits; the interactive workers can only change before the workers start."""
+        with self._cond:
+            if interactive_workers is not None:
+                interactive_workers = min(max(0, interactive_workers), self.workers - 1)
+                if self._threads and interactive_workers != self.interactive_workers:
+                    raise RuntimeError("The scheduler's workers have already started")
+                self.interactive_workers = interactive_workers
+            if max_in_flight is not None:
+                self.max_in_flight = max(1, max_in_flight)
+                self._cond.notify_all()
+
+    def submit(self, owner: str, fn: Callable[[], Any], cost: float = 0.0,
+               not_before: Optional[float] = None, weight: float = 1.0) -> Future:
+        """Queue fn under owner; not_before (a time.time() value) delays it, e.g. for a retry."""
+        with self._cond:
+            self._ensure_started()
+            job = _Job(owner, fn, max(0.0, cost), not_before or 0.0, next(self._seq))
+            state = self._owners.get(owner)
+            if state is None:
+                # A new batch starts level with the others rather than owed their whole history
+                state = self._owners[owner] = _Owner(weight, self._virtual_time)
+            state.weight = weight
+            if job.not_before > time.time():
+                state.delayed.append(job)
+            else:
+                heapq.heappush(state.ready, (job.cost, job.seq, job))
+            self._cond.notify_all()
+        return job.future
+
+    def submit_interactive(self, fn: Callable[[], Any]) -> Future:
+        """Run fn ahead of all batch work, for a user waiting on the response."""
+        with self._cond:
+            self._ensure_started()
+            job = _Job(INTERACTIVE, fn, 0.0, 0.0, next(self._seq))
+            self._interactive.append(job)
+            self._cond.notify_all()
+        return job.future
+
+    def cancel_owner(self, owner: str) -> int:
+        """Drop an owner's queued jobs; returns how many were removed. Running jobs are left alone."""
+        with self._cond:
+            state = self._owners.get(owner)
+            if state is None:
+                return 0
+            jobs = [job for _, _, job in state.ready] + state.delayed
+            state.ready, state.delayed = [], []
+            self._forget_if_idle(owner)
+        for job in jobs:
+            job.future.cancel()
+        return len(jobs)
+
+    def _forget_if_idle(self, owner: str):
+        state = self._owners.get(owner)
+        if state is not None and not state.running and not state.queued():
+            del self._owners[owner]
+
+    def _take(self, interactive_only: bool) -> Tuple[Optional[_Job], Optional[float]]:
+        """Next job to run, or None with how long to wait before looking again."""
+        if self._interactive:
+            return self._interactive.popleft(), None
+        if interactive_only or self.in_flight >= self.max_in_flight:
+            return None, None
+
+        now = time.time()
+        best, wake = None, None
+        for state in self._owners.values():
+            for job in [j for j in state.delayed if j.not_before <= now]:
+                state.delayed.remove(job)
+                heapq.heappush(state.ready, (job.cost, job.seq, job))
+            if state.delayed:
+                due = min(j.not_before for j in state.delayed) - now
+                wake = due if wake is None else min(wake, due)
+            if state.ready and (best is None or state.virtual_time < best.virtual_time):
+                best = state
+        if best is None:
+            return None, wake
+
+        _, _, job = heapq.heappop(best.ready)
+        # Charge at least a second so zero-cost jobs still rotate between owners
+        best.virtual_time += max(job.cost, 1.0) / best.weight
+        self._virtual_time = max(self._virtual_time, min(s.virtual_time for s in self._owners.values()))
+        best.running += 1
+        self.in_flight += 1
+        return job, None
+
+    def _run(self, interactive_only: bool):
+        while True:
+            with self._cond:
+                job, wait = self._take(interactive_only)
+                while job is None:
+                    self._cond.wait(wait)
+                    job, wait = self._take(interactive_only)
+
+            if not job.future.set_running_or_notify_cancel():
+                self._release(job)
+                continue
+            try:
+                result = job.fn()
+            except BaseException as e:
+                self._finish(job, exception=e)
+                continue
+            if isinstance(result, Future):
+                # Handed off; the job holds its slot until the work is done
+                result.add_done_callback(partial(self._handed_off_done, job))
+            else:
+                self._finish(job, result=result)
+
+    def _handed_off_done(self, job: _Job, future: Future):
+        if future.cancelled():
+            self._finish(job, exception=CancelledError())
+        elif future.exception() is not None:
+            self._finish(job, exception=future.exception())
+        else:
+            self._finish(job, result=future.result())
+
+    def _finish(self, job: _Job, result: Any = None, exception: Optional[BaseException] = None):
+        if exception is not None:
+            self.failed += 1
+            job.future.set_exception(exception)
+        else:
+            self.completed += 1
+            job.future.set_result(result)
+        self._release(job)
+
+    def _release(self, job: _Job):
+        with self._cond:
+            state = self._owners.get(job.owner)  # Interactive jobs have no owner state
+            if state is not None:
+                state.running -= 1
+                self.in_flight -= 1
+                self._forget_if_idle(job.owner)
+                self._cond.notify_all()
+
+    def pending(self, owner: str) -> int:
+        """Queued plus running jobs for an owner."""
+        with self._cond:
+            state = self._owners.get(owner)
+            return state.queued() + state.running if state else 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                'workers': self.workers,
+                'interactive_workers': self.interactive_workers,
+                'interactive_queued': len(self._interactive),
+                'max_in_flight': self.max_in_flight,
+                'in_flight': self.in_flight,
+                'completed': self.completed,
+                'failed': self.failed,
+                'owners': {
+                    owner: {
+                        'queued': state.queued(),
+                        'running': state.running,
+                        'weight': state.weight,
+                        'virtual_time': round(state.virtual_time, 2)
+                    } for owner, state in self._owners.items()
+                }
+            }
+
+
+_scheduler: Optional[JobScheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def get_job_scheduler() -> JobScheduler:
+    """Return the process-wide scheduler, sized by SCHEDULER_WORKERS and SCHEDULER_MAX_IN_FLIGHT."""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = JobScheduler(
+                workers=int(os.environ.get('SCHEDULER_WORKERS', DEFAULT_WORKERS)),
+                interactive_workers=int(os.environ.get('SCHEDULER_INTERACTIVE_WORKERS', DEFAULT_INTERACTIVE_WORKERS)),
+                max_in_flight=int(os.environ.get('SCHEDULER_MAX_IN_FLIGHT', DEFAULT_MAX_IN_FLIGHT))
+            )
+        return _scheduler
@@ -0,0 +1,138 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_PATH = os.path.join('data', 'llm_cache.sqlite3')
+DEFAULT_MAX_ENTRIES = 20000
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024  # 256MB of cached response text
+
+
+def content_hash(*parts: Any) -> str:
+    """Stable SHA-256 over JSON-serialisable parts."""
+    payload = json.dumps(parts, sort_keys=True, default=str, separators=(',', ':'))
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    """Size-bounded, on-disk LRU cache of model responses backed by SQLite."""
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, max_entries: int = DEFAULT_MAX_ENTRIES,
+                 max_bytes: int = DEFAULT_MAX_BYTES):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ix_responses_last_access ON responses (last_access)")
+        self._entries, self._bytes = self._conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()
+        logger.info(f"Opened LLM response cache at {path} with {self._entries} entries")
+
+    @staticmethod
+    def make_key(model_name: str, generation_config: Dict[str, Any], template: str,
+                 template_version: int, *inputs: Any) -> str:
+        """Key a response by model, generation config, prompt template version and input hash."""
+        return content_hash(model_name, generation_config, template, template_version, content_hash(*inputs))
+
+    def get(self, key: str) -> Optional[str]:
+        """Return a cached response and mark it as recently used."""
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (time.time(), key))
+            self.hits += 1
+            return row[0]
+
+    def put(self, key: str, value: str):
+        """Store a response, evicting least recently used entries past the size bounds."""
+        size = len(value.encode('utf-8'))
+        with self._lock:
+            previous = self._conn.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, size, last_access) VALUES (?, ?, ?, ?)",
+                (key, value, size, time.time())
+            )
+            if previous:
+                self._bytes -= previous[0]
+            else:
+                self._entries += 1
+            self._bytes += size
+            self._evict()
+
+    def _evict(self):
+        while self._entries > self.max_entries or (self._bytes > self.max_bytes and self._entries > 1):
+            batch = max(1, self._entries // 20)
+            rows = self._conn.execute(
+                "SELECT key, size FROM responses ORDER BY last_access LIMIT ?", (batch,)
+            ).fetchall()
+            if not rows:
+                break
+            self._conn.executemany("DELETE FROM responses WHERE key = ?", [(key,) for key, _ in rows])
+            self._entries -= len(rows)
+            self._bytes -= sum(size for _, size in rows)
+            self.evictions += len(rows)
+
+    def clear(self):
+        """Remove every cached response."""
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._entries = 0
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters and current size of the cache."""
+        lookups = self.hits + self.misses
+        return {
+            'entries': self._entries,
+            'bytes': self._bytes,
+            'max_entries': self.max_entries,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+            'enabled': cache_enabled()
+        }
+
+
+_cache: Optional[ResponseCache] = None
+_cache_lock = threading.Lock()
+
+
+def cache_enabled() -> bool:
+    """The cache can be switched off process-wide with LLM_CACHE_DISABLED=1."""
+    return os.environ.get('LLM_CACHE_DISABLED', '').lower() not in ('1', 'true', 'yes')
+
+
+def get_response_cache() -> ResponseCache:
+    """Return the process-wide response cache, opening it on first use."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResponseCache(
+                path=os.environ.get('LLM_CACHE_PATH', DEFAULT_CACHE_PATH),
+                max_entries=int(os.environ.get('LLM_CACHE_MAX_ENTRIES', DEFAULT_MAX_ENTRIES)),
+                max_bytes=int(os.environ.get('LLM_CACHE_MAX_BYTES', DEFAULT_MAX_BYTES))
+            )
+        return _cache
@@ -0,0 +1,33 @@
+"""Add versioning and cached API representation
+
+Revision ID: 8b1f2c4d9e10
+Revises: 3627df3c65a6
+Create Date: 2026-10-19 09:12:40.118203
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8b1f2c4d9e10'
+down_revision = '3627df3c65a6'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('audio_analyses', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('updated_at', sa.DateTime(), nullable=True))
+        batch_op.add_column(sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+        batch_op.add_column(sa.Column('api_json', sa.Text(), nullable=True))
+
+    # Existing rows are serialised by d6b2f8e4a1c7, once their fields are JSONB
+    op.execute("UPDATE audio_analyses SET updated_at = created_at")
+
+
+def downgrade():
+    with op.batch_alter_table('audio_analyses', schema=None) as batch_op:
+        batch_op.drop_column('api_json')
+        batch_op.drop_column('version')
+        batch_op.drop_column('updated_at')
@@ -0,0 +1,31 @@
+"""Add running totals for the dashboard
+
+Revision ID: a9c4e2f7d1b3
+Revises: f3a8c1d6e2b7
+Create Date: 2026-10-19 14:20:51.807342
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a9c4e2f7d1b3'
+down_revision = 'f3a8c1d6e2b7'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Filled from the existing analyses the first time the dashboard is read
+    op.create_table('dashboard_aggregates',
+    sa.Column('metric', sa.String(length=50), nullable=False),
+    sa.Column('key', sa.Text(), nullable=False),
+    sa.Column('count', sa.BigInteger(), nullable=False),
+    sa.Column('total', sa.Float(), nullable=False),
+    sa.PrimaryKeyConstraint('metric', 'key')
+    )
+
+
+def downgrade():
+    op.drop_table('dashboard_aggregates')
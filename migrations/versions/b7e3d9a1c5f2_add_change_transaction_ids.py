@@ -0,0 +1,33 @@
+"""Record the writing transaction of each change for a commit-safe feed cursor
+
+Revision ID: b7e3d9a1c5f2
+Revises: a9c4e2f7d1b3
+Create Date: 2026-10-19 15:41:09.263518
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7e3d9a1c5f2'
+down_revision = 'a9c4e2f7d1b3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Existing changes sort before every transaction, so a sync from 0 still returns them
+    for table in ('audio_analyses', 'analysis_tombstones'):
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.add_column(sa.Column('change_xid', sa.BigInteger(), nullable=True))
+        op.execute(f"UPDATE {table} SET change_xid = 0")
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.create_index(batch_op.f(f'ix_{table}_change_xid'), ['change_xid'], unique=False)
+
+
+def downgrade():
+    for table in ('analysis_tombstones', 'audio_analyses'):
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.drop_index(batch_op.f(f'ix_{table}_change_xid'))
+            batch_op.drop_column('change_xid')
@@ -0,0 +1,60 @@
+"""Add change feed cursor and deletion tombstones
+
+Revision ID: c47e9a1b3f52
+Revises: 8b1f2c4d9e10
+Create Date: 2026-10-19 11:03:27.541920
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c47e9a1b3f52'
+down_revision = '8b1f2c4d9e10'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute(sa.schema.CreateSequence(sa.Sequence('audio_analyses_change_seq')))
+
+    with op.batch_alter_table('audio_analyses', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('change_seq', sa.BigInteger(), nullable=True))
+
+    # Existing rows enter the feed in creation order
+    op.execute("""
+        UPDATE audio_analyses a
+        SET change_seq = o.seq
+        FROM (
+            SELECT id, nextval('audio_analyses_change_seq') AS seq
+            FROM (SELECT id FROM audio_analyses ORDER BY created_at, id) ordered
+        ) o
+        WHERE a.id = o.id
+    """)
+
+    with op.batch_alter_table('audio_analyses', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_audio_analyses_change_seq'), ['change_seq'], unique=False)
+
+    op.create_table('analysis_tombstones',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('analysis_id', sa.Integer(), nullable=False),
+    sa.Column('change_seq', sa.BigInteger(), nullable=False),
+    sa.Column('deleted_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('analysis_tombstones', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_analysis_tombstones_change_seq'), ['change_seq'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('analysis_tombstones', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_analysis_tombstones_change_seq'))
+
+    op.drop_table('analysis_tombstones')
+
+    with op.batch_alter_table('audio_analyses', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_audio_analyses_change_seq'))
+        batch_op.drop_column('change_seq')
+
+    op.execute(sa.schema.DropSequence(sa.Sequence('audio_analyses_change_seq')))
@@ -0,0 +1,62 @@
+"""Serialise the cached API representation of rows written before it existed
+
+Revision ID: d6b2f8e4a1c7
+Revises: b7e3d9a1c5f2
+Create Date: 2026-10-19 17:05:31.482096
+
+"""
+import json
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd6b2f8e4a1c7'
+down_revision = 'b7e3d9a1c5f2'
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 1000
+LIST_FIELDS = ['environments', 'characters_mentioned', 'speaking_characters', 'themes']
+OBJECT_FIELDS = ['emotion_scores', 'tone_analysis']
+
+
+def _serialise(row):
+    # A copy of AudioAnalysis.to_dict as of this revision, so later model changes don't alter the migration.
+    # Runs after the JSONB conversion, so list and object fields already hold what the app would parse.
+    analysis = dict(row)
+    for field in LIST_FIELDS:
+        analysis[field] = analysis[field] if isinstance(analysis[field], list) else []
+    for field in OBJECT_FIELDS:
+        analysis[field] = analysis[field] if isinstance(analysis[field], dict) else {}
+    for field in ('created_at', 'updated_at'):
+        analysis[field] = analysis[field].isoformat() if analysis[field] else None
+    return json.dumps(analysis, separators=(',', ':'))
+
+
+def upgrade():
+    # Until now these rows were serialised on every read until their next write
+    bind = op.get_bind()
+    columns = ['id', 'title', 'filename', 'file_type', 'format', 'duration', 'has_narration', 'has_underscore',
+               'has_sound_effects', 'songs_count', 'environments', 'characters_mentioned', 'speaking_characters',
+               'themes', 'summary', 'emotion_scores', 'dominant_emotion', 'tone_analysis', 'confidence_score',
+               'created_at', 'updated_at', 'version']
+    # summary was never added by a migration, so a database built from them alone lacks it
+    existing = {column['name'] for column in sa.inspect(bind).get_columns('audio_analyses')}
+    selected = [column if column in existing else f'NULL AS {column}' for column in columns]
+    select = sa.text(f"SELECT {', '.join(selected)} FROM audio_analyses "
+                     f"WHERE api_json IS NULL AND id > :last_id ORDER BY id LIMIT {BATCH_SIZE}")
+    update = sa.text("UPDATE audio_analyses SET api_json = :api_json WHERE id = :id")
+    last_id = 0
+    while True:
+        rows = bind.execute(select, {'last_id': last_id}).mappings().all()
+        if not rows:
+            break
+        bind.execute(update, [{'id': row['id'], 'api_json': _serialise(row)} for row in rows])
+        last_id = rows[-1]['id']
+
+
+def downgrade():
+    # The cached JSON is equally valid at the previous revision
+    pass
@@ -0,0 +1,28 @@
+"""Add content hash of the analysed file
+
+Revision ID: e5d1a7c2b9f4
+Revises: c47e9a1b3f52
+Create Date: 2026-10-19 11:48:02.310457
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5d1a7c2b9f4'
+down_revision = 'c47e9a1b3f52'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('audio_analyses', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('content_hash', sa.String(length=64), nullable=True))
+        batch_op.create_index(batch_op.f('ix_audio_analyses_content_hash'), ['content_hash'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('audio_analyses', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_audio_analyses_content_hash'))
+        batch_op.drop_column('content_hash')
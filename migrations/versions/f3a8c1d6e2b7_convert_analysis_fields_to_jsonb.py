@@ -0,0 +1,79 @@
+"""Store list and emotion fields as JSONB with indexes
+
+Revision ID: f3a8c1d6e2b7
+Revises: e5d1a7c2b9f4
+Create Date: 2026-10-19 13:12:45.204318
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3a8c1d6e2b7'
+down_revision = 'e5d1a7c2b9f4'
+branch_labels = None
+depends_on = None
+
+LIST_FIELDS = ['environments', 'characters_mentioned', 'speaking_characters', 'themes']
+OBJECT_FIELDS = ['emotion_scores', 'tone_analysis']
+EMOTIONS = ['joy', 'sadness', 'anger', 'fear', 'surprise']
+
+
+def upgrade():
+    # Rows written before the app validated its JSON may hold plain text
+    op.execute("""
+        CREATE OR REPLACE FUNCTION pg_temp.try_jsonb(value text) RETURNS jsonb AS $$
+        BEGIN
+            RETURN value::jsonb;
+        EXCEPTION WHEN others THEN
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql IMMUTABLE
+    """)
+
+    for field in LIST_FIELDS:
+        # Same rules as the app used when storing: non-JSON text and scalars become one-item lists
+        op.alter_column('audio_analyses', field, type_=postgresql.JSONB(), existing_type=sa.Text(),
+                        postgresql_using=f"""
+                            CASE
+                                WHEN {field} IS NULL THEN NULL
+                                WHEN btrim({field}) = '' THEN '[]'::jsonb
+                                WHEN pg_temp.try_jsonb({field}) IS NULL THEN jsonb_build_array({field})
+                                WHEN jsonb_typeof(pg_temp.try_jsonb({field})) = 'array' THEN pg_temp.try_jsonb({field})
+                                ELSE jsonb_build_array(pg_temp.try_jsonb({field}))
+                            END""")
+    for field in OBJECT_FIELDS:
+        op.alter_column('audio_analyses', field, type_=postgresql.JSONB(), existing_type=sa.Text(),
+                        postgresql_using=f"""
+                            CASE
+                                WHEN {field} IS NULL THEN NULL
+                                WHEN jsonb_typeof(pg_temp.try_jsonb({field})) = 'object' THEN pg_temp.try_jsonb({field})
+                                ELSE '{{}}'::jsonb
+                            END""")
+    op.execute("DROP FUNCTION pg_temp.try_jsonb(text)")
+
+    # Case-insensitive containment: lower(themes::text)::jsonb @> '["adventure"]'
+    for field in LIST_FIELDS:
+        op.execute(f"CREATE INDEX ix_audio_analyses_{field}_lower ON audio_analyses "
+                   f"USING gin ((lower({field}::text)::jsonb) jsonb_path_ops)")
+    for field in OBJECT_FIELDS:
+        op.execute(f"CREATE INDEX ix_audio_analyses_{field} ON audio_analyses USING gin ({field} jsonb_path_ops)")
+    # Range scans for thresholds such as emotion_scores->'fear' > 0.6
+    for emotion in EMOTIONS:
+        op.execute(f"CREATE INDEX ix_audio_analyses_emotion_{emotion} ON audio_analyses "
+                   f"((emotion_scores -> '{emotion}'))")
+
+
+def downgrade():
+    for emotion in EMOTIONS:
+        op.execute(f"DROP INDEX ix_audio_analyses_emotion_{emotion}")
+    for field in OBJECT_FIELDS:
+        op.execute(f"DROP INDEX ix_audio_analyses_{field}")
+    for field in LIST_FIELDS:
+        op.execute(f"DROP INDEX ix_audio_analyses_{field}_lower")
+
+    for field in LIST_FIELDS + OBJECT_FIELDS:
+        op.alter_column('audio_analyses', field, type_=sa.Text(), existing_type=postgresql.JSONB(),
+                        postgresql_using=f'{field}::text')
@@ -1,10 +1,53 @@
 import logging
 from datetime import datetime
+from sqlalchemy import event, text
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.orm import Session, attributes, object_session
 from database import db
 import json
 
+# Global, monotonic cursor shared by analysis writes and deletion tombstones
+CHANGE_SEQUENCE = db.Sequence('audio_analyses_change_seq', metadata=db.metadata)
+
+
+def current_xid():
+    """The writing transaction's 64-bit ID; feed readers page by it because it is known to be finished."""
+    return db.func.txid_current()
+
+
+def commit_watermark(session):
+    """Oldest transaction still running: every change with a lower change_xid is committed or rolled back.
+
+    Sequence values are drawn at flush, so a change can commit after one
+    with a higher change_seq; paging the feed by change_seq would skip it.
+    """
+    return session.execute(db.text('SELECT txid_snapshot_xmin(txid_current_snapshot())')).scalar()
+
+LIST_FIELDS = ('environments', 'characters_mentioned', 'speaking_characters', 'themes')
+EMOTIONS = ('joy', 'sadness', 'anger', 'fear', 'surprise')
+
+
+def lowered(column):
+    """lower(column::text)::jsonb, the expression the list fields' GIN indexes are built on."""
+    return db.cast(db.func.lower(db.cast(column, db.Text)), JSONB)
+
+
+def emotion_score(emotion):
+    """emotion_scores -> 'emotion', spelled like its index (newer servers would otherwise get a subscript)."""
+    return AudioAnalysis.emotion_scores.op('->', return_type=JSONB)(emotion)
+
 class AudioAnalysis(db.Model):
     __tablename__ = 'audio_analyses'
+    __table_args__ = (
+        # Case-insensitive containment on the list fields, e.g. lowered(themes) @> '["adventure"]'
+        *[db.Index(f'ix_audio_analyses_{field}_lower', db.text(f'(lower({field}::text)::jsonb) jsonb_path_ops'),
+                   postgresql_using='gin') for field in LIST_FIELDS],
+        db.Index('ix_audio_analyses_emotion_scores', db.text('emotion_scores jsonb_path_ops'), postgresql_using='gin'),
+        db.Index('ix_audio_analyses_tone_analysis', db.text('tone_analysis jsonb_path_ops'), postgresql_using='gin'),
+        # Threshold filters, e.g. emotion_scores -> 'fear' > 0.6
+        *[db.Index(f'ix_audio_analyses_emotion_{emotion}', db.text(f"(emotion_scores -> '{emotion}')"))
+          for emotion in EMOTIONS],
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(255), nullable=False)
@@ -16,20 +59,27 @@ class AudioAnalysis(db.Model):
     has_underscore = db.Column(db.Boolean, default=False)
     has_sound_effects = db.Column(db.Boolean, default=False)
     songs_count = db.Column(db.Integer, default=0)
-    environments = db.Column(db.Text)  # Store as JSON string
-    characters_mentioned = db.Column(db.Text)  # Store as JSON string
-    speaking_characters = db.Column(db.Text)  # Store as JSON string
-    themes = db.Column(db.Text)  # Store as JSON string
+    environments = db.Column(JSONB)  # List of strings
+    characters_mentioned = db.Column(JSONB)  # List of strings
+    speaking_characters = db.Column(JSONB)  # List of strings
+    themes = db.Column(JSONB)  # List of strings
     transcript = db.Column(db.Text)  # Store audio transcript
     summary = db.Column(db.Text)  # Store episode summary
     # Emotion analysis fields
-    emotion_scores = db.Column(db.Text)  # Store as JSON string with scores for each emotion
+    emotion_scores = db.Column(JSONB)  # Score for each emotion
     dominant_emotion = db.Column(db.String(50))  # Primary detected emotion
-    tone_analysis = db.Column(db.Text)  # Store as JSON string with tone characteristics
+    tone_analysis = db.Column(JSONB)  # Tone characteristics
     confidence_score = db.Column(db.Float)  # Analysis confidence level
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    version = db.Column(db.Integer, nullable=False, default=1)  # Bumped on every write
+    api_json = db.Column(db.Text)  # Cached to_dict() JSON, regenerated on write
+    change_seq = db.Column(db.BigInteger, CHANGE_SEQUENCE, index=True)  # Change feed order
+    change_xid = db.Column(db.BigInteger, default=current_xid(), index=True)  # Change feed cursor, see commit_watermark
+    content_hash = db.Column(db.String(64), index=True)  # SHA-256 of the analysed file in the blob store
 
-    def _parse_list_field(self, value):
+    @staticmethod
+    def _parse_list_field(value):
         """Parse a field that should contain a list."""
         if not value:
             return []
@@ -75,7 +125,9 @@ class AudioAnalysis(db.Model):
                 'dominant_emotion': self.dominant_emotion,
                 'tone_analysis': self._parse_json_field(self.tone_analysis),
                 'confidence_score': self.confidence_score,
-                'created_at': self.created_at.isoformat() if self.created_at else None
+                'created_at': self.created_at.isoformat() if self.created_at else None,
+                'updated_at': self.updated_at.isoformat() if self.updated_at else None,
+                'version': self.version
             }
         except Exception as e:
             logging.error(f"Error in to_dict: {str(e)}")
@@ -99,5 +151,92 @@ class AudioAnalysis(db.Model):
                 'dominant_emotion': None,
                 'tone_analysis': {},
                 'confidence_score': None,
-                'created_at': self.created_at.isoformat() if self.created_at else None
-            }
\ No newline at end of file
+                'created_at': self.created_at.isoformat() if self.created_at else None,
+                'updated_at': self.updated_at.isoformat() if self.updated_at else None,
+                'version': self.version
+            }
+
+    def serialise(self):
+        """Serialise the API representation to a JSON string."""
+        return json.dumps(self.to_dict(), separators=(',', ':'))
+
+    def to_json(self):
+        """Return the cached API representation, serialising it if missing."""
+        return self.api_json or self.serialise()
+
+    def touch(self):
+        """Mark the row as changed so its version and cached JSON are refreshed."""
+        attributes.flag_modified(self, 'updated_at')
+
+
+@event.listens_for(AudioAnalysis, 'before_update')
+def _refresh_on_update(mapper, connection, target):
+    """Bump the version and re-serialise before an update is flushed."""
+    session = object_session(target)
+    if session is not None and not session.is_modified(target, include_collections=False):
+        return
+    target.updated_at = datetime.utcnow()
+    target.version = (target.version or 0) + 1
+    target.change_seq = CHANGE_SEQUENCE.next_value()
+    target.change_xid = current_xid()
+    target.api_json = target.serialise()
+
+
+@event.listens_for(Session, 'before_flush')
+def _serialise_new(session, flush_context, instances):
+    """Serialise new analyses into their INSERT, taking their IDs from the sequence in one query."""
+    new = [obj for obj in session.new if isinstance(obj, AudioAnalysis)]
+    if not new:
+        return
+    # Numbered in the order they were added, as the INSERTs would have been
+    missing = sorted((analysis for analysis in new if analysis.id is None),
+                     key=lambda analysis: attributes.instance_state(analysis).insert_order)
+    if missing:
+        ids = session.execute(text("SELECT nextval('audio_analyses_id_seq') FROM generate_series(1, :count)"),
+                              {'count': len(missing)}).scalars()
+        for analysis, analysis_id in zip(missing, ids):
+            analysis.id = analysis_id
+    defaults = [column for column in AudioAnalysis.__table__.columns
+                if column.default is not None and (column.default.is_scalar or column.default.is_callable)]
+    for analysis in new:
+        # The INSERT would fill in Python-side defaults after the JSON is cached, so fill them in here
+        state = attributes.instance_state(analysis)
+        for column in defaults:
+            if column.key not in state.dict:
+                default = column.default
+                setattr(analysis, column.key, default.arg if default.is_scalar else default.arg(None))
+        analysis.api_json = analysis.serialise()
+
+
+@event.listens_for(AudioAnalysis, 'after_delete')
+def _record_tombstone(mapper, connection, target):
+    """Leave a tombstone so the change feed can report the deletion."""
+    connection.execute(
+        AnalysisTombstone.__table__.insert().values(
+            analysis_id=target.id,
+            change_seq=CHANGE_SEQUENCE.next_value(),
+            change_xid=current_xid(),
+            deleted_at=datetime.utcnow()
+        )
+    )
+
+
+class AnalysisTombstone(db.Model):
+    """Record of a deleted analysis, kept for the change feed."""
+    __tablename__ = 'analysis_tombstones'
+
+    id = db.Column(db.Integer, primary_key=True)
+    analysis_id = db.Column(db.Integer, nullable=False)
+    change_seq = db.Column(db.BigInteger, nullable=False, index=True)
+    change_xid = db.Column(db.BigInteger, default=current_xid(), index=True)
+    deleted_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+class DashboardAggregate(db.Model):
+    """One running total behind the dashboard, kept in step with audio_analyses by aggregates.py."""
+    __tablename__ = 'dashboard_aggregates'
+
+    metric = db.Column(db.String(50), primary_key=True)  # e.g. 'theme', 'format', 'emotion'
+    key = db.Column(db.Text, primary_key=True, default='')  # The value counted; '' for corpus-wide totals
+    count = db.Column(db.BigInteger, nullable=False, default=0)  # Analyses contributing
+    total = db.Column(db.Float, nullable=False, default=0.0)  # Sum of their values, for averages
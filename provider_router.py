@@ -0,0 +1,324 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from analysis_worker import get_analysis_worker
+from cancellation import CancellationToken
+from retry_policy import PERMANENT, RETRYABLE, TRANSIENT, CircuitBreaker, classify_error, retry_stats
+
+logger = logging.getLogger(__name__)
+
+
+class ProviderStats:
+    """Rolling window of call latencies and outcomes for one provider."""
+
+    def __init__(self, window: int = 100):
+        self.samples = deque(maxlen=window)  # (latency_seconds, succeeded), succeeded None when censored
+        self._lock = threading.Lock()
+
+    def record(self, latency: float, succeeded: bool):
+        with self._lock:
+            self.samples.append((latency, succeeded))
+
+    def record_censored(self, latency: float):
+        """A call abandoned after latency seconds: it would have taken at least that long."""
+        with self._lock:
+            self.samples.append((latency, None))
+
+    def latency_percentile(self, percentile: float) -> Optional[float]:
+        """Latency percentile over successful and censored calls, or None without samples.
+
+        Censored calls count at the time they were abandoned, a lower bound,
+        so cancelled slow calls still hold the percentile up.
+        """
+        with self._lock:
+            latencies = sorted(latency for latency, succeeded in self.samples if succeeded is not False)
+        if not latencies:
+            return None
+        index = min(len(latencies) - 1, int(round(percentile / 100 * (len(latencies) - 1))))
+        return latencies[index]
+
+    def error_rate(self) -> float:
+        with self._lock:
+            outcomes = [succeeded for _, succeeded in self.samples if succeeded is not None]
+        if not outcomes:
+            return 0.0
+        return sum(1 for succeeded in outcomes if not succeeded) / len(outcomes)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'samples': len(self.samples),
+            'p50_latency': self.latency_percentile(50),
+            'p95_latency': self.latency_percentile(95),
+            'error_rate': round(self.error_rate(), 4)
+        }
+
+
+class ProviderError(ValueError):
+    """No provider produced an analysis; error_class says whether trying again later may help."""
+
+    def __init__(self, message: str, error_class: str):
+        super().__init__(message)
+        self.error_class = error_class
+
+
+class Provider:
+    """An analysis backend: a coroutine function taking (file_path, mime_type) and returning an analysis dict."""
+
+    def __init__(self, name: str, analyze: Callable[[str, Optional[str]], Awaitable[Dict[str, Any]]],
+                 supports: Callable[[Optional[str]], bool] = lambda mime_type: True):
+        self.name = name
+        self.analyze = analyze
+        self.supports = supports
+
+
+class ProviderRouter:
+    """Routes analyses between providers by health and hedges slow calls.
+
+    Providers are tried in priority order, skipping any whose circuit is
+    open. If the chosen provider has not answered within its recent
+    latency percentile, a hedged request goes to the next healthy
+    provider and whichever succeeds first wins; the call still running is
+    cancelled and counted as censored in its provider's latencies. Calls
+    run as tasks on the analysis event loop rather than on a thread each.
+    """
+
+    def __init__(self, providers: List[Provider], hedge_percentile: float = 95,
+                 min_hedge_delay: float = 5.0, default_hedge_delay: float = 120.0,
+                 failure_threshold: int = 5, reset_timeout: float = 60.0, window: int = 100,
+                 max_error_rate: float = 0.5, min_samples: int = 20,
+                 clock: Callable[[], float] = time.monotonic):
+        if not providers:
+            raise ValueError("At least one analysis provider is required")
+        self.providers = providers
+        self.hedge_percentile = hedge_percentile
+        self.min_hedge_delay = min_hedge_delay
+        self.default_hedge_delay = default_hedge_delay
+        self.max_error_rate = max_error_rate
+        self.min_samples = min_samples
+        self.clock = clock
+        self.stats = {provider.name: ProviderStats(window) for provider in providers}
+        self.breakers = {
+            provider.name: CircuitBreaker(failure_threshold, reset_timeout, clock) for provider in providers
+        }
+        self.hedges_sent = 0
+        self.hedges_won = 0
+
+    def hedge_delay(self, provider: Provider) -> float:
+        """How long to wait on a provider before hedging to the next one."""
+        latency = self.stats[provider.name].latency_percentile(self.hedge_percentile)
+        if latency is None:
+            return self.default_hedge_delay
+        return max(self.min_hedge_delay, latency)
+
+    async def _call(self, provider: Provider, file_path: str, mime_type: Optional[str]) -> Dict[str, Any]:
+        started = self.clock()
+        try:
+            result = await provider.analyze(file_path, mime_type)
+        except asyncio.CancelledError:
+            # Cancelled calls say nothing about the provider's health
+            self.breakers[provider.name].release_probe()
+            raise
+        except Exception:
+            stats = self.stats[provider.name]
+            stats.record(self.clock() - started, False)
+            self.breakers[provider.name].record_failure()
+            # Intermittent failures never trip the consecutive count, so watch the rolling rate too
+            if len(stats.samples) >= self.min_samples and stats.error_rate() > self.max_error_rate:
+                self.breakers[provider.name].trip()
+            raise
+        self.stats[provider.name].record(self.clock() - started, True)
+        self.breakers[provider.name].record_success()
+        return result
+
+    def analyze(self, file_path: str, mime_type: Optional[str] = None,
+                token: Optional[CancellationToken] = None) -> Dict[str, Any]:
+        """Analyze a file with the healthiest provider, hedging if it is slow."""
+        return get_analysis_worker().run(self.analyze_async(file_path, mime_type), token=token)
+
+    def submit(self, file_path: str, mime_type: Optional[str] = None,
+               token: Optional[CancellationToken] = None) -> Future:
+        """Start an analysis on the event loop without blocking, returning a thread-safe future."""
+        return get_analysis_worker().submit(self.analyze_async(file_path, mime_type), token)
+
+    async def analyze_async(self, file_path: str, mime_type: Optional[str] = None) -> Dict[str, Any]:
+        candidates = [
+            provider for provider in self.providers
+            if provider.supports(mime_type) and self.breakers[provider.name].available()
+        ]
+        pending = {}
+        errors = []
+        error_classes = []
+        remaining = list(candidates)
+
+        def launch(hedged: bool) -> bool:
+            while remaining:
+                provider = remaining.pop(0)
+                if not self.breakers[provider.name].allow():
+                    continue
+                logger.info(f"Sending analysis of {file_path} to {provider.name}")
+                task = asyncio.ensure_future(self._call(provider, file_path, mime_type))
+                # A call finishing alongside the winner is never awaited; retrieve its error quietly
+                task.add_done_callback(lambda t: t.cancelled() or t.exception())
+                pending[task] = (provider, hedged, self.clock())
+                return True
+            return False
+
+        if not launch(hedged=False):
+            raise ProviderError("No healthy analysis provider available for this file", TRANSIENT)
+
+        try:
+            while pending:
+                # Only wait out the hedge delay while there is another provider to hedge to
+                timeout = None
+                if remaining:
+                    slowest = max((provider for provider, _, _ in pending.values()), key=self.hedge_delay)
+                    timeout = self.hedge_delay(slowest)
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+
+                if not done:
+                    if launch(hedged=True):
+                        self.hedges_sent += 1
+                        logger.warning(f"No analysis result after {timeout:.1f}s, sent hedged request")
+                    continue
+
+                for task in done:
+                    provider, hedged, _ = pending.pop(task)
+                    try:
+                        result = task.result()
+                    except Exception as e:
+                        logger.error(f"Analysis with {provider.name} failed: {str(e)}")
+                        errors.append(f"{provider.name}: {str(e)}")
+                        error_classes.append(classify_error(e))
+                        continue
+                    if hedged:
+                        self.hedges_won += 1
+                    logger.info(f"Analysis of {file_path} completed by {provider.name}")
+                    self._cancel_losers(pending)
+                    return result
+
+                # Every in-flight call failed; fall back to the next healthy provider, if any
+                if not pending:
+                    launch(hedged=False)
+        except asyncio.CancelledError:
+            # A cancelled analysis also stops its hedged calls, releasing their quota
+            for task in pending:
+                task.cancel()
+            raise
+
+        # Worth retrying if any provider might succeed later
+        error_class = next((cls for cls in error_classes if cls in RETRYABLE), PERMANENT)
+        raise ProviderError(f"All analysis providers failed: {'; '.join(errors)}", error_class)
+
+    def _cancel_losers(self, pending: Dict[asyncio.Task, tuple]):
+        """Stop the calls a winning result made redundant, freeing their quota."""
+        now = self.clock()
+        for task, (provider, _, started) in pending.items():
+            if task.done():
+                continue
+            task.cancel()
+            self.stats[provider.name].record_censored(now - started)
+            logger.info(f"Cancelled redundant analysis call to {provider.name}")
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            'providers': {
+                provider.name: {
+                    **self.stats[provider.name].to_dict(),
+                    'circuit': self.breakers[provider.name].to_dict(),
+                    'hedge_delay': self.hedge_delay(provider)
+                } for provider in self.providers
+            },
+            'hedges_sent': self.hedges_sent,
+            'hedges_won': self.hedges_won,
+            'worker': get_analysis_worker().stats(),
+            'retries': retry_stats()
+        }
+
+
+def gemini_provider() -> Provider:
+    """GeminiAnalyzer as a router provider; handles audio, video and images."""
+    async def analyze(file_path: str, mime_type: Optional[str]) -> Dict[str, Any]:
+        from gemini_analyzer import GeminiAnalyzer
+        analyzer = GeminiAnalyzer()
+        try:
+            return await analyzer.upload_to_gemini_async(file_path, mime_type)
+        finally:
+            analyzer.cleanup()
+
+    return Provider('gemini', analyze)
+
+
+def to_gemini_schema(result: Dict[str, Any]) -> Dict[str, Any]:
+    """Fill an AudioAnalyzer result out to the fields GeminiAnalyzer returns.
+
+    AudioAnalyzer has no summary or emotion model, so those are left empty
+    rather than zeroed: missing_analysis_filter then picks the record up
+    and the backfill fills them in from the transcript.
+    """
+    return {
+        'format': 'narrated episode',
+        'has_narration': False,
+        'has_underscore': False,
+        'has_sound_effects': result.get('sound_effects_count', 0) > 0,
+        'songs_count': 0,
+        'characters_mentioned': [],
+        'speaking_characters': [],
+        'environments': [],
+        'themes': [],
+        'duration': '00:00:00',
+        'transcript': '',
+        'confidence_score': 0.0,
+        **result,
+        'summary': '',
+        'emotion_scores': {},
+        'tone_analysis': {},
+        'dominant_emotion': None
+    }
+
+
+def openai_provider() -> Provider:
+    """The OpenAI-based AudioAnalyzer as a router provider; audio and video only."""
+    async def analyze(file_path: str, mime_type: Optional[str]) -> Dict[str, Any]:
+        from audio_analyzer import AudioAnalyzer
+        analyzer = AudioAnalyzer()
+        try:
+            return to_gemini_schema(await analyzer.analyze_content_async(file_path))
+        finally:
+            analyzer.cleanup()
+
+    return Provider('openai', analyze, lambda mime_type: bool(mime_type) and mime_type.startswith(('audio/', 'video/')))
+
+
+PROVIDER_FACTORIES = {
+    'gemini': gemini_provider,
+    'openai': openai_provider,
+}
+
+_router: Optional[ProviderRouter] = None
+_router_lock = threading.Lock()
+
+
+def get_analysis_router() -> ProviderRouter:
+    """Return the process-wide router built from ANALYSIS_PROVIDERS (priority order)."""
+    global _router
+    with _router_lock:
+        if _router is None:
+            # OpenAI results need a backfill pass for summary and emotions, so it is opt-in
+            names = os.environ.get('ANALYSIS_PROVIDERS', 'gemini').split(',')
+            names = [name.strip() for name in names if name.strip() in PROVIDER_FACTORIES]
+            if 'openai' in names and not os.environ.get('OPENAI_API_KEY'):
+                logger.info("OPENAI_API_KEY is not set, leaving the OpenAI provider out of the router")
+                names.remove('openai')
+            _router = ProviderRouter(
+                [PROVIDER_FACTORIES[name]() for name in names],
+                hedge_percentile=float(os.environ.get('ANALYSIS_HEDGE_PERCENTILE', 95)),
+                min_hedge_delay=float(os.environ.get('ANALYSIS_MIN_HEDGE_DELAY', 5.0))
+            )
+            logger.info(f"Analysis router using providers: {', '.join(names)}")
+        return _router
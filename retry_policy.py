@@ -0,0 +1,330 @@
+import asyncio
+import logging
+import os
+import random
+import re
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Error classes
+RATE_LIMIT = 'rate_limit'
+TRANSIENT = 'transient'
+TIMEOUT = 'timeout'
+PERMANENT = 'permanent'
+
+RETRYABLE = {RATE_LIMIT, TRANSIENT, TIMEOUT}
+
+# Matched against the exception's class hierarchy, so the SDKs need not be imported here
+_RATE_LIMIT_TYPES = {'RateLimitError', 'ResourceExhausted', 'TooManyRequests'}
+_TIMEOUT_TYPES = {'TimeoutError', 'APITimeoutError', 'DeadlineExceeded', 'GatewayTimeout', 'ReadTimeout',
+                  'ConnectTimeout'}
+_TRANSIENT_TYPES = {'APIConnectionError', 'InternalServerError', 'ServiceUnavailable', 'ServerError',
+                    'ConnectionError', 'BadGateway', 'Aborted'}
+
+_RETRY_HINT_PATTERNS = [
+    re.compile(r'retry in (\d+(?:\.\d+)?)\s*s', re.IGNORECASE),
+    re.compile(r'retry_delay\s*\{\s*seconds:\s*(\d+)', re.IGNORECASE),
+    re.compile(r'try again in (\d+(?:\.\d+)?)\s*s', re.IGNORECASE),
+]
+
+
+class CircuitOpenError(Exception):
+    """Raised without calling the service while its circuit is open."""
+
+
+def _status_code(exc: BaseException) -> Optional[int]:
+    # OpenAI errors carry status_code; google.api_core errors carry code
+    for attr in ('status_code', 'code'):
+        value = getattr(exc, attr, None)
+        try:
+            return int(value) if value is not None else None
+        except (TypeError, ValueError):
+            continue
+    return None
+
+
+# Plain exceptions that only carry a message, e.g. an error re-raised by name
+_MESSAGE_ONLY_TYPES = (Exception, ValueError, RuntimeError)
+
+
+def classify_error(exc: BaseException) -> str:
+    """Sort an exception into rate-limit, timeout, transient or permanent."""
+    # Errors that already know their class, like the router's summary of its providers' failures
+    error_class = getattr(exc, 'error_class', None)
+    if error_class in RETRYABLE or error_class == PERMANENT:
+        return error_class
+
+    names = {cls.__name__ for cls in type(exc).__mro__}
+    status = _status_code(exc)
+
+    # An open circuit clears up by itself, so try again later
+    if 'CircuitOpenError' in names:
+        return TRANSIENT
+
+    if names & _RATE_LIMIT_TYPES or status == 429:
+        return RATE_LIMIT
+    if isinstance(exc, asyncio.TimeoutError) or names & _TIMEOUT_TYPES or status in (408, 504):
+        return TIMEOUT
+    if names & _TRANSIENT_TYPES or (status is not None and status >= 500):
+        return TRANSIENT
+    if status is not None:
+        return PERMANENT
+
+    # A wrapper raised while handling another error is classed by the original
+    cause = exc.__cause__ or (None if exc.__suppress_context__ else exc.__context__)
+    if cause is not None and cause is not exc:
+        return classify_error(cause)
+
+    if type(exc) in _MESSAGE_ONLY_TYPES:
+        # Only phrases, not bare status codes, which also turn up in file names
+        message = str(exc).lower()
+        if 'rate limit' in message or 'quota' in message or 'resource exhausted' in message:
+            return RATE_LIMIT
+        if 'timed out' in message or 'deadline exceeded' in message:
+            return TIMEOUT
+        if 'service unavailable' in message or 'connection reset' in message or 'connection refused' in message:
+            return TRANSIENT
+    return PERMANENT
+
+
+def retry_after_hint(exc: BaseException) -> Optional[float]:
+    """Seconds the server asked us to wait, from headers, error details or the message."""
+    response = getattr(exc, 'response', None)
+    headers = getattr(response, 'headers', None)
+    if headers:
+        try:
+            if headers.get('retry-after-ms'):
+                return float(headers['retry-after-ms']) / 1000
+            if headers.get('retry-after'):
+                return float(headers['retry-after'])
+        except (TypeError, ValueError):
+            pass
+
+    for detail in getattr(exc, 'details', None) or []:
+        retry_delay = getattr(detail, 'retry_delay', None)
+        if retry_delay is not None:
+            return retry_delay.seconds + retry_delay.nanos / 1e9
+
+    for pattern in _RETRY_HINT_PATTERNS:
+        match = pattern.search(str(exc))
+        if match:
+            return float(match.group(1))
+    return None
+
+
+class CircuitBreaker:
+    """Opens after consecutive failures and lets one probe through after a cool-down."""
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 60.0,
+                 clock: Callable[[], float] = time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def available(self) -> bool:
+        """Whether allow() would let a call through, without claiming the half-open probe."""
+        with self._lock:
+            if self.state == self.OPEN:
+                return self.clock() - self.opened_at >= self.reset_timeout
+            return self.state == self.CLOSED
+
+    def allow(self) -> bool:
+        """Whether a call may be sent now."""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and self.clock() - self.opened_at >= self.reset_timeout:
+                # Let a single probe through; its outcome closes or re-opens the circuit
+                self.state = self.HALF_OPEN
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.consecutive_failures = 0
+            self.opened_at = None
+
+    def trip(self):
+        """Open the circuit immediately."""
+        with self._lock:
+            if self.state != self.OPEN:
+                logger.warning("Circuit opened by error rate")
+            self.state = self.OPEN
+            self.opened_at = self.clock()
+
+    def record_failure(self):
+        with self._lock:
+            self.consecutive_failures += 1
+            if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    logger.warning(f"Circuit opened after {self.consecutive_failures} consecutive failures")
+                self.state = self.OPEN
+                self.opened_at = self.clock()
+
+    def release_probe(self):
+        """Hand back a half-open probe that was abandoned, so the next call can probe instead."""
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self.state = self.OPEN
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {'state': self.state, 'consecutive_failures': self.consecutive_failures}
+
+
+class RetryPolicy:
+    """Retries retryable errors with jittered exponential backoff.
+
+    One policy is shared by every caller of a service. A rate-limit error
+    pauses all of them until the server's retry hint (or the backoff) has
+    passed, and repeated transient failures open a shared circuit breaker
+    so callers fail fast instead of spending their retries.
+    """
+
+    def __init__(self, name: str, max_attempts: int = 4, base_delay: float = 1.0, max_delay: float = 60.0,
+                 failure_threshold: int = 5, reset_timeout: float = 60.0,
+                 clock: Callable[[], float] = time.monotonic, rng: random.Random = None):
+        self.name = name
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.clock = clock
+        self.rng = rng or random.Random()
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout, clock)
+        self.paused_until = 0.0
+        self.retries = 0
+        self.counts = {RATE_LIMIT: 0, TRANSIENT: 0, TIMEOUT: 0, PERMANENT: 0}
+        self._lock = threading.Lock()
+
+    def backoff(self, attempt: int, hint: Optional[float] = None) -> float:
+        """Delay before retry number attempt (1-based): full jitter, but never less than the server's hint."""
+        delay = self.rng.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+        if hint is not None:
+            delay = max(delay, hint)
+        return delay
+
+    def pause_remaining(self) -> float:
+        return max(0.0, self.paused_until - self.clock())
+
+    def _before_attempt(self):
+        if not self.breaker.allow():
+            raise CircuitOpenError(f"{self.name} circuit is open after repeated failures")
+
+    def _on_success(self):
+        self.breaker.record_success()
+
+    def _on_error(self, exc: BaseException, attempt: int) -> Optional[float]:
+        """Record an error and return the delay before retrying, or None to give up."""
+        category = classify_error(exc)
+        with self._lock:
+            self.counts[category] += 1
+
+        if category == PERMANENT:
+            # The service answered, so it is healthy even though this request was bad
+            self.breaker.record_success()
+            return None
+
+        delay = self.backoff(attempt, retry_after_hint(exc))
+        if category == RATE_LIMIT:
+            # Quota errors pause every caller rather than counting towards the circuit,
+            # unless this was the half-open probe
+            with self._lock:
+                self.paused_until = max(self.paused_until, self.clock() + delay)
+            if self.breaker.state == CircuitBreaker.HALF_OPEN:
+                self.breaker.record_failure()
+        else:
+            self.breaker.record_failure()
+
+        if attempt >= self.max_attempts:
+            return None
+        with self._lock:
+            self.retries += 1
+        logger.warning(f"{self.name} {category} error on attempt {attempt}, retrying in {delay:.1f}s: {str(exc)}")
+        return delay
+
+    def call(self, fn: Callable, *args, **kwargs) -> Any:
+        """Call fn, retrying retryable errors; blocks the calling thread while backing off."""
+        attempt = 0
+        while True:
+            attempt += 1
+            time.sleep(self.pause_remaining())
+            self._before_attempt()
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                delay = self._on_error(e, attempt)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                continue
+            self._on_success()
+            return result
+
+    async def call_async(self, fn: Callable, *args, **kwargs) -> Any:
+        """Await fn(*args, **kwargs), retrying retryable errors without blocking the event loop."""
+        attempt = 0
+        while True:
+            attempt += 1
+            await asyncio.sleep(self.pause_remaining())
+            self._before_attempt()
+            try:
+                result = await fn(*args, **kwargs)
+            except asyncio.CancelledError:
+                self.breaker.release_probe()
+                raise
+            except Exception as e:
+                delay = self._on_error(e, attempt)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                continue
+            self._on_success()
+            return result
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'retries': self.retries,
+            'errors': dict(self.counts),
+            'paused_for': round(self.pause_remaining(), 2),
+            'circuit': self.breaker.to_dict()
+        }
+
+
+# Per-service defaults; 'batch' governs re-queueing whole files after their analysis failed
+POLICY_DEFAULTS = {
+    'gemini': {'max_attempts': 4, 'base_delay': 1.0, 'max_delay': 60.0},
+    'openai': {'max_attempts': 4, 'base_delay': 1.0, 'max_delay': 60.0},
+    'batch': {'max_attempts': 3, 'base_delay': 15.0, 'max_delay': 600.0},
+}
+
+_policies: Dict[str, RetryPolicy] = {}
+_policies_lock = threading.Lock()
+
+
+def get_retry_policy(name: str) -> RetryPolicy:
+    """Return the process-wide policy for a service, e.g. RETRY_GEMINI_MAX_ATTEMPTS overrides its defaults."""
+    with _policies_lock:
+        if name not in _policies:
+            options = dict(POLICY_DEFAULTS.get(name, POLICY_DEFAULTS['gemini']))
+            prefix = f'RETRY_{name.upper()}_'
+            for option, cast in (('max_attempts', int), ('base_delay', float), ('max_delay', float)):
+                if os.environ.get(prefix + option.upper()):
+                    options[option] = cast(os.environ[prefix + option.upper()])
+            _policies[name] = RetryPolicy(name, **options)
+        return _policies[name]
+
+
+def retry_stats() -> Dict[str, Any]:
+    with _policies_lock:
+        return {name: policy.stats() for name, policy in _policies.items()}
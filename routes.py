@@ -1,18 +1,49 @@
 import os
 import json
+import uuid
 import logging
 from datetime import datetime
-from flask import request, jsonify, render_template, Response, current_app
+from concurrent.futures import CancelledError, Future, ThreadPoolExecutor
+from functools import partial
+from flask import request, jsonify, render_template, Response, current_app, stream_with_context
 from werkzeug.utils import secure_filename
 from werkzeug.exceptions import RequestEntityTooLarge
-from database import db
-from models import AudioAnalysis
+from database import db, set_statement_timeout
+from models import AudioAnalysis, AnalysisTombstone, EMOTIONS, LIST_FIELDS, commit_watermark, emotion_score, lowered
 from gemini_analyzer import GeminiAnalyzer
+from llm_cache import get_response_cache
+from provider_router import get_analysis_router
 from batch_manager import BatchUploadManager
+from upload_janitor import get_upload_janitor
+from blob_store import get_blob_store
+from job_scheduler import estimate_cost, get_job_scheduler
+from ingest import register_ingest_command
+from drive_import import DriveImporter
+from drive_watch import DriveFolderWatcher
+from admission import AdmissionRejected, get_admission_controller
+from archives import ARCHIVE_ERRORS, ARCHIVE_EXTENSIONS, entry_name, is_archive, iter_archive_entries
+from cancellation import AnalysisCancelled, stage_timeout
+from aggregates import dashboard_summary
+from backfill import BackfillManager, missing_analysis_filter
+from facet_index import DEFAULT_COMPLETIONS, FACET_FIELDS, FLAG_FIELDS, VALUE_FIELDS, get_facet_index
+from summary_fill import SummaryFiller
+from exporters import (
+    stream_query, transcript_chunks, csv_chunks, jsonl_chunks,
+    parquet_chunks, parquet_available, gzip_chunks,
+    merge_changes, change_jsonl_chunks, change_csv_chunks
+)
 from sqlalchemy import text
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.orm import defer
 
 logger = logging.getLogger(__name__)
 batch_manager = BatchUploadManager()
+backfill_manager = BackfillManager()
+summary_filler = SummaryFiller()
+# Stores finished batch analyses; the analyses themselves run on the analysis event loop
+batch_store_executor = ThreadPoolExecutor(
+    max_workers=int(os.environ.get('BATCH_STORE_WORKERS', 4)), thread_name_prefix='batch-store'
+)
 
 def title_case(s: str) -> str:
     """Convert string to title case, handling special characters"""
@@ -24,21 +55,33 @@ def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
 def prepare_list_for_storage(value):
-    """Prepare a list value for storage in the database"""
+    """Normalise a list field from an analysis result to a list for its JSONB column"""
     if not value:
-        return '[]'
+        return []
     if isinstance(value, str):
         try:
-            # If it's already a JSON string, validate it's a list
+            # If it's a JSON string, make sure it's a list
             parsed = json.loads(value)
-            return json.dumps(parsed if isinstance(parsed, list) else [parsed])
+            return parsed if isinstance(parsed, list) else [parsed]
         except json.JSONDecodeError:
             # Not JSON, treat as a single item
-            return json.dumps([value])
+            return [value]
     if isinstance(value, list):
-        return json.dumps(value)
+        return value
     # For any other type, wrap in a list
-    return json.dumps([str(value)])
+    return [str(value)]
+
+def caller_id():
+    """Who a request counts against for per-caller limits."""
+    return request.remote_addr or 'unknown'
+
+def rejection_response(e):
+    """429 with Retry-After for work to resubmit later; 413 for requests too large to ever admit."""
+    response = jsonify({'error': str(e)})
+    if e.retry_after is None:
+        return response, 413
+    response.headers['Retry-After'] = str(e.retry_after)
+    return response, 429
 
 def get_mime_type(filename):
     """Helper function to determine MIME type based on file extension"""
@@ -69,7 +112,158 @@ def reset_sequence():
         logger.error(f"Error resetting ID sequence: {str(e)}")
         db.session.rollback()
 
+def json_array_chunks(query, batch_size=500, ids=None):
+    """A query's cached JSON representations as chunks of a JSON array.
+
+    With ids (ascending), only those analyses are returned in ID order,
+    queried batch_size IDs at a time rather than in one unbounded IN list.
+    """
+    def serialise(batch):
+        # Rows written before the cache existed are serialised on the fly, one query per batch
+        missing = [analysis_id for analysis_id, api_json in batch if api_json is None]
+        if missing:
+            serialised = {a.id: a.to_json() for a in AudioAnalysis.query.filter(AudioAnalysis.id.in_(missing))}
+            batch = [(analysis_id, api_json if api_json is not None else serialised.get(analysis_id))
+                     for analysis_id, api_json in batch]
+        # A row deleted since the batch was read is left out
+        return ','.join(api_json for _, api_json in batch if api_json is not None)
+
+    def batches():
+        if ids is not None:
+            for start in range(0, len(ids), batch_size):
+                rows = query.filter(AudioAnalysis.id.in_(ids[start:start + batch_size])).order_by(AudioAnalysis.id)
+                yield [tuple(row) for row in rows.with_entities(AudioAnalysis.id, AudioAnalysis.api_json)]
+            return
+        batch = []
+        for row in query.with_entities(AudioAnalysis.id, AudioAnalysis.api_json).yield_per(batch_size):
+            batch.append(tuple(row))
+            if len(batch) == batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    yield '['
+    first = True
+    for batch in batches():
+        chunk = serialise(batch)
+        if chunk:
+            yield chunk if first else ',' + chunk
+            first = False
+    yield ']'
+
+def stream_json_array(query):
+    """Stream a query's cached JSON representations as a JSON array."""
+    return Response(stream_with_context(json_array_chunks(query)), mimetype='application/json')
+
+def export_response(chunks, filename, mimetype, compressible=True):
+    """Stream an export as an attachment, gzipped when ?gzip=1 is passed."""
+    def guarded(chunks):
+        try:
+            yield from chunks
+        except Exception as e:
+            # Headers are already sent, so the best we can do is log and truncate
+            logger.error(f"Error streaming export {filename}: {str(e)}", exc_info=True)
+            raise
+
+    chunks = guarded(chunks)
+    if compressible and request.args.get('gzip', '').lower() in ('1', 'true', 'yes'):
+        chunks = gzip_chunks(chunks)
+        filename += '.gz'
+        mimetype = 'application/gzip'
+
+    return Response(
+        stream_with_context(chunks),
+        mimetype=mimetype,
+        headers={"Content-disposition": f"attachment; filename={filename}"}
+    )
+
+# Search parameter -> list column it filters
+SEARCH_LIST_FIELDS = {
+    'themes': AudioAnalysis.themes,
+    'characters': AudioAnalysis.characters_mentioned,
+    'speaking_characters': AudioAnalysis.speaking_characters,
+    'environments': AudioAnalysis.environments
+}
+
+def search_conditions(criteria):
+    """SQL conditions for search criteria, matching the JSONB columns' indexes; ValueError if malformed."""
+    conditions = []
+    match_all = str(criteria.get('match') or 'any').lower() == 'all'
+    for field, column in SEARCH_LIST_FIELDS.items():
+        values = [str(value).lower() for value in criteria.get(field) or [] if value]  # Case-insensitive search
+        if not values:
+            continue
+        if match_all:
+            conditions.append(lowered(column).contains(values))
+        else:
+            conditions.append(db.or_(*[lowered(column).contains([value]) for value in values]))
+
+    for bound in ('emotion_min', 'emotion_max'):
+        for emotion, threshold in (criteria.get(bound) or {}).items():
+            if emotion not in EMOTIONS:
+                raise ValueError(f"Unknown emotion '{emotion}'. Known emotions: {', '.join(EMOTIONS)}")
+            try:
+                threshold = float(threshold)
+            except (TypeError, ValueError):
+                raise ValueError(f"{bound} for {emotion} must be a number")
+            score = emotion_score(emotion)
+            # jsonb orders numbers below booleans, arrays and objects, so only compare numbers
+            conditions.append(db.func.jsonb_typeof(score) == 'number')
+            value = db.literal(threshold, JSONB)
+            conditions.append(score >= value if bound == 'emotion_min' else score <= value)
+    return conditions
+
+def facet_search(criteria):
+    """Filter and count facets with the in-memory index; ValueError if malformed.
+
+    Returns {"total", "facets", "results"} where results holds at most
+    limit analyses (all by default, none with limit=0) after offset, in ID
+    order. Emotion bounds aren't indexed, so they narrow the bitmap with
+    the IDs the database matches.
+    """
+    index = get_facet_index()
+    index.refresh()
+    match_all = str(criteria.get('match') or 'any').lower() == 'all'
+    filters = {field: criteria.get(field) for field in FACET_FIELDS if criteria.get(field) not in (None, '', [])}
+    bitmap = index.filter(filters, match_all)
+
+    emotion_bounds = {bound: criteria.get(bound) for bound in ('emotion_min', 'emotion_max') if criteria.get(bound)}
+    if emotion_bounds:
+        conditions = search_conditions(emotion_bounds)
+        ids = db.session.query(AudioAnalysis.id).filter(*conditions)
+        bitmap &= index.bitmap(analysis_id for analysis_id, in ids)
+
+    facets = criteria.get('facets') or []
+    if isinstance(facets, str):
+        facets = [facet for facet in facets.split(',') if facet]
+    try:
+        facet_limit = int(criteria['facet_limit']) if criteria.get('facet_limit') else None
+        limit = int(criteria['limit']) if criteria.get('limit') not in (None, '') else None
+        offset = int(criteria.get('offset') or 0)
+    except (TypeError, ValueError):
+        raise ValueError("facet_limit, limit and offset must be integers")
+    counts = index.facet_counts(bitmap, facets, facet_limit)
+
+    ids = index.ids(bitmap)
+    page = ids[offset:offset + limit if limit is not None else None]
+
+    def generate():
+        yield f'{{"total": {len(ids)}, "facets": {json.dumps(counts)}, "results": '
+        yield from json_array_chunks(AudioAnalysis.query, ids=page)
+        yield '}'
+
+    return Response(stream_with_context(generate()), mimetype='application/json')
+
 def register_routes(app):
+    # Uploads are stored content-addressed; jobs and analyses hold references on them
+    blob_store = get_blob_store()
+    # One scheduled sweeper per process keeps the upload folder within its limits and collects blobs
+    upload_janitor = get_upload_janitor(app.config['UPLOAD_FOLDER'], blob_store=blob_store)
+    upload_janitor.start()
+    # Checked before a request body is read, so an overloaded server sheds work without touching disk
+    admission = get_admission_controller(blob_store.root)
+
     @app.route('/')
     def index():
         try:
@@ -81,9 +275,11 @@ def register_routes(app):
 
     @app.route('/api/upload', methods=['POST'])
     def upload_file():
-        filepath = None
-        analyzer = None
+        digest = None
+        upload_key = f"upload:{uuid.uuid4().hex}"
         try:
+            admission.admit(upload_key, caller_id(), jobs=1, nbytes=request.content_length or 0)
+
             if 'file' not in request.files:
                 logger.error("No file part in request")
                 return jsonify({'error': 'No file part'}), 400
@@ -99,7 +295,6 @@ def register_routes(app):
 
             try:
                 filename = secure_filename(file.filename)
-                filepath = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
 
                 # Check for existing analysis
                 existing = AudioAnalysis.query.filter_by(filename=filename).first()
@@ -107,16 +302,11 @@ def register_routes(app):
                     logger.warning(f"File {filename} already processed")
                     return jsonify({'error': 'File has already been processed'}), 400
 
-                # Ensure upload directory exists
-                os.makedirs(current_app.config['UPLOAD_FOLDER'], exist_ok=True)
-
-                file.save(filepath)
+                # Stored by content, so uploads with the same name never overwrite each other
+                digest = blob_store.put_stream(file.stream, filename)
+                filepath = blob_store.path(digest)
                 logger.info(f"File saved successfully to {filepath}")
 
-                # Create analyzer instance
-                analyzer = GeminiAnalyzer()
-                logger.info("Starting content analysis with Gemini")
-
                 # Get MIME type
                 try:
                     mime_type = get_mime_type(filename)
@@ -124,7 +314,11 @@ def register_routes(app):
                 except ValueError as e:
                     return jsonify({'error': str(e)}), 400
 
-                analysis_result = analyzer.upload_to_gemini(filepath, mime_type)
+                logger.info("Starting content analysis")
+                # Someone is waiting on this response, so it runs ahead of batch work
+                analysis_result = get_job_scheduler().submit_interactive(
+                    partial(get_analysis_router().submit, filepath, mime_type)
+                ).result()
                 logger.debug(f"Raw analysis result: {analysis_result}")
 
                 # Prepare array fields for storage
@@ -143,23 +337,26 @@ def register_routes(app):
                     has_underscore=analysis_result.get('has_underscore', False),
                     has_sound_effects=analysis_result.get('sound_effects_count', 0) > 0,
                     songs_count=analysis_result.get('songs_count', 0),
-                    environments=analysis_result.get('environments', '[]'),
-                    characters_mentioned=analysis_result.get('characters_mentioned', '[]'),
-                    speaking_characters=analysis_result.get('speaking_characters', '[]'),
-                    themes=analysis_result.get('themes', '[]'),
+                    environments=analysis_result.get('environments', []),
+                    characters_mentioned=analysis_result.get('characters_mentioned', []),
+                    speaking_characters=analysis_result.get('speaking_characters', []),
+                    themes=analysis_result.get('themes', []),
                     transcript=analysis_result.get('transcript', ''),
                     summary=analysis_result.get('summary', ''),
-                    emotion_scores=json.dumps(analysis_result.get('emotion_scores', {
+                    emotion_scores=analysis_result.get('emotion_scores', {
                         'joy': 0, 'sadness': 0, 'anger': 0,
                         'fear': 0, 'surprise': 0
-                    })),
+                    }),
                     dominant_emotion=analysis_result.get('dominant_emotion', ''),
-                    tone_analysis=json.dumps(analysis_result.get('tone_analysis', {})),
-                    confidence_score=analysis_result.get('confidence_score', 0.0)
+                    tone_analysis=analysis_result.get('tone_analysis', {}),
+                    confidence_score=analysis_result.get('confidence_score', 0.0),
+                    content_hash=digest
                 )
 
                 db.session.add(analysis)
                 db.session.commit()
+                # The record keeps the file so re-analysis can reuse it and its transcodes
+                blob_store.incref(digest)
                 logger.info(f"Analysis saved to database for {filename}")
 
                 # Convert to dict for response
@@ -169,13 +366,15 @@ def register_routes(app):
                 return jsonify(response_data), 200
 
             except Exception as e:
-                if "gemini api error" in str(e).lower():
+                if "gemini api error" in str(e).lower() or "analysis provider" in str(e).lower():
                     logger.error(f"Gemini API error: {str(e)}")
                     return jsonify({'error': 'Content analysis service unavailable. Please try again later.'}), 503
                 else:
                     logger.error(f"Error analyzing content: {str(e)}", exc_info=True)
                     return jsonify({'error': f'Error analyzing content: {str(e)}'}), 400
 
+        except AdmissionRejected as e:
+            return rejection_response(e)
         except RequestEntityTooLarge:
             logger.error("File too large")
             return jsonify({'error': 'File too large. Maximum file size is 100MB'}), 413
@@ -183,29 +382,83 @@ def register_routes(app):
             logger.error(f"Unexpected error: {str(e)}", exc_info=True)
             return jsonify({'error': f'An unexpected error occurred: {str(e)}'}), 500
         finally:
-            # Clean up resources
-            if analyzer:
-                try:
-                    analyzer.cleanup()
-                except Exception as e:
-                    logger.error(f"Error cleaning up analyzer: {str(e)}")
-
-            if filepath and os.path.exists(filepath):
-                try:
-                    os.remove(filepath)
-                    logger.info(f"Cleaned up uploaded file: {filepath}")
-                except Exception as e:
-                    logger.error(f"Error cleaning up file {filepath}: {str(e)}")
+            admission.release(upload_key)
+            # Drop the request's reference; the blob is collected once nothing else holds it
+            if digest:
+                blob_store.decref(digest)
 
     @app.route('/api/analyses')
     def get_analyses():
         try:
-            analyses = AudioAnalysis.query.order_by(AudioAnalysis.created_at.desc()).all()
-            return jsonify([analysis.to_dict() for analysis in analyses])
+            return stream_json_array(AudioAnalysis.query.order_by(AudioAnalysis.created_at.desc()))
         except Exception as e:
             logger.error(f"Error fetching analyses: {str(e)}")
             return jsonify({'error': 'Error fetching analyses'}), 500
 
+    # Dashboard table columns in display order; None for columns the table can't sort by
+    TABLE_COLUMNS = [
+        'id', 'title', 'filename', 'file_type', 'format', 'duration', None, None, None,
+        'has_underscore', 'has_sound_effects', 'songs_count', None, None
+    ]
+    TABLE_FIELDS = [
+        'id', 'title', 'filename', 'file_type', 'format', 'duration', 'environments', 'characters_mentioned',
+        'speaking_characters', 'has_underscore', 'has_sound_effects', 'songs_count', 'themes'
+    ]
+    MAX_TABLE_PAGE = 500
+
+    @app.route('/api/analyses/table')
+    def analyses_table():
+        """One page of the dashboard table in DataTables' server-side format.
+
+        Takes draw, start, length, search[value], order[0][column] and
+        order[0][dir]; only the page's rows are read, not the transcripts.
+        """
+        try:
+            draw = int(request.args.get('draw', 0))
+            start = max(0, int(request.args.get('start', 0)))
+            length = int(request.args.get('length', 25))
+            column = int(request.args.get('order[0][column]', 0))
+        except ValueError:
+            return jsonify({'error': 'draw, start, length and order must be integers'}), 400
+        length = MAX_TABLE_PAGE if length < 0 else min(length, MAX_TABLE_PAGE)
+
+        try:
+            query = AudioAnalysis.query
+            total = query.count()
+            search = request.args.get('search[value]', '').strip()
+            if search:
+                # Typed text is matched literally, not as a LIKE pattern
+                escaped = search.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+                columns = [AudioAnalysis.title, AudioAnalysis.filename, AudioAnalysis.format,
+                           *[db.cast(getattr(AudioAnalysis, field), db.Text) for field in LIST_FIELDS]]
+                query = query.filter(db.or_(*[c.ilike(f'%{escaped}%', escape='\\') for c in columns]))
+            filtered = query.count() if search else total
+
+            name = TABLE_COLUMNS[column] if 0 <= column < len(TABLE_COLUMNS) and TABLE_COLUMNS[column] else 'id'
+            order = getattr(AudioAnalysis, name)
+            order = order.asc() if request.args.get('order[0][dir]') == 'asc' else order.desc()
+            rows = query.with_entities(*[getattr(AudioAnalysis, field) for field in TABLE_FIELDS]).order_by(
+                order, AudioAnalysis.id.desc()).offset(start).limit(length)
+            return jsonify({
+                'draw': draw,
+                'recordsTotal': total,
+                'recordsFiltered': filtered,
+                'data': [dict(zip(TABLE_FIELDS, row)) for row in rows]
+            })
+        except Exception as e:
+            logger.error(f"Error fetching analyses table page: {str(e)}")
+            return jsonify({'error': 'Error fetching analyses'}), 500
+
+    @app.route('/api/dashboard')
+    def get_dashboard():
+        """Dashboard counts, frequencies and averages from the running totals in dashboard_aggregates."""
+        try:
+            return jsonify(dashboard_summary())
+        except Exception as e:
+            logger.error(f"Error fetching dashboard totals: {str(e)}")
+            db.session.rollback()
+            return jsonify({'error': 'Error fetching dashboard totals'}), 500
+
     @app.route('/debug_analysis/<int:analysis_id>')
     def debug_analysis(analysis_id):
         try:
@@ -226,100 +479,131 @@ def register_routes(app):
             if not analysis_dict.get('tone_analysis'):
                 analysis_dict['tone_analysis'] = {}
 
-            # Handle missing or empty summary
-            if not analysis_dict.get('summary'):
-                # Try to get a summary from Gemini if missing
-                try:
-                    analyzer = GeminiAnalyzer()
-                    analysis_result = analyzer.generate_summary(analysis_dict)
-                    analysis.summary = analysis_result.get('summary', '')
-                    db.session.commit()
-                    analysis_dict['summary'] = analysis.summary
-                except Exception as e:
-                    logger.error(f"Error generating summary: {str(e)}")
-                    analysis_dict['summary'] = "Summary not available."
+            # Render straight away and fill a missing summary in the background
+            summary_pending = not analysis_dict.get('summary')
+            if summary_pending:
+                summary_filler.request(current_app._get_current_object(), analysis_id)
 
-            return render_template('debug_analysis.html', analysis=analysis_dict)
+            return render_template('debug_analysis.html', analysis=analysis_dict, summary_pending=summary_pending)
         except Exception as e:
             logger.error(f"Error fetching analysis debug: {str(e)}")
             return jsonify({'error': 'Error fetching analysis debug info'}), 500
 
+    @app.route('/api/analysis/<int:analysis_id>/summary')
+    def analysis_summary(analysis_id):
+        """Return the summary, enqueueing a background fill if it is missing."""
+        try:
+            analysis = AudioAnalysis.query.get_or_404(analysis_id)
+            if analysis.summary:
+                return jsonify({'status': 'ready', 'summary': analysis.summary})
+
+            error = summary_filler.failure(analysis_id)
+            if error and not summary_filler.is_pending(analysis_id):
+                return jsonify({'status': 'failed', 'error': error})
+
+            summary_filler.request(current_app._get_current_object(), analysis_id)
+            return jsonify({'status': 'pending'}), 202
+        except Exception as e:
+            logger.error(f"Error fetching summary for analysis {analysis_id}: {str(e)}")
+            return jsonify({'error': 'Error fetching summary'}), 500
+
     @app.route('/search')
     def search_page():
         return render_template('search.html')
 
     @app.route('/api/search', methods=['GET', 'POST'])
     def search_content():
+        """Filter analyses in the database.
+
+        themes, characters, speaking_characters and environments match
+        whole items case-insensitively: any of the values by default, all
+        of them with match=all. emotion_min / emotion_max bound emotion
+        scores, e.g. {"emotion_min": {"fear": 0.6}}, or min_fear=0.6 in a
+        GET query string.
+
+        Passing facets (e.g. facets=themes,characters), a flag
+        (has_narration, has_underscore, has_sound_effects), format or
+        dominant_emotion answers from the in-memory facet index instead and
+        returns {"total", "facets", "results"}: per-value counts of the
+        requested facets among the matches, and the matches paged by limit
+        and offset. limit=0 returns only the counts.
+        """
         try:
             # Handle both GET and POST methods
             if request.method == 'GET':
                 criteria = {
-                    'themes': request.args.get('themes', '').split(',') if request.args.get('themes') else [],
-                    'characters': request.args.get('characters', '').split(',') if request.args.get('characters') else [],
-                    'environments': request.args.get('environments', '').split(',') if request.args.get('environments') else []
+                    field: request.args.get(field, '').split(',') if request.args.get(field) else []
+                    for field in SEARCH_LIST_FIELDS
                 }
+                criteria['match'] = request.args.get('match', 'any')
+                criteria['emotion_min'] = {e: request.args[f'min_{e}'] for e in EMOTIONS if f'min_{e}' in request.args}
+                criteria['emotion_max'] = {e: request.args[f'max_{e}'] for e in EMOTIONS if f'max_{e}' in request.args}
+                for field in FLAG_FIELDS + ('facets', 'facet_limit', 'limit', 'offset'):
+                    if field in request.args:
+                        criteria[field] = request.args[field]
+                for field in VALUE_FIELDS:
+                    if request.args.get(field):
+                        criteria[field] = request.args[field].split(',')
             else:
                 criteria = request.get_json()
 
             logger.debug(f"Search criteria received: {criteria}")
 
-            # Start with all analyses
-            query = AudioAnalysis.query
+            if any(field in criteria for field in FLAG_FIELDS + VALUE_FIELDS + ('facets',)):
+                try:
+                    return facet_search(criteria)
+                except ValueError as e:
+                    return jsonify({"error": str(e)}), 400
 
-            # Apply theme filters if provided
-            if criteria.get('themes'):
-                theme_conditions = []
-                for theme in criteria['themes']:
-                    if theme:  # Skip empty strings
-                        theme = theme.lower()  # Case-insensitive search
-                        theme_conditions.append(
-                            db.func.lower(AudioAnalysis.themes).like(f'%"{theme}"%')
-                        )
-                if theme_conditions:
-                    query = query.filter(db.or_(*theme_conditions))
-
-            # Apply character filters if provided
-            if criteria.get('characters'):
-                char_conditions = []
-                for character in criteria['characters']:
-                    if character:  # Skip empty strings
-                        character = character.lower()  # Case-insensitive search
-                        logger.debug(f"Searching for character: {character}")
-                        char_conditions.append(
-                            db.func.lower(AudioAnalysis.characters_mentioned).like(f'%"{character}"%')
-                        )
-                if char_conditions:
-                    query = query.filter(db.or_(*char_conditions))
-
-            # Apply environment filters if provided
-            if criteria.get('environments'):
-                env_conditions = []
-                for environment in criteria['environments']:
-                    if environment:  # Skip empty strings
-                        environment = environment.lower()  # Case-insensitive search
-                        logger.debug(f"Searching for environment: {environment}")
-                        env_conditions.append(
-                            db.func.lower(AudioAnalysis.environments).like(f'%"{environment}"%')
-                        )
-                if env_conditions:
-                    query = query.filter(db.or_(*env_conditions))
-
-            # Execute query and convert results to dictionaries
-            results = [analysis.to_dict() for analysis in query.all()]
-            logger.debug(f"Search returned {len(results)} results")
-            return jsonify(results)
+            try:
+                conditions = search_conditions(criteria)
+            except ValueError as e:
+                return jsonify({"error": str(e)}), 400
+
+            # Stream the cached representations of the matching rows
+            return stream_json_array(AudioAnalysis.query.filter(*conditions))
 
         except Exception as e:
             logger.error(f"Error performing search: {str(e)}")
             return jsonify({"error": "Error performing search"}), 500
 
+    @app.route('/api/autocomplete')
+    def autocomplete():
+        """Typeahead over a tag facet: ?field=themes&prefix=adv&limit=10.
+
+        Returns the most used tags starting with prefix (case-insensitive)
+        with how many analyses carry each; an empty prefix gives the most
+        used overall and limit=0 every match.
+        """
+        try:
+            field = request.args.get('field', 'themes')
+            prefix = request.args.get('prefix', '')
+            try:
+                limit = int(request.args.get('limit', DEFAULT_COMPLETIONS))
+            except ValueError:
+                return jsonify({'error': 'limit must be an integer'}), 400
+
+            index = get_facet_index()
+            index.refresh()
+            try:
+                suggestions = index.complete(field, prefix, limit)
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            return jsonify({'field': field, 'prefix': prefix, 'suggestions': suggestions})
+        except Exception as e:
+            logger.error(f"Error completing {request.args.get('field')} prefix: {str(e)}")
+            return jsonify({'error': 'Error fetching suggestions'}), 500
+
     @app.route('/api/analysis/<int:analysis_id>', methods=['DELETE'])
     def delete_analysis(analysis_id):
         """Delete an analysis record."""
         try:
             analysis = AudioAnalysis.query.get_or_404(analysis_id)
+            content_hash = analysis.content_hash
             db.session.delete(analysis)
             db.session.commit()
+            if content_hash:
+                blob_store.decref(content_hash)
             reset_sequence()
             return jsonify({'message': 'Analysis deleted successfully'}), 200
         except Exception as e:
@@ -350,13 +634,14 @@ def register_routes(app):
     @app.route('/api/upload/batch', methods=['POST'])
     def upload_batch():
         try:
+            caller = caller_id()
+            admission.check(caller, jobs=1, nbytes=request.content_length or 0)
+
             files = request.files.getlist('files[]')
             if not files:
                 logger.error("No files received in request")
                 return jsonify({'error': 'No files uploaded'}), 400
 
-            # Create uploads directory if it doesn't exist
-            os.makedirs(current_app.config['UPLOAD_FOLDER'], exist_ok=True)
             os.makedirs('data', exist_ok=True)  # For batch status files
 
             # Filter out duplicates and check file sizes
@@ -401,43 +686,32 @@ def register_routes(app):
                 logger.error(message)
                 return jsonify({'error': message}), 400
 
-            batch_id = batch_manager.create_batch(filenames)
-            logger.info(f"Created batch {batch_id} with {len(filenames)} files")
+            batch_id = batch_manager.new_batch_id()
+            admission.admit(batch_id, caller, jobs=len(filenames), nbytes=total_size)
 
-            # Save files and verify they exist
-            saved_files = []
+            # Store files by content; the batch holds a reference on each until it finishes
+            blobs = {}
             try:
                 for file in files:
                     if file.filename and allowed_file(file.filename):
                         filename = secure_filename(file.filename)
-                        if filename in filenames:  # Only save non-duplicate files
-                            filepath = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
-                            file.save(filepath)
-                            # Verify file was saved
-                            if not os.path.exists(filepath):
-                                raise IOError(f"Failed to save file {filename}")
-                            saved_files.append(filepath)
-                            logger.info(f"Saved and verified file {filename} for batch {batch_id}")
-
-                # Double check all files exist before starting batch
-                missing_files = [f for f in saved_files if not os.path.exists(f)]
-                if missing_files:
-                    raise IOError(f"Files missing after save: {', '.join(missing_files)}")
-
+                        if filename in filenames and filename not in blobs:  # Only save non-duplicate files
+                            blobs[filename] = blob_store.put_stream(file.stream, filename)
+                            logger.info(f"Stored file {filename} as blob {blobs[filename][:12]}")
             except Exception as e:
                 logger.error(f"Error saving files: {str(e)}")
-                # Clean up any saved files
-                for filepath in saved_files:
-                    try:
-                        if os.path.exists(filepath):
-                            os.remove(filepath)
-                    except Exception as cleanup_error:
-                        logger.error(f"Error cleaning up file {filepath}: {str(cleanup_error)}")
+                # Release any files already stored
+                for digest in blobs.values():
+                    blob_store.decref(digest)
+                admission.release(batch_id)
                 return jsonify({'error': 'Error saving files'}), 500
 
-            # Start processing in a separate thread
+            batch_manager.create_batch(filenames, blobs=blobs, batch_id=batch_id)
+            logger.info(f"Created batch {batch_id} with {len(filenames)} files")
+
+            # Probe costs and queue the files off the request thread
             from threading import Thread
-            thread = Thread(target=process_batch, args=(current_app, batch_id))
+            thread = Thread(target=schedule_batch, args=(current_app._get_current_object(), batch_id))
             thread.daemon = True
             thread.start()
 
@@ -449,6 +723,8 @@ def register_routes(app):
                 'files': filenames
             }), 202
 
+        except AdmissionRejected as e:
+            return rejection_response(e)
         except RequestEntityTooLarge:
             logger.error("File too large")
             return jsonify({'error': 'File too large. Maximum file size is 500MB'}), 413
@@ -456,6 +732,94 @@ def register_routes(app):
             logger.error(f"Unexpected error in batch upload: {str(e)}", exc_info=True)
             return jsonify({'error': 'An unexpected error occurred during batch upload'}), 500
 
+    @app.route('/api/upload/archive', methods=['POST'])
+    def upload_archive():
+        """Analyse the supported files in a zip or tar archive as they are unpacked.
+
+        Send the archive as the raw request body with ?filename=<name> so
+        tar entries are queued while the rest is still uploading, or as the
+        'archive' field of a multipart form.
+        """
+        batch_id = None
+        try:
+            caller = caller_id()
+            admission.check(caller, jobs=1, nbytes=request.content_length or 0)
+
+            if 'archive' in request.files:
+                filename, stream = request.files['archive'].filename, request.files['archive'].stream
+            else:
+                filename, stream = request.args.get('filename', ''), request.stream
+            if not is_archive(filename):
+                return jsonify({
+                    'error': f'Unsupported archive type. Allowed types: {", ".join(ARCHIVE_EXTENSIONS)}'
+                }), 400
+
+            os.makedirs('data', exist_ok=True)  # For batch status files
+            new_batch_id = batch_manager.new_batch_id()
+            admission.admit(new_batch_id, caller, jobs=0, nbytes=request.content_length or 0)
+            batch_id = batch_manager.create_batch([], receiving=True, batch_id=new_batch_id)
+            app_object = current_app._get_current_object()
+            logger.info(f"Receiving archive {filename} into batch {batch_id}")
+
+            files, duplicates, skipped = [], [], []
+            rejected = None
+            for name, entry, size in iter_archive_entries(stream, filename, blob_store.new_temp_path):
+                if batch_manager.get_batch_status(batch_id).get('is_cancelled'):
+                    break
+                key = entry_name(name)
+                if not key or not allowed_file(key) or key in files or size > 500 * 1024 * 1024:
+                    skipped.append(name)
+                    continue
+                if AudioAnalysis.query.filter_by(filename=key).first():
+                    duplicates.append(key)
+                    continue
+                try:
+                    admission.admit(batch_id, caller, jobs=1)
+                except AdmissionRejected as e:
+                    # Keep what was queued; the rest of the archive has to be sent again later
+                    rejected = e
+                    break
+                # Queued as soon as it's stored, while later entries are still arriving
+                batch_manager.add_file(batch_id, key, blob_store.put_stream(entry, key))
+                schedule_file(app_object, batch_id, key)
+                files.append(key)
+
+            if rejected and not files:
+                return rejection_response(rejected)
+            if not files:
+                message = "No supported files in archive"
+                if duplicates:
+                    message += f". Duplicates found: {', '.join(duplicates)}"
+                return jsonify({'error': message}), 400
+
+            return jsonify({
+                'batch_id': batch_id,
+                'message': 'Archive upload started',
+                'status_url': f'/api/upload/batch/{batch_id}/status',
+                'duplicates': duplicates,
+                'skipped': skipped,
+                'files': files,
+                'truncated': str(rejected) if rejected else None
+            }), 202
+
+        except AdmissionRejected as e:
+            return rejection_response(e)
+        except RequestEntityTooLarge:
+            logger.error("Archive too large")
+            return jsonify({'error': 'File too large. Maximum file size is 500MB'}), 413
+        except ARCHIVE_ERRORS as e:
+            logger.error(f"Error reading archive: {str(e)}")
+            return jsonify({'error': f'Error reading archive: {str(e)}', 'batch_id': batch_id}), 400
+        except Exception as e:
+            logger.error(f"Unexpected error in archive upload: {str(e)}", exc_info=True)
+            return jsonify({'error': 'An unexpected error occurred during archive upload', 'batch_id': batch_id}), 500
+        finally:
+            # Entries already queued carry on; the batch completes once they have
+            if batch_id:
+                batch_manager.finish_receiving(batch_id)
+                if not batch_manager.has_outstanding_files(batch_id):
+                    finish_batch(batch_id)
+
     @app.route('/api/upload/batch/<batch_id>/status')
     def batch_status(batch_id):
         """Get the status of a batch upload."""
@@ -475,7 +839,7 @@ def register_routes(app):
             status['progress'] = progress
             status['total_files'] = total_files
             status['completed_files'] = completed
-            status['is_complete'] = completed == total_files
+            status['is_complete'] = completed == total_files and not status.get('receiving')
 
             logger.debug(f"Batch {batch_id} status: {status}")
             return jsonify(status)
@@ -485,21 +849,44 @@ def register_routes(app):
 
     @app.route('/api/upload/batch/<batch_id>/retry')
     def retry_batch(batch_id):
-        status = batch_manager.load_batch_status(batch_id)
-        if not status:
+        if not batch_manager.load_batch_status(batch_id):
             return jsonify({'error': 'Batch not found'}), 404
+        status = batch_manager.get_batch_status(batch_id)
+        # A cancelled batch is never scheduled again, so reset files would wait forever
+        if status.get('is_cancelled'):
+            return jsonify({'error': 'Batch was cancelled and cannot be retried'}), 409
+        failed = sum(1 for f in list(status['files'].values()) if f['status'] == 'failed')
+        try:
+            admission.admit(batch_id, caller_id(), jobs=failed)
+        except AdmissionRejected as e:
+            return rejection_response(e)
+
+        upload_folder = current_app.config['UPLOAD_FOLDER']
+
+        def reacquire(filename, file_status):
+            if file_status.get('blob'):
+                # Take the reference back if the blob has not been collected yet
+                if not file_status.get('blob_held'):
+                    file_status['blob_held'] = blob_store.incref(file_status['blob'])
+            else:
+                upload_janitor.acquire(os.path.join(upload_folder, filename), batch_id)
 
         # Reset failed files to pending
-        for filename, file_status in status['files'].items():
-            if file_status['status'] == 'failed':
-                file_status['status'] = 'pending'
-                file_status['error'] = None
-                file_status['attempts'] = 0
-        batch_manager.save_batch_status(batch_id)
-
-        # Start processing in a separate thread
+        retried = batch_manager.reset_failed_files(batch_id, reacquire)
+        if len(retried) < failed:
+            # A concurrent retry or cancel got to some of the files first
+            admission.release(batch_id, jobs=failed - len(retried))
+        if not retried:
+            if not batch_manager.has_outstanding_files(batch_id):
+                finish_batch(batch_id)
+            if batch_manager.get_batch_status(batch_id).get('is_cancelled'):
+                return jsonify({'error': 'Batch was cancelled and cannot be retried'}), 409
+            return jsonify({'message': 'No failed files to retry',
+                            'status_url': f'/api/upload/batch/{batch_id}/status'}), 200
+
+        # Queue only the reset files; anything else pending is already scheduled
         from threading import Thread
-        thread = Thread(target=process_batch, args=(current_app, batch_id))
+        thread = Thread(target=schedule_batch, args=(current_app._get_current_object(), batch_id, retried))
         thread.daemon = True
         thread.start()
 
@@ -516,6 +903,10 @@ def register_routes(app):
                 return jsonify({'error': 'Batch not found'}), 404
 
             batch_manager.cancel_batch(batch_id)
+            # Queued files never start; a file being analysed finishes the batch when it stops
+            get_job_scheduler().cancel_owner(batch_id)
+            if not batch_manager.has_outstanding_files(batch_id):
+                finish_batch(batch_id)
             return jsonify({'message': 'Batch cancelled successfully'}), 200
         except Exception as e:
             logger.error(f"Error cancelling batch: {str(e)}")
@@ -523,118 +914,118 @@ def register_routes(app):
 
     @app.route('/export_transcripts')
     def export_transcripts():
-        try:
-            analyses = AudioAnalysis.query.order_by(AudioAnalysis.created_at.desc()).all()
-            output = ""
-            
-            for analysis in analyses:
-                if analysis.transcript:
-                    output += f"\n### {analysis.title} ###\n\n"
-                    output += f"{analysis.transcript}\n"
-                    output += "\n" + "="*50 + "\n"  # Separator between shows
-            
-            return Response(
-                output,
-                mimetype="text/plain",
-                headers={"Content-disposition": "attachment; filename=show_transcripts.txt"}
-            )
-        except Exception as e:
-            logger.error(f"Error exporting transcripts: {str(e)}")
-            return jsonify({'error': 'Error exporting transcripts'}), 500
+        query = AudioAnalysis.query.filter(AudioAnalysis.transcript.isnot(None))
+        query = query.order_by(AudioAnalysis.created_at.desc())
+        return export_response(
+            transcript_chunks(stream_query(query)),
+            'show_transcripts.txt',
+            'text/plain'
+        )
 
     @app.route('/export_csv')
     def export_csv():
+        query = AudioAnalysis.query.options(defer(AudioAnalysis.transcript), defer(AudioAnalysis.api_json))
+        query = query.order_by(AudioAnalysis.created_at.desc())
+        return export_response(csv_chunks(stream_query(query)), 'content_export.csv', 'text/csv')
+
+    @app.route('/export_jsonl')
+    def export_jsonl():
+        query = AudioAnalysis.query.options(defer(AudioAnalysis.transcript))
+        query = query.order_by(AudioAnalysis.created_at.desc())
+        return export_response(jsonl_chunks(stream_query(query)), 'content_export.jsonl', 'application/x-ndjson')
+
+    @app.route('/export_parquet')
+    def export_parquet():
+        if not parquet_available():
+            return jsonify({'error': 'Parquet export requires the pyarrow package'}), 501
+
+        query = AudioAnalysis.query.options(defer(AudioAnalysis.transcript), defer(AudioAnalysis.api_json))
+        query = query.order_by(AudioAnalysis.created_at.desc())
+        # Parquet pages are already compressed, so the gzip option is ignored
+        return export_response(
+            parquet_chunks(stream_query(query)),
+            'content_export.parquet',
+            'application/vnd.apache.parquet',
+            compressible=False
+        )
+
+    @app.route('/export_changes')
+    def export_changes():
+        """Stream analyses created, updated or deleted after the `since` cursor.
+
+        The response carries the cursor to pass as `since` on the next sync in
+        the X-Change-Cursor header. The cursor is a transaction watermark
+        rather than a change_seq: it only moves past changes whose
+        transactions have finished, so a change that commits late is still
+        in the next sync. A change may occasionally be sent twice; events
+        are upserts and deletes by ID, so replaying one is harmless.
+        """
         try:
-            analyses = AudioAnalysis.query.order_by(AudioAnalysis.created_at.desc()).all()
-            output = "ID,Title,Filename,Format,Duration,Has Narration,Has Music,Has Sound Effects,Songs Count,Environments,Characters,Themes\n"
-
-            for analysis in analyses:
-                environments = "|".join(analysis._parse_list_field(analysis.environments))
-                characters = "|".join(analysis._parse_list_field(analysis.characters_mentioned))
-                themes = "|".join(analysis._parse_list_field(analysis.themes))
-
-                row = f"{analysis.id},{analysis.title},{analysis.filename},{analysis.format},"
-                row += f"{analysis.duration},{analysis.has_narration},{analysis.has_underscore},"
-                row += f"{analysis.has_sound_effects},{analysis.songs_count},"
-                row += f"\"{environments}\",\"{characters}\",\"{themes}\"\n"
-                output += row
-
-            return Response(
-                output,
-                mimetype="text/csv",
-                headers={"Content-disposition": "attachment; filename=content_export.csv"}
+            since = int(request.args.get('since', 0))
+        except ValueError:
+            return jsonify({'error': 'since must be an integer change cursor'}), 400
+
+        export_format = request.args.get('format', 'jsonl').lower()
+        if export_format not in ('jsonl', 'csv'):
+            return jsonify({'error': 'format must be one of: jsonl, csv'}), 400
+
+        # Transactions below the watermark have all finished; those above it are left for the next sync
+        cursor = max(since, commit_watermark(db.session))
+
+        analyses = AudioAnalysis.query.options(defer(AudioAnalysis.transcript)).filter(
+            AudioAnalysis.change_xid >= since,
+            AudioAnalysis.change_xid < cursor
+        ).order_by(AudioAnalysis.change_seq)
+        tombstones = AnalysisTombstone.query.filter(
+            AnalysisTombstone.change_xid >= since,
+            AnalysisTombstone.change_xid < cursor
+        ).order_by(AnalysisTombstone.change_seq)
+        changes = merge_changes(stream_query(analyses), stream_query(tombstones))
+
+        if export_format == 'csv':
+            response = export_response(change_csv_chunks(changes), f'changes_{since}_{cursor}.csv', 'text/csv')
+        else:
+            response = export_response(
+                change_jsonl_chunks(changes),
+                f'changes_{since}_{cursor}.jsonl',
+                'application/x-ndjson'
             )
-        except Exception as e:
-            logger.error(f"Error exporting CSV: {str(e)}")
-            return jsonify({'error': 'Error exporting data'}), 500
+        response.headers['X-Change-Cursor'] = str(cursor)
+        return response
 
     @app.route('/api/update_missing_analysis', methods=['POST'])
     def update_missing_analysis():
-        """Update records missing transcripts, summaries and emotion scores."""
+        """Start a background job filling in missing summaries and emotion scores."""
         try:
-            # Get all records missing transcripts, summaries or emotion scores
-            analyses = AudioAnalysis.query.filter(
-                db.or_(
-                    AudioAnalysis.summary.is_(None),
-                    AudioAnalysis.summary == '',
-                    AudioAnalysis.emotion_scores == '{}',
-                    AudioAnalysis.emotion_scores.is_(None)
-                )
-            ).all()
-
-            if not analyses:
+            if not AudioAnalysis.query.filter(missing_analysis_filter()).first():
                 logger.info("No records found needing updates")
                 return jsonify({'message': 'No records need updating'}), 200
 
-            logger.info(f"Found {len(analyses)} records to update")
-            analyzer = GeminiAnalyzer()
-
-            updated_count = 0
-            for analysis in analyses:
-                try:
-                    analysis_dict = analysis.to_dict()
-
-                    # Only generate summary if we have a transcript
-                    if (not analysis.summary or analysis.summary == '') and analysis.transcript:
-                        summary_result = analyzer.regenerate_summary(analysis_dict)
-                        analysis.summary = summary_result.get('summary', '')
-                        logger.info(f"Generated summary from transcript for analysis {analysis.id}")
-
-                    # Get missing emotion scores
-                    if not analysis.emotion_scores or analysis.emotion_scores == '{}':
-                        emotion_result = analyzer.analyze_emotions(analysis_dict)
-                        analysis.emotion_scores = json.dumps(emotion_result['emotion_scores'])
-                        analysis.dominant_emotion = emotion_result['dominant_emotion']
-                        analysis.tone_analysis = json.dumps(emotion_result['tone_analysis'])
-                        analysis.confidence_score = emotion_result['confidence_score']
-                        logger.info(f"Updated emotion analysis for analysis {analysis.id}")
-
-                    db.session.add(analysis)
-                    updated_count += 1
-
-                    # Commit every 5 records to avoid long transactions
-                    if updated_count % 5 == 0:
-                        db.session.commit()
-                        logger.info(f"Committed batch of 5 updates, total: {updated_count}")
-
-                except Exception as e:
-                    logger.error(f"Error updating analysis {analysis.id}: {str(e)}")
-                    continue
-
-            # Final commit for remaining records
-            db.session.commit()
-            logger.info(f"Successfully updated {updated_count} records")
+            data = request.get_json(silent=True) or {}
+            max_workers = data.get('max_workers')
+            if max_workers is not None and (not isinstance(max_workers, int) or not 1 <= max_workers <= 32):
+                return jsonify({'error': 'max_workers must be an integer between 1 and 32'}), 400
 
+            packed = str(data.get('packed', True)).lower() in ('1', 'true', 'yes')
+            job_id = backfill_manager.start(current_app._get_current_object(), max_workers, packed)
             return jsonify({
-                'message': f'Successfully updated {updated_count} records',
-                'total_processed': len(analyses),
-                'successfully_updated': updated_count
-            }), 200
+                'job_id': job_id,
+                'message': 'Backfill started',
+                'status_url': f'/api/update_missing_analysis/{job_id}/status'
+            }), 202
 
         except Exception as e:
             logger.error(f"Error in update_missing_analysis: {str(e)}")
             return jsonify({'error': 'Error updating records'}), 500
 
+    @app.route('/api/update_missing_analysis/<job_id>/status')
+    def update_missing_analysis_status(job_id):
+        """Get the progress of a backfill job."""
+        status = backfill_manager.get_status(job_id)
+        if not status:
+            return jsonify({'error': 'Backfill job not found'}), 404
+        return jsonify(status)
+
     @app.route('/api/regenerate_summary/<int:analysis_id>', methods=['POST'])
     def regenerate_summary(analysis_id):
         """Regenerate summary for a specific analysis using its transcript."""
@@ -645,8 +1036,11 @@ def register_routes(app):
                 logger.warning(f"Cannot regenerate summary for analysis {analysis_id} - no transcript available")
                 return jsonify({'error': 'No transcript available for this analysis'}), 400
 
-            analyzer = GeminiAnalyzer()
+            # Identical transcripts are served from the response cache unless bypassed
+            bypass_cache = request.args.get('bypass_cache', '').lower() in ('1', 'true', 'yes')
+            analyzer = GeminiAnalyzer(bypass_cache=bypass_cache)
             analysis_dict = analysis.to_dict()
+            analysis_dict['transcript'] = analysis.transcript
 
             try:
                 summary_result = analyzer.regenerate_summary(analysis_dict)
@@ -667,6 +1061,61 @@ def register_routes(app):
             logger.error(f"Error in regenerate_summary endpoint: {str(e)}", exc_info=True)
             return jsonify({'error': 'Error processing request'}), 500
 
+    @app.route('/api/uploads/storage')
+    def upload_storage_stats():
+        """Size of the upload folder and blob store, and what the janitor has cleaned up."""
+        try:
+            return jsonify(upload_janitor.stats())
+        except Exception as e:
+            logger.error(f"Error reading upload storage stats: {str(e)}")
+            return jsonify({'error': 'Error reading upload storage stats'}), 500
+
+    @app.route('/api/scheduler/status')
+    def scheduler_status():
+        """Queued and running analysis jobs per batch."""
+        try:
+            return jsonify(get_job_scheduler().stats())
+        except Exception as e:
+            logger.error(f"Error reading scheduler status: {str(e)}")
+            return jsonify({'error': 'Error reading scheduler status'}), 500
+
+    @app.route('/api/admission/status')
+    def admission_status():
+        """Outstanding work against the admission limits."""
+        try:
+            return jsonify(admission.stats())
+        except Exception as e:
+            logger.error(f"Error reading admission status: {str(e)}")
+            return jsonify({'error': 'Error reading admission status'}), 500
+
+    @app.route('/api/llm_cache/stats')
+    def llm_cache_stats():
+        """Hit/miss counters and size of the LLM response cache."""
+        try:
+            return jsonify(get_response_cache().stats())
+        except Exception as e:
+            logger.error(f"Error reading LLM cache stats: {str(e)}")
+            return jsonify({'error': 'Error reading LLM cache stats'}), 500
+
+    @app.route('/api/llm_cache', methods=['DELETE'])
+    def clear_llm_cache():
+        """Drop every cached LLM response."""
+        try:
+            get_response_cache().clear()
+            return jsonify({'message': 'LLM response cache cleared'}), 200
+        except Exception as e:
+            logger.error(f"Error clearing LLM cache: {str(e)}")
+            return jsonify({'error': 'Error clearing LLM cache'}), 500
+
+    @app.route('/api/providers/status')
+    def providers_status():
+        """Rolling latency, error rate and circuit state per analysis provider."""
+        try:
+            return jsonify(get_analysis_router().status())
+        except Exception as e:
+            logger.error(f"Error reading provider status: {str(e)}")
+            return jsonify({'error': 'Error reading provider status'}), 500
+
     @app.route('/api/reassign_ids', methods=['POST'])
     def reassign_ids():
         """Reassign IDs to be sequential starting from 1."""
@@ -679,6 +1128,14 @@ def register_routes(app):
                 FROM audio_analyses;
             """))
 
+            # IDs that no longer exist after renumbering are deletions for the change feed
+            db.session.execute(text("""
+                INSERT INTO analysis_tombstones (analysis_id, change_seq, change_xid, deleted_at)
+                SELECT old_id, nextval('audio_analyses_change_seq'), txid_current(), NOW()
+                FROM id_mapping
+                WHERE old_id NOT IN (SELECT new_id FROM id_mapping);
+            """))
+
             # Update the IDs using the mapping
             db.session.execute(text("""
                 UPDATE audio_analyses a
@@ -695,6 +1152,11 @@ def register_routes(app):
                 ALTER SEQUENCE audio_analyses_id_seq RESTART WITH {max_id};
             """))
 
+            # Cached representations embed the old IDs, so refresh them
+            db.session.expire_all()
+            for analysis in AudioAnalysis.query.all():
+                analysis.touch()
+
             db.session.commit()
             logger.info("Successfully reassigned IDs")
             return jsonify({'message': 'IDs reassigned successfully'}), 200
@@ -704,126 +1166,188 @@ def register_routes(app):
             db.session.rollback()
             return jsonify({'error': 'Failed to reassign IDs'}), 500
 
-    def process_batch(app, batch_id):
-        """Process each file in the batch sequentially."""
-        logger.info(f"Starting batch processing for batch {batch_id}")
+    def batch_file_path(app, file_status, filename):
+        """Where a batch file's content lives: its blob, or the upload folder for older batches."""
+        if file_status.get('blob'):
+            return blob_store.path(file_status['blob'])
+        return os.path.join(app.config['UPLOAD_FOLDER'], filename)
+
+    def schedule_batch(app, batch_id, filenames=None):
+        """Queue a batch's pending files on the shared scheduler."""
+        status = batch_manager.get_batch_status(batch_id)
+        queued = 0
+        for filename in filenames or list(status['files']):
+            if status['files'][filename]['status'] == 'pending' and not status.get('is_cancelled'):
+                schedule_file(app, batch_id, filename)
+                queued += 1
+        logger.info(f"Scheduled {queued} files for batch {batch_id}")
+        if not batch_manager.has_outstanding_files(batch_id):
+            finish_batch(batch_id)
+
+    def schedule_file(app, batch_id, filename):
+        """Queue one file, costed by its probed duration, after any retry backoff."""
+        file_status = batch_manager.get_batch_status(batch_id)['files'][filename]
+        if file_status.get('estimated_cost') is None:
+            filepath = batch_file_path(app, file_status, filename)
+            file_status['estimated_cost'] = estimate_cost(filepath) if filepath else 0.0
+        not_before = None
+        if file_status.get('next_attempt_at'):
+            not_before = datetime.fromisoformat(file_status['next_attempt_at']).timestamp()
+        get_job_scheduler().submit(
+            batch_id, partial(process_batch_file, app, batch_id, filename),
+            cost=file_status['estimated_cost'], not_before=not_before,
+            weight=batch_manager.get_batch_status(batch_id).get('weight', 1.0)
+        )
+
+    def finish_batch(batch_id):
+        """Release what the batch holds once none of its files are pending or processing."""
+        # Unreferenced blobs and released files are removed once their retry grace period has passed
+        for digest in batch_manager.take_held_blobs(batch_id):
+            blob_store.decref(digest)
+        upload_janitor.release_owner(batch_id)
+        admission.release(batch_id)
+        logger.info(f"Completed batch processing for batch {batch_id}")
+
+    def process_batch_file(app, batch_id, filename):
+        """Start one file of a batch on a scheduler worker.
+
+        The checks run here; the analysis is handed to the analysis event
+        loop and the returned future is done once the result is stored, so
+        the worker thread moves on to the next file in the meantime.
+        """
+        token = batch_manager.get_cancellation_token(batch_id)
+        handed_off = False
+        with app.app_context():
+            try:
+                if token.cancelled:
+                    batch_manager.mark_file_cancelled(batch_id, filename)
+                    return
+                file_status = batch_manager.get_batch_status(batch_id)['files'][filename]
+                digest = file_status.get('blob')
+                filepath = batch_file_path(app, file_status, filename)
+
+                # First check for duplicate before any other processing
+                existing = AudioAnalysis.query.filter_by(filename=filename).first()
+                if existing:
+                    logger.info(f"File {filename} already processed, marking as complete")
+                    batch_manager.mark_file_complete(batch_id, filename, existing.id)
+                    batch_manager.save_batch_status(batch_id)
+                    return
+
+                # Check if file exists before starting processing
+                if not filepath or not os.path.exists(filepath):
+                    logger.error(f"File not found before processing: {filepath or filename}")
+                    batch_manager.mark_file_failed(batch_id, filename, "File not found before processing")
+                    return
 
+                batch_manager.mark_file_started(batch_id, filename)
+                try:
+                    mime_type = get_mime_type(filename)
+                    # Process with whichever provider is healthy and fastest
+                    analysis = get_analysis_router().submit(filepath, mime_type, token=token)
+                except Exception as e:
+                    fail_batch_file(app, batch_id, filename, e)
+                    return
+
+                stored = Future()
+                # Done callbacks run on the event loop, so storing the result goes to a thread of its own
+                analysis.add_done_callback(lambda f: batch_store_executor.submit(
+                    store_batch_file, app, batch_id, filename, digest, mime_type, f, token
+                ).add_done_callback(lambda _: stored.set_result(None)))
+                handed_off = True
+                return stored
+            finally:
+                if not handed_off:
+                    settle_batch_file(batch_id, filename)
+
+    def store_batch_file(app, batch_id, filename, digest, mime_type, analysis_future, token):
+        """Store a batch file's finished analysis; run on a batch store thread."""
         with app.app_context():
-            while True:
-                pending_files = batch_manager.get_pending_files(batch_id)
-                if not pending_files:
-                    break
+            try:
+                try:
+                    analysis_result = analysis_future.result()
+                except CancelledError:
+                    raise AnalysisCancelled(token.reason or 'Cancelled') from None
 
-                for filename in pending_files:
-                    filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-
-                    # First check for duplicate before any other processing
-                    existing = AudioAnalysis.query.filter_by(filename=filename).first()
-                    if existing:
-                        logger.info(f"File {filename} already processed, marking as complete")
-                        batch_manager.mark_file_complete(batch_id, filename, existing.id)
-                        batch_manager.save_batch_status(batch_id)
-                        continue
-
-                    # Check if file exists before starting processing
-                    if not os.path.exists(filepath):
-                        logger.error(f"File not found before processing: {filepath}")
-                        batch_manager.mark_file_failed(batch_id, filename, "File not found before processing")
-                        batch_manager.save_batch_status(batch_id)
-                        # Mark batch as complete if all files are processed or failed
-                        if batch_manager._is_batch_complete(batch_id):
-                            batch_manager.batch_status[batch_id]['completed_at'] = datetime.now().isoformat()
-                        continue
-
-                    batch_manager.mark_file_started(batch_id, filename)
-                    analyzer = None
-
-                    try:
-                        # Create analyzer instance
-                        analyzer = GeminiAnalyzer()
-
-                        # Get MIME type
-                        mime_type = get_mime_type(filename)
-
-
-                        # Process with Gemini
-                        analysis_result = analyzer.upload_to_gemini(filepath, mime_type)
-
-                        # Prepare array fields for storage
-                        for field in ['environments', 'characters_mentioned', 'speaking_characters', 'themes']:
-                            if field in analysis_result:
-                                analysis_result[field] = prepare_list_for_storage(analysis_result[field])
-
-                        # Create database entry
-                        analysis = AudioAnalysis(
-                            title=title_case(os.path.splitext(filename)[0]),
-                            filename=filename,
-                            file_type='Audio' if mime_type.startswith(('audio/', 'video/')) else 'Image',
-                            format=analysis_result.get('format', 'narrated episode'),
-                            duration=analysis_result.get('duration', '00:00:00'),
-                            has_narration=analysis_result.get('has_narration', False),
-                            has_underscore=analysis_result.get('has_underscore', False),
-                            has_sound_effects=analysis_result.get('sound_effects_count', 0) > 0,
-                            songs_count=analysis_result.get('songs_count', 0),
-                            environments=analysis_result.get('environments', '[]'),
-                            characters_mentioned=analysis_result.get('characters_mentioned', '[]'),
-                            speaking_characters=analysis_result.get('speaking_characters', '[]'),
-                            themes=analysis_result.get('themes', '[]'),
-                            transcript=analysis_result.get('transcript', ''),
-                            summary=analysis_result.get('summary', ''),
-                            emotion_scores=json.dumps(analysis_result.get('emotion_scores', {
-                                'joy': 0, 'sadness': 0, 'anger': 0,
-                                'fear': 0, 'surprise': 0
-                            })),
-                            dominant_emotion=analysis_result.get('dominant_emotion', ''),
-                            tone_analysis=json.dumps(analysis_result.get('tone_analysis', {})),
-                            confidence_score=analysis_result.get('confidence_score', 0.0)
-                        )
-
-                        db.session.add(analysis)
-                        db.session.commit()
-
-                        batch_manager.mark_file_complete(batch_id, filename, analysis.id)
-                        logger.info(f"Successfully processed file {filename} in batch {batch_id}")
-
-                    except Exception as e:
-                        logger.error(f"Error processing {filename}: {str(e)}")
-                        batch_manager.mark_file_failed(batch_id, filename, str(e))
-
-                    finally:
-                        # Clean up resources
-                        if analyzer:
-                            try:
-                                analyzer.cleanup()
-                            except Exception as e:
-                                logger.error(f"Error cleaning up analyzer: {str(e)}")
-
-                    # Save batch status after each file
-                    batch_manager.save_batch_status(batch_id)
+                # Prepare array fields for storage
+                for field in ['environments', 'characters_mentioned', 'speaking_characters', 'themes']:
+                    if field in analysis_result:
+                        analysis_result[field] = prepare_list_for_storage(analysis_result[field])
 
-            # Schedule cleanup after 30 minutes
-            from datetime import datetime, timedelta
-            cleanup_time = datetime.now() + timedelta(minutes=30)
+                # Create database entry
+                analysis = AudioAnalysis(
+                    title=title_case(os.path.splitext(os.path.basename(filename))[0]),
+                    filename=filename,
+                    file_type='Audio' if mime_type.startswith(('audio/', 'video/')) else 'Image',
+                    format=analysis_result.get('format', 'narrated episode'),
+                    duration=analysis_result.get('duration', '00:00:00'),
+                    has_narration=analysis_result.get('has_narration', False),
+                    has_underscore=analysis_result.get('has_underscore', False),
+                    has_sound_effects=analysis_result.get('sound_effects_count', 0) > 0,
+                    songs_count=analysis_result.get('songs_count', 0),
+                    environments=analysis_result.get('environments', []),
+                    characters_mentioned=analysis_result.get('characters_mentioned', []),
+                    speaking_characters=analysis_result.get('speaking_characters', []),
+                    themes=analysis_result.get('themes', []),
+                    transcript=analysis_result.get('transcript', ''),
+                    summary=analysis_result.get('summary', ''),
+                    emotion_scores=analysis_result.get('emotion_scores', {
+                        'joy': 0, 'sadness': 0, 'anger': 0,
+                        'fear': 0, 'surprise': 0
+                    }),
+                    dominant_emotion=analysis_result.get('dominant_emotion', ''),
+                    tone_analysis=analysis_result.get('tone_analysis', {}),
+                    confidence_score=analysis_result.get('confidence_score', 0.0),
+                    content_hash=digest
+                )
 
-            while datetime.now() < cleanup_time:
-                # Keep checking if files are still needed
-                if any(f for f in pending_files if os.path.exists(os.path.join(app.config['UPLOAD_FOLDER'], f))):
-                    import time
-                    time.sleep(60)  # Check every minute
-                else:
-                    break
+                # Don't store results for a batch cancelled while it was being analyzed
+                token.raise_if_cancelled()
+                set_statement_timeout(stage_timeout('persistence'))
+                db.session.add(analysis)
+                db.session.commit()
+                if digest:
+                    blob_store.incref(digest)
+
+                batch_manager.mark_file_complete(batch_id, filename, analysis.id)
+                logger.info(f"Successfully processed file {filename} in batch {batch_id}")
+                batch_manager.save_batch_status(batch_id)
+            except AnalysisCancelled:
+                db.session.rollback()
+                batch_manager.mark_file_cancelled(batch_id, filename)
+            except Exception as e:
+                fail_batch_file(app, batch_id, filename, e)
+            finally:
+                settle_batch_file(batch_id, filename)
 
-            # Clean up files after delay
-            for filename in pending_files:
-                filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-                if os.path.exists(filepath):
-                    try:
-                        os.remove(filepath)
-                        logger.info(f"Cleaned up file {filepath} after 30-minute delay")
-                    except Exception as e:
-                        logger.error(f"Error cleaning up file {filepath}: {str(e)}")
-
-            logger.info(f"Completed batch processing for batch {batch_id}")
+    def fail_batch_file(app, batch_id, filename, e):
+        """Record a failed attempt and queue the file again if it is to be retried."""
+        db.session.rollback()
+        logger.error(f"Error processing {filename}: {str(e)}")
+        batch_manager.mark_file_failed(batch_id, filename, str(e), exc=e)
+        if batch_manager.get_batch_status(batch_id)['files'][filename]['status'] == 'pending':
+            schedule_file(app, batch_id, filename)
+
+    def settle_batch_file(batch_id, filename):
+        """Return a finished file's capacity, and the batch's once none of its files are left."""
+        if batch_manager.get_batch_status(batch_id)['files'][filename]['status'] not in ('pending', 'processing'):
+            admission.release(batch_id, jobs=1)
+        if not batch_manager.has_outstanding_files(batch_id):
+            finish_batch(batch_id)
+
+    # `flask ingest` feeds local files to the same batch engine
+    register_ingest_command(app, batch_manager, blob_store, schedule_batch, allowed_file)
+    # Google Drive imports download on the server and queue each file as it arrives
+    app.extensions['drive_importer'] = DriveImporter(
+        app, batch_manager, blob_store, admission, schedule_file, finish_batch, allowed_file
+    )
+    # Watched Drive folders are polled in the background and new files imported the same way
+    app.extensions['drive_watcher'] = DriveFolderWatcher(app.extensions['drive_importer'])
+
+    @app.before_request
+    def start_drive_watcher():
+        # Only a serving process polls; CLI commands like `flask ingest` never handle a request
+        app.extensions['drive_watcher'].start()
 
     @app.route('/api/analysis/<int:analysis_id>/update_title', methods=['POST'])
     def update_title(analysis_id):
@@ -3,6 +3,36 @@ document.addEventListener('DOMContentLoaded', function() {
     const fileInput = document.getElementById('audioFile');
     const uploadBtn = document.getElementById('uploadBtn');
     const batchStatus = document.getElementById('batchStatus');
+    const archiveExtensions = ['.zip', '.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tbz2', '.tar.xz', '.txz'];
+
+    function isArchive(file) {
+        const name = file.name.toLowerCase();
+        return archiveExtensions.some(ext => name.endsWith(ext));
+    }
+
+    async function uploadArchive(file) {
+        batchStatus.innerHTML = `<div class="alert alert-info">Uploading archive ${file.name}...</div>`;
+
+        // Sent as the raw body so the server can unpack and queue entries while the rest uploads
+        const response = await fetch(`/api/upload/archive?filename=${encodeURIComponent(file.name)}`, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/octet-stream' },
+            body: file
+        });
+        const result = await response.json();
+
+        if (!response.ok) {
+            throw new Error(result.error || 'Archive upload failed');
+        }
+
+        if (result.duplicates && result.duplicates.length > 0) {
+            batchStatus.innerHTML += `<div class="alert alert-warning">
+                Some files were skipped (duplicates): ${result.duplicates.join(', ')}
+            </div>`;
+        }
+
+        await pollBatchStatus(result.batch_id, result.status_url);
+    }
 
     async function uploadFiles(files) {
         if (files.length === 0) {
@@ -149,6 +179,9 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     }
 
+    // Shared with google_drive.js, whose imports run as batches too
+    window.pollBatchStatus = pollBatchStatus;
+
     window.retryBatch = async function(batchId) {
         try {
             const response = await fetch(`/api/upload/batch/${batchId}/retry`);
@@ -177,7 +210,14 @@ document.addEventListener('DOMContentLoaded', function() {
         spinner.classList.remove('d-none');
 
         try {
-            await uploadFiles(files);
+            const selected = Array.from(files);
+            for (const archive of selected.filter(isArchive)) {
+                await uploadArchive(archive);
+            }
+            const mediaFiles = selected.filter(file => !isArchive(file));
+            if (mediaFiles.length > 0) {
+                await uploadFiles(mediaFiles);
+            }
         } catch (error) {
             batchStatus.innerHTML = `<div class="alert alert-danger">Batch processing failed: ${error.message}</div>`;
         } finally {
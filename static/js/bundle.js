@@ -25,7 +25,7 @@ document.addEventListener('DOMContentLoaded', function() {
             const characterGroups = groupByCharacterInteractions(analyses);
 
             // Group by emotional patterns
-            const emotionGroups = groupByEmotions(analyses);
+            const emotionGroups = await groupByEmotions();
 
             // Group by emotional arcs (stories that follow similar emotional progressions)
             const emotionalArcGroups = groupByEmotionalArcs(analyses);
@@ -50,15 +50,21 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     }
 
-    function groupByEmotions(analyses) {
+    async function groupByEmotions() {
         const emotionGroups = [];
         const emotions = ['joy', 'sadness', 'anger', 'fear', 'surprise'];
 
-        emotions.forEach(emotion => {
-            const matchingAnalyses = analyses.filter(analysis => {
-                const scores = analysis.emotion_scores || {};
-                return scores[emotion] && scores[emotion] > 0.6; // High emotion threshold
-            });
+        // The database filters on the threshold, so only matching analyses are fetched
+        const matches = await Promise.all(emotions.map(async emotion => {
+            const response = await fetch(`/api/search?min_${emotion}=0.6`); // High emotion threshold
+            if (!response.ok) {
+                throw new Error(`HTTP error! status: ${response.status}`);
+            }
+            return response.json();
+        }));
+
+        emotions.forEach((emotion, index) => {
+            const matchingAnalyses = matches[index];
 
             if (matchingAnalyses.length > 1) {
                 // Group by series
@@ -37,6 +37,10 @@ document.addEventListener('DOMContentLoaded', function() {
                 width: '300px',
                 className: 'fixed-width'
             },
+            {
+                targets: [6, 7, 8, 12],  // List columns
+                orderable: false
+            },
             {
                 targets: -1,   // Last column (Actions)
                 orderable: false,
@@ -44,6 +48,33 @@ document.addEventListener('DOMContentLoaded', function() {
             }
         ],
         order: [[0, 'desc']], // Sort by first column (ID) by default
+        // Only the visible page is fetched; paging, sorting and search run on the server
+        serverSide: true,
+        processing: true,
+        pageLength: 25,
+        ajax: function(params, callback) {
+            const query = new URLSearchParams({
+                draw: params.draw,
+                start: params.start,
+                length: params.length,
+                'search[value]': params.search.value,
+                'order[0][column]': params.order.length ? params.order[0].column : 0,
+                'order[0][dir]': params.order.length ? params.order[0].dir : 'desc'
+            });
+            fetch(`/api/analyses/table?${query}`)
+                .then(response => {
+                    if (!response.ok) {
+                        throw new Error(`HTTP error! status: ${response.status}`);
+                    }
+                    return response.json();
+                })
+                .then(page => callback({ ...page, data: page.data.map(tableRow) }))
+                .catch(error => {
+                    console.error('Error updating table:', error);
+                    showError(`Failed to update table: ${error.message}`);
+                    callback({ draw: params.draw, recordsTotal: 0, recordsFiltered: 0, data: [] });
+                });
+        },
         initComplete: function() {
             const headerCells = $('#analysisTable thead th').not(':last'); // Skip Actions column
 
@@ -248,48 +279,53 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     }
 
-    // Function to update table data
+    function tableRow(analysis) {
+        return [
+            analysis.id,
+            `<div class="d-flex align-items-center">
+                <span class="title-text">${analysis.title || "Untitled"}</span>
+                <button class="btn btn-sm btn-link edit-title ms-2" data-id="${analysis.id}">
+                    <i class="bi bi-pencil-square"></i>
+                </button>
+            </div>`,
+            analysis.filename,
+            analysis.file_type,
+            analysis.format,
+            analysis.duration,
+            (analysis.environments || []).join(', ') || '-',
+            (analysis.characters_mentioned || []).join(', ') || '-',
+            (analysis.speaking_characters || []).join(', ') || '-',
+            analysis.has_underscore ? "Yes" : "No",
+            analysis.has_sound_effects ? "Yes" : "No",
+            analysis.songs_count,
+            (analysis.themes || []).join(', ') || '-',
+            `<div class="btn-group" role="group">
+                <a href="/debug_analysis/${analysis.id}" class="btn btn-sm btn-info">Info</a>
+                <button class="btn btn-sm btn-danger delete-btn" data-id="${analysis.id}">Delete</button>
+            </div>`
+        ];
+    }
+
+    // Re-fetch the current page only, keeping the user's place in the table
     async function updateTable() {
+        table.ajax.reload(null, false);
+        await updateDashboard();
+    }
+
+    // Charts and summary come from the server's running totals, not the full analyses list
+    async function updateDashboard() {
         try {
-            const response = await fetch('/api/analyses');
+            const response = await fetch('/api/dashboard');
             if (!response.ok) {
                 throw new Error(`HTTP error! status: ${response.status}`);
             }
 
-            const data = await response.json();
-            table.clear();
-            data.forEach(analysis => {
-                table.row.add([
-                    analysis.id,
-                    `<div class="d-flex align-items-center">
-                        <span class="title-text">${analysis.title || "Untitled"}</span>
-                        <button class="btn btn-sm btn-link edit-title ms-2" data-id="${analysis.id}">
-                            <i class="bi bi-pencil-square"></i>
-                        </button>
-                    </div>`,
-                    analysis.filename,
-                    analysis.file_type,
-                    analysis.format,
-                    analysis.duration,
-                    (analysis.environments || []).join(', ') || '-',
-                    (analysis.characters_mentioned || []).join(', ') || '-',
-                    (analysis.speaking_characters || []).join(', ') || '-',
-                    analysis.has_underscore ? "Yes" : "No",
-                    analysis.has_sound_effects ? "Yes" : "No",
-                    analysis.songs_count,
-                    (analysis.themes || []).join(', ') || '-',
-                    `<div class="btn-group" role="group">
-                        <a href="/debug_analysis/${analysis.id}" class="btn btn-sm btn-info">Info</a>
-                        <button class="btn btn-sm btn-danger delete-btn" data-id="${analysis.id}">Delete</button>
-                    </div>`
-                ]);
-            });
-            table.draw();
-            updateCharts(data);
-            updateEmotionAnalysis(data);
+            const summary = await response.json();
+            updateCharts(summary);
+            updateEmotionAnalysis(summary);
         } catch (error) {
-            console.error('Error updating table:', error);
-            showError(`Failed to update table: ${error.message}`);
+            console.error('Error updating dashboard:', error);
+            showError(`Failed to update dashboard: ${error.message}`);
         }
     }
 
@@ -491,38 +527,22 @@ function initializeCharacterNetwork() {
     }
 }
 
-function updateCharacterNetwork(data) {
+function updateCharacterNetwork(summary) {
     try {
-        if (!Array.isArray(data) || data.length === 0) {
+        if (!summary || !Object.keys(summary.speaking_characters || {}).length) {
             console.log('No data available for character network');
             return;
         }
 
         const height = 400;
-        const nodes = new Set();
-        const links = [];
-
-        // Build character relationships
-        data.forEach(analysis => {
-            if (!analysis?.speaking_characters?.length) return;
-            
-            const characters = analysis.speaking_characters;
-            characters.forEach(char => {
-                if (char) nodes.add(char);
-            });
+        const nodes = new Set(Object.keys(summary.speaking_characters));
 
-            for (let i = 0; i < characters.length; i++) {
-                for (let j = i + 1; j < characters.length; j++) {
-                    if (characters[i] && characters[j]) {
-                        links.push({
-                            source: characters[i],
-                            target: characters[j],
-                            value: 1
-                        });
-                    }
-                }
-            }
-        });
+        // Characters who speak in the same piece, weighted by how many pieces they share
+        const links = (summary.speaking_character_pairs || []).map(([source, target, count]) => ({
+            source,
+            target,
+            value: count
+        }));
 
         const svg = d3.select('#characterNetwork svg g');
         svg.selectAll('*').remove();
@@ -607,16 +627,9 @@ function updateCharacterNetwork(data) {
     }
 }
 
-function updateThemeCloud(data) {
+function updateThemeCloud(summary) {
     try {
-        const themeFrequency = {};
-        data.forEach(analysis => {
-            (analysis.themes || []).forEach(theme => {
-                themeFrequency[theme] = (themeFrequency[theme] || 0) + 1;
-            });
-        });
-
-        const themeData = Object.entries(themeFrequency)
+        const themeData = Object.entries(summary.themes || {})
             .map(([text, value]) => ({
                 text,
                 value
@@ -642,7 +655,7 @@ function updateThemeCloud(data) {
 
             // Add tooltip with correlation data
             theme.on('mouseover', function(event) {
-                const correlations = findThemeCorrelations(d.text, data);
+                const correlations = findThemeCorrelations(d.text, summary.theme_pairs || []);
                 const tooltip = d3.select('body').append('div')
                     .attr('class', 'tooltip')
                     .style('position', 'absolute')
@@ -665,21 +678,12 @@ function updateThemeCloud(data) {
     }
 }
 
-function findThemeCorrelations(theme, analyses) {
-    const correlations = {};
-    const themeAnalyses = analyses.filter(a => (a.themes || []).includes(theme));
-
-    themeAnalyses.forEach(analysis => {
-        (analysis.themes || []).forEach(t => {
-            if (t !== theme) {
-                correlations[t] = (correlations[t] || 0) + 1;
-            }
-        });
-    });
-
-    return Object.entries(correlations)
-        .sort((a, b) => b[1] - a[1])
-        .slice(0, 3);
+function findThemeCorrelations(theme, themePairs) {
+    // Pairs arrive most frequent first
+    return themePairs
+        .filter(([a, b]) => a === theme || b === theme)
+        .slice(0, 3)
+        .map(([a, b, count]) => [a === theme ? b : a, count]);
 }
 
 function formatCorrelations(correlations) {
@@ -704,113 +708,67 @@ document.addEventListener('analysisAdded', updateTable);
 document.addEventListener('analysisDeleted', updateTable);
 setInterval(updateTable, 30000);
 
-function generateContentSummary(data) {
-    const totalItems = data.length;
+function generateContentSummary(summary) {
+    const totalItems = summary.total;
     if (totalItems === 0) {
         return "No content has been analyzed yet.";
     }
 
-    // Calculate format distribution
-    const formats = {};
-    data.forEach(item => {
-        formats[item.format] = (formats[item.format] || 0) + 1;
-    });
+    const formats = summary.formats;
 
-    // Calculate audio elements
     const audioStats = {
-        withNarration: data.filter(item => item.has_narration).length,
-        withMusic: data.filter(item => item.has_underscore).length,
-        withSoundEffects: data.filter(item => item.has_sound_effects).length,
-        totalSongs: data.reduce((sum, item) => sum + item.songs_count, 0)
+        withNarration: summary.flags.has_narration,
+        withMusic: summary.flags.has_underscore,
+        withSoundEffects: summary.flags.has_sound_effects,
+        totalSongs: summary.total_songs
     };
 
-    // Collect all unique themes and characters
-    const themes = new Set();
-    const characters = new Set();
-    const characterAppearances = {};
-    const themeOccurrences = {};
-    const emotionPatterns = [];
-
-    data.forEach(item => {
-        if (Array.isArray(item.themes)) {
-            item.themes.forEach(theme => {
-                themes.add(theme);
-                themeOccurrences[theme] = (themeOccurrences[theme] || 0) + 1;
-            });
-        }
-        if (Array.isArray(item.characters_mentioned)) {
-            item.characters_mentioned.forEach(char => {
-                characters.add(char);
-                characterAppearances[char] = (characterAppearances[char] || 0) + 1;
-            });
-        }
-        if (item.emotion_scores) {
-            emotionPatterns.push(item.emotion_scores);
-        }
-    });
+    const themeCount = Object.keys(summary.themes).length;
+    const characterCount = Object.keys(summary.characters).length;
 
-    // Calculate average confidence score
-    const avgConfidence = data.reduce((sum, item) => sum + (item.confidence_score || 0), 0) / totalItems;
+    const avgConfidence = summary.average_confidence || 0;
 
-    // Find most common themes and characters
-    const topThemes = Object.entries(themeOccurrences)
+    const topThemes = Object.entries(summary.themes)
         .sort((a, b) => b[1] - a[1])
         .slice(0, 3)
         .map(([theme, count]) => `${theme} (${count} times)`);
 
-    const topCharacters = Object.entries(characterAppearances)
+    const topCharacters = Object.entries(summary.characters)
         .sort((a, b) => b[1] - a[1])
         .slice(0, 3)
         .map(([char, count]) => `${char} (${count} appearances)`);
 
-    // Calculate dominant emotions across corpus
-    const avgEmotions = emotionPatterns.reduce((acc, emotions) => {
-        Object.entries(emotions).forEach(([emotion, score]) => {
-            acc[emotion] = (acc[emotion] || 0) + score;
-        });
-        return acc;
-    }, {});
-
-    Object.keys(avgEmotions).forEach(key => {
-        avgEmotions[key] /= emotionPatterns.length;
-    });
-
-    const dominantEmotion = Object.entries(avgEmotions)
-        .sort((a, b) => b[1] - a[1])[0][0];
+    const dominantEmotion = (Object.entries(summary.emotion_averages)
+        .sort((a, b) => b[1] - a[1])[0] || ['neutral'])[0];
 
     // Generate summary text
     const basicSummary = `This corpus contains ${totalItems} analyzed pieces of content. ` +
         `The content is primarily ${Object.entries(formats).map(([k,v]) => `${v} ${k}`).join(' and ')}. ` +
         `${audioStats.withNarration} pieces contain narration, ${audioStats.withMusic} have background music, ` +
         `and ${audioStats.withSoundEffects} include sound effects. There are ${audioStats.totalSongs} total songs across all content. ` +
-        `The collection features ${characters.size} unique characters and explores ${themes.size} distinct themes. ` +
+        `The collection features ${characterCount} unique characters and explores ${themeCount} distinct themes. ` +
         `Analysis confidence averages ${(avgConfidence * 100).toFixed(1)}%.`;
 
     const aiInsights = `\n\nAI Analysis Insights: The most prominent themes are ${topThemes.join(', ')}, ` +
         `while the most frequently appearing characters are ${topCharacters.join(', ')}. ` +
         `The emotional landscape is predominantly ${dominantEmotion}, suggesting a consistent tone across the corpus. ` +
-        `${characters.size > 10 ? 'The large character ensemble suggests a rich, interconnected narrative universe. ' : ''}` +
+        `${characterCount > 10 ? 'The large character ensemble suggests a rich, interconnected narrative universe. ' : ''}` +
         `${audioStats.withMusic / totalItems > 0.7 ? 'The high prevalence of background music indicates strong emphasis on mood and atmosphere. ' : ''}` +
-        `${themes.size > 5 ? 'The diverse range of themes suggests content designed to engage with multiple aspects of the audience\'s interests.' : ''}`;
+        `${themeCount > 5 ? 'The diverse range of themes suggests content designed to engage with multiple aspects of the audience\'s interests.' : ''}`;
 
     return basicSummary + aiInsights;
 }
 
-function updateCharts(data) {
+function updateCharts(summary) {
     try {
         // Update content summary
         const summaryElement = document.getElementById('content-summary');
         if (summaryElement) {
-            summaryElement.textContent = generateContentSummary(data);
+            summaryElement.textContent = generateContentSummary(summary);
         }
         // Format distribution
         if (formatChart) {
-            const formats = {};
-            data.forEach(analysis => {
-                if (analysis.format) {
-                    formats[analysis.format] = (formats[analysis.format] || 0) + 1;
-                }
-            });
+            const formats = summary.formats;
             formatChart.data.labels = Object.keys(formats);
             formatChart.data.datasets[0].data = Object.values(formats);
             formatChart.update();
@@ -819,19 +777,12 @@ function updateCharts(data) {
         // Content types
         if (contentChart) {
             const contentTypes = {
-                narration: 0,
-                backgroundMusic: 0,
-                soundEffects: 0,
-                songs: 0
+                narration: summary.flags.has_narration,
+                backgroundMusic: summary.flags.has_underscore,
+                soundEffects: summary.flags.has_sound_effects,
+                songs: summary.with_songs
             };
 
-            data.forEach(analysis => {
-                if (analysis.has_narration) contentTypes.narration++;
-                if (analysis.has_underscore) contentTypes.backgroundMusic++;
-                if (analysis.has_sound_effects) contentTypes.soundEffects++;
-                if (analysis.songs_count > 0) contentTypes.songs++;
-            });
-
             contentChart.data.datasets[0].data = [
                 contentTypes.narration,
                 contentTypes.backgroundMusic,
@@ -843,12 +794,7 @@ function updateCharts(data) {
 
         // Environment distribution
         if (environmentChart) {
-            const environments = {};
-            data.forEach(analysis => {
-                (analysis.environments || []).forEach(env => {
-                    environments[env] = (environments[env] || 0) + 1;
-                });
-            });
+            const environments = summary.environments;
 
             const colors = Array.from(
                 { length: Object.keys(environments).length },
@@ -881,8 +827,8 @@ function updateCharts(data) {
         }
 
         // Theme cloud and character network
-        updateThemeCloud(data);
-        updateCharacterNetwork(data);
+        updateThemeCloud(summary);
+        updateCharacterNetwork(summary);
 
     } catch (error) {
         console.error('Error updating charts:', error);
@@ -890,49 +836,21 @@ function updateCharts(data) {
     }
 }
 
-function updateEmotionAnalysis(data) {
+function updateEmotionAnalysis(summary) {
     try {
-        // Calculate average emotion scores
-        const totalEmotions = {
-            joy: 0,
-            sadness: 0,
-            anger: 0,
-            fear: 0,
-            surprise: 0
-        };
-        let totalConfidence = 0;
-        const dominantEmotions = {};
-
-        data.forEach(analysis => {
-            if (analysis.emotion_scores) {
-                Object.entries(analysis.emotion_scores).forEach(([emotion, score]) => {
-                    if (totalEmotions.hasOwnProperty(emotion)) {
-                        totalEmotions[emotion] += score || 0;
-                    }
-                });
-            }
-
-            if (analysis.confidence_score) {
-                totalConfidence += analysis.confidence_score;
-            }
-
-            if (analysis.dominant_emotion) {
-                dominantEmotions[analysis.dominant_emotion] =
-                    (dominantEmotions[analysis.dominant_emotion] || 0) + 1;
-            }
-        });
+        const emotions = ['joy', 'sadness', 'anger', 'fear', 'surprise'];
+        const dominantEmotions = summary.dominant_emotions;
 
         // Update emotion radar chart
         if (emotionChart) {
-            const avgEmotions = Object.values(totalEmotions).map(score =>
-                score / Math.max(1, data.length));
+            const avgEmotions = emotions.map(emotion => summary.emotion_averages[emotion] || 0);
             emotionChart.data.datasets[0].data = avgEmotions;
             emotionChart.update();
         }
 
         // Update confidence gauge
         if (confidenceChart) {
-            const avgConfidence = totalConfidence / Math.max(1, data.length);
+            const avgConfidence = summary.average_confidence || 0;
             confidenceChart.data.datasets[0].data = [
                 avgConfidence * 100,
                 100 - (avgConfidence * 100)
@@ -952,12 +870,9 @@ function updateEmotionAnalysis(data) {
 
         // Update tone analysis
         const toneDiv = document.getElementById('toneAnalysis');
-        if (toneDiv && data.length > 0) {
-            const lastAnalysis = data[data.length - 1];
-            if (lastAnalysis?.tone_analysis) {
-                const toneAnalysis = typeof lastAnalysis.tone_analysis === 'string'
-                    ? JSON.parse(lastAnalysis.tone_analysis)
-                    : lastAnalysis.tone_analysis;
+        if (toneDiv && summary.total > 0) {
+            if (summary.latest_tone_analysis) {
+                const toneAnalysis = summary.latest_tone_analysis;
 
                 toneDiv.innerHTML = Object.entries(toneAnalysis)
                     .map(([key, value]) =>
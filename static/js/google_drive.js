@@ -5,10 +5,14 @@ document.addEventListener('DOMContentLoaded', function() {
     const selectDriveFiles = document.getElementById('selectDriveFiles');
     
     let selectedDriveFiles = new Set();
+    // Files seen so far, kept up to date from the server's change feed
+    const driveFiles = new Map();
+    let syncToken = null;
     
     driveBtn.addEventListener('click', async function() {
         try {
-            const response = await fetch('/drive/files');
+            const url = syncToken ? `/drive/files?since=${encodeURIComponent(syncToken)}` : '/drive/files';
+            const response = await fetch(url);
             const data = await response.json();
             
             if (data.error) {
@@ -19,12 +23,19 @@ document.addEventListener('DOMContentLoaded', function() {
                 throw new Error(data.error);
             }
             
+            if (!data.incremental) {
+                driveFiles.clear();
+            }
+            data.files.forEach(file => driveFiles.set(file.id, file));
+            data.removed.forEach(fileId => driveFiles.delete(fileId));
+            syncToken = data.sync_token;
+            
             // Clear previous list and selection
             driveFileList.innerHTML = '';
             selectedDriveFiles.clear();
             
             // Populate file list
-            data.files.forEach(file => {
+            driveFiles.forEach(file => {
                 const item = document.createElement('div');
                 item.className = 'list-group-item list-group-item-action';
                 item.dataset.fileId = file.id;
@@ -70,52 +81,27 @@ document.addEventListener('DOMContentLoaded', function() {
         
         try {
             progressDiv.classList.remove('d-none');
-            const totalFiles = selectedDriveFiles.size;
-            let completedFiles = 0;
-            
-            batchStatus.innerHTML = `Processing 0/${totalFiles} files from Google Drive...`;
-            
-            for (const fileId of selectedDriveFiles) {
-                const response = await fetch(`/drive/download/${fileId}`);
-                const data = await response.json();
-                
-                if (data.error) {
-                    throw new Error(data.error);
-                }
-                
-                // Create a File object from the downloaded content
-                const blob = new Blob([data.content], { type: 'audio/mpeg' });
-                const file = new File([blob], data.filename, { type: 'audio/mpeg' });
-                
-                // Upload the file using the existing upload endpoint
-                const formData = new FormData();
-                formData.append('file', file);
-                
-                const uploadResponse = await fetch('/api/upload', {
-                    method: 'POST',
-                    body: formData
-                });
-                
-                if (!uploadResponse.ok) {
-                    const error = await uploadResponse.json();
-                    throw new Error(error.error || 'Upload failed');
-                }
-                
-                completedFiles++;
-                const progress = (completedFiles / totalFiles) * 100;
-                progressBar.style.width = `${progress}%`;
-                progressBar.setAttribute('aria-valuenow', progress);
-                batchStatus.innerHTML = `Processing ${completedFiles}/${totalFiles} files from Google Drive...`;
+            progressBar.style.width = '100%';
+            batchStatus.innerHTML = `Importing ${selectedDriveFiles.size} files from Google Drive...`;
+
+            // The server downloads the files itself and queues each one as it arrives
+            const response = await fetch('/drive/import', {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({ file_ids: Array.from(selectedDriveFiles) })
+            });
+            const result = await response.json();
+
+            if (!response.ok) {
+                const retryAfter = response.headers.get('Retry-After');
+                throw new Error((result.error || 'Import failed') +
+                    (retryAfter ? ` (try again in ${retryAfter}s)` : ''));
             }
-            
-            batchStatus.innerHTML += '<div class="alert alert-success">Google Drive files processing completed!</div>';
+
             driveModal.hide();
-            
-            // Reload the page after a short delay to show the new analyses
-            setTimeout(() => {
-                window.location.reload();
-            }, 2000);
-            
+            progressDiv.classList.add('d-none');
+            await window.pollBatchStatus(result.batch_id, result.status_url);
+
         } catch (error) {
             console.error('Error processing Google Drive files:', error);
             batchStatus.innerHTML = `<div class="alert alert-danger">Error processing Google Drive files: ${error.message}</div>`;
@@ -1,222 +1,141 @@
 document.addEventListener('DOMContentLoaded', function() {
-    const characterCheckboxes = document.getElementById('characterCheckboxes');
-    const environmentCheckboxes = document.getElementById('environmentCheckboxes');
-    const themesList = document.getElementById('themesList');
     const searchResults = document.getElementById('searchResults');
     const criteriaModeToggle = document.getElementById('criteriaMode');
 
-    let analyses = []; // Store all analyses data
-
-    async function loadFilterOptions() {
-        try {
-            const response = await fetch('/api/analyses');
-            analyses = await response.json();
-
-            // Extract unique values
-            const characters = new Set();
-            const environments = new Set();
-            const themes = new Set();
-
-            analyses.forEach(analysis => {
-                if (analysis.speaking_characters) {
-                    analysis.speaking_characters.forEach(char => characters.add(char));
-                }
-                if (analysis.environments) {
-                    analysis.environments.forEach(env => environments.add(env));
-                }
-                if (analysis.themes) {
-                    analysis.themes.forEach(theme => themes.add(theme));
-                }
-            });
-
-            // Populate checkboxes
-            characterCheckboxes.querySelector('.d-flex').innerHTML = Array.from(characters)
-                .sort()
-                .map(char => `
-                    <div class="form-check me-3">
-                        <input class="form-check-input" type="checkbox" value="${char}" id="char-${char}">
-                        <label class="form-check-label" for="char-${char}">${char}</label>
-                    </div>
-                `).join('');
-
-            environmentCheckboxes.querySelector('.d-flex').innerHTML = Array.from(environments)
-                .sort()
-                .map(env => `
-                    <div class="form-check me-3">
-                        <input class="form-check-input" type="checkbox" value="${env}" id="env-${env}">
-                        <label class="form-check-label" for="env-${env}">${env}</label>
-                    </div>
-                `).join('');
-
-            themesList.querySelector('.d-flex').innerHTML = Array.from(themes)
-                .sort()
-                .map(theme => `
-                    <div class="form-check me-3">
-                        <input class="form-check-input" type="checkbox" value="${theme}" id="theme-${theme}">
-                        <label class="form-check-label" for="theme-${theme}">${theme}</label>
-                    </div>
-                `).join('');
-
-            updateFilterCounts();
-
-            // Add change event listeners to all checkboxes
-            document.querySelectorAll('.form-check-input').forEach(checkbox => {
-                checkbox.addEventListener('change', () => {
-                    performSearch();
-                    updateFilterCounts();
-                });
-            });
-
-            // Add change event listener to criteria mode toggle
-            criteriaModeToggle.addEventListener('change', () => {
-                performSearch();
-                updateFilterCounts();
-            });
-
-        } catch (error) {
-            console.error('Error loading filter options:', error);
-        }
+    const SUGGESTION_LIMIT = 50; // Checkboxes shown per section until the user types
+    const TYPEAHEAD_DELAY = 150; // ms to wait after a keystroke before asking the server
+
+    // Each section lists the most used values of one field; typing narrows it by prefix
+    const sections = [
+        { container: document.getElementById('themesList'), field: 'themes', label: 'themes' },
+        { container: document.getElementById('characterCheckboxes'), field: 'speaking_characters', label: 'characters' },
+        { container: document.getElementById('environmentCheckboxes'), field: 'environments', label: 'environments' }
+    ].filter(section => section.container);
+
+    let facetCounts = null; // Counts among the current matches, from the last search
+
+    function escapeHtml(value) {
+        return String(value)
+            .replace(/&/g, '&amp;')
+            .replace(/</g, '&lt;')
+            .replace(/>/g, '&gt;')
+            .replace(/"/g, '&quot;')
+            .replace(/'/g, '&#39;');
     }
 
-    function updateFilterCounts() {
-        const selectedCharacters = [...document.querySelectorAll('#characterCheckboxes input:checked')]
-            .map(input => input.value);
-        const selectedEnvironments = [...document.querySelectorAll('#environmentCheckboxes input:checked')]
-            .map(input => input.value);
-        const selectedThemes = [...document.querySelectorAll('#themesList input:checked')]
-            .map(input => input.value);
-
-        const matchAll = criteriaModeToggle.checked;
-
-        // Update character counts
-        document.querySelectorAll('#characterCheckboxes input').forEach(input => {
-            const char = input.value;
-            const label = input.parentElement.querySelector('label');
-            const count = countMatchesForCriterion(char, 'speaking_characters', selectedCharacters, selectedEnvironments, selectedThemes, matchAll);
-            label.textContent = `${char} (${count})`;
-        });
+    function initSection(section) {
+        section.selected = new Set();
+        section.suggestions = [];
+        section.options = section.container.querySelector('.d-flex');
+        if (!section.options) {
+            section.options = document.createElement('div');
+            section.options.className = 'd-flex flex-wrap gap-2 mt-3';
+            section.container.appendChild(section.options);
+        }
 
-        // Update environment counts
-        document.querySelectorAll('#environmentCheckboxes input').forEach(input => {
-            const env = input.value;
-            const label = input.parentElement.querySelector('label');
-            const count = countMatchesForCriterion(env, 'environments', selectedCharacters, selectedEnvironments, selectedThemes, matchAll);
-            label.textContent = `${env} (${count})`;
+        const input = document.createElement('input');
+        input.type = 'search';
+        input.className = 'form-control form-control-sm mt-3';
+        input.placeholder = `Type to find ${section.label}...`;
+        input.setAttribute('aria-label', `Find ${section.label}`);
+        section.container.insertBefore(input, section.options);
+
+        let timer = null;
+        input.addEventListener('input', () => {
+            clearTimeout(timer);
+            timer = setTimeout(() => loadSuggestions(section, input.value), TYPEAHEAD_DELAY);
         });
 
-        // Update theme counts
-        document.querySelectorAll('#themesList input').forEach(input => {
-            const theme = input.value;
-            const label = input.parentElement.querySelector('label');
-            const count = countMatchesForCriterion(theme, 'themes', selectedCharacters, selectedEnvironments, selectedThemes, matchAll);
-            label.textContent = `${theme} (${count})`;
+        section.options.addEventListener('change', event => {
+            if (!event.target.matches('.form-check-input')) return;
+            if (event.target.checked) {
+                section.selected.add(event.target.value);
+            } else {
+                section.selected.delete(event.target.value);
+            }
+            performSearch();
         });
     }
 
-    function countMatchesForCriterion(value, type, selectedCharacters, selectedEnvironments, selectedThemes, matchAll) {
-        return analyses.filter(analysis => {
-            // Check if the item has the current criterion
-            const hasCurrentCriterion = analysis[type] && analysis[type].includes(value);
-            if (!hasCurrentCriterion) return false;
-
-            // If no other criteria are selected, just count items with this criterion
-            if (selectedCharacters.length === 0 && selectedEnvironments.length === 0 && selectedThemes.length === 0) {
-                return true;
-            }
-
-            // For other selected criteria, check if they match based on the mode
-            const matchesSelectedCharacters = type === 'speaking_characters' ? true :
-                selectedCharacters.length === 0 || 
-                selectedCharacters.some(char => analysis.speaking_characters && analysis.speaking_characters.includes(char));
-
-            const matchesSelectedEnvironments = type === 'environments' ? true :
-                selectedEnvironments.length === 0 || 
-                selectedEnvironments.some(env => analysis.environments && analysis.environments.includes(env));
-
-            const matchesSelectedThemes = type === 'themes' ? true :
-                selectedThemes.length === 0 || 
-                selectedThemes.some(theme => analysis.themes && analysis.themes.includes(theme));
+    async function loadSuggestions(section, prefix = '') {
+        try {
+            const params = new URLSearchParams({ field: section.field, prefix, limit: SUGGESTION_LIMIT });
+            const response = await fetch(`/api/autocomplete?${params}`);
+            if (!response.ok) throw new Error(`HTTP ${response.status}`);
+            const data = await response.json();
+            // Ignore answers to a prefix the user has already typed past
+            if (data.prefix !== prefix) return;
+            section.suggestions = data.suggestions;
+            renderSection(section);
+        } catch (error) {
+            console.error(`Error loading ${section.label} suggestions:`, error);
+        }
+    }
 
-            if (matchAll) {
-                return matchesSelectedCharacters && matchesSelectedEnvironments && matchesSelectedThemes;
-            } else {
-                return true; // In "Any" mode, we count all items that have this criterion
+    function renderSection(section) {
+        const counts = new Map(section.suggestions.map(s => [s.value, s.count]));
+        // Selected values stay visible whatever has been typed
+        const values = [...section.selected, ...section.suggestions.map(s => s.value)
+            .filter(value => !section.selected.has(value))];
+        const matchAll = criteriaModeToggle ? criteriaModeToggle.checked : true;
+
+        section.options.innerHTML = values.map((value, index) => {
+            const id = `${section.field}-${index}`;
+            let count = counts.get(value);
+            if (facetCounts && matchAll) {
+                count = (facetCounts[section.field] || {})[value] || 0;
             }
-        }).length;
+            return `
+                <div class="form-check me-3">
+                    <input class="form-check-input" type="checkbox" value="${escapeHtml(value)}" id="${id}"
+                           ${section.selected.has(value) ? 'checked' : ''}>
+                    <label class="form-check-label" for="${id}">
+                        ${escapeHtml(value)}${count !== undefined ? ` (${count})` : ''}
+                    </label>
+                </div>
+            `;
+        }).join('');
     }
 
     async function performSearch() {
         try {
-            const selectedCharacters = [...document.querySelectorAll('#characterCheckboxes input:checked')]
-                .map(input => input.value);
-            const selectedEnvironments = [...document.querySelectorAll('#environmentCheckboxes input:checked')]
-                .map(input => input.value);
-            const selectedThemes = [...document.querySelectorAll('#themesList input:checked')]
-                .map(input => input.value);
+            const hasSelections = sections.some(section => section.selected.size > 0);
 
             // If no criteria are selected, show the default message
-            if (selectedCharacters.length === 0 && selectedEnvironments.length === 0 && selectedThemes.length === 0) {
+            if (!hasSelections) {
+                facetCounts = null;
+                sections.forEach(renderSection);
                 searchResults.innerHTML = `
                     <div class="alert alert-info">
                         <i class="fas fa-info-circle me-2"></i>
                         Select criteria from the left panel to see matching content
                     </div>
                 `;
-                document.querySelector('#resultsCount').textContent = '0 items found';
+                const resultsCount = document.querySelector('#resultsCount');
+                if (resultsCount) resultsCount.textContent = '0 items found';
                 return;
             }
 
-            const matchAll = criteriaModeToggle.checked;
-
-            // Filter results locally based on selected criteria
-            const filteredResults = analyses.filter(analysis => {
-                // Check matches for each category
-                const matchesCharacters = selectedCharacters.length === 0 || 
-                    (analysis.speaking_characters && selectedCharacters.some(char => 
-                        analysis.speaking_characters.includes(char)));
-
-                const matchesEnvironments = selectedEnvironments.length === 0 || 
-                    (analysis.environments && selectedEnvironments.some(env => 
-                        analysis.environments.includes(env)));
-
-                const matchesThemes = selectedThemes.length === 0 || 
-                    (analysis.themes && selectedThemes.some(theme => 
-                        analysis.themes.includes(theme)));
-
-                if (matchAll) {
-                    // In "Match All" mode:
-                    // - If a category has selections, all of them must match
-                    // - Only consider categories that have selections
-                    const characterMatches = selectedCharacters.length === 0 || 
-                        selectedCharacters.every(char => 
-                            analysis.speaking_characters && analysis.speaking_characters.includes(char));
-
-                    const environmentMatches = selectedEnvironments.length === 0 || 
-                        selectedEnvironments.every(env => 
-                            analysis.environments && analysis.environments.includes(env));
-
-                    const themeMatches = selectedThemes.length === 0 || 
-                        selectedThemes.every(theme => 
-                            analysis.themes && analysis.themes.includes(theme));
-
-                    return characterMatches && environmentMatches && themeMatches;
-                } else {
-                    // In "Any" mode:
-                    // - If any selected criterion matches in any category, include the result
-                    // - Only consider categories that have selections
-                    const hasSelections = selectedCharacters.length > 0 || 
-                                        selectedEnvironments.length > 0 || 
-                                        selectedThemes.length > 0;
+            const criteria = {
+                match: criteriaModeToggle && !criteriaModeToggle.checked ? 'any' : 'all',
+                facets: sections.map(section => section.field)
+            };
+            sections.forEach(section => {
+                criteria[section.field] = [...section.selected];
+            });
 
-                    return hasSelections && (
-                        (selectedCharacters.length > 0 && matchesCharacters) ||
-                        (selectedEnvironments.length > 0 && matchesEnvironments) ||
-                        (selectedThemes.length > 0 && matchesThemes)
-                    );
-                }
+            // Matching and per-value counts both come from the server's facet index
+            const response = await fetch('/api/search', {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify(criteria)
             });
+            if (!response.ok) throw new Error(`HTTP ${response.status}`);
+            const data = await response.json();
 
-            displaySearchResults(filteredResults);
+            facetCounts = data.facets;
+            sections.forEach(renderSection);
+            displaySearchResults(data.results);
         } catch (error) {
             console.error('Error performing search:', error);
             searchResults.innerHTML = `
@@ -231,7 +150,7 @@ document.addEventListener('DOMContentLoaded', function() {
     function displaySearchResults(results) {
         // Update results count
         const resultsCount = document.querySelector('#resultsCount');
-        resultsCount.textContent = `${results.length} items found`;
+        if (resultsCount) resultsCount.textContent = `${results.length} items found`;
 
         if (!results.length) {
             searchResults.innerHTML = `
@@ -247,11 +166,11 @@ document.addEventListener('DOMContentLoaded', function() {
             <div class="list-group">
                 ${results.map(result => `
                     <div class="list-group-item">
-                        <h5 class="mb-1">${result.title || 'Untitled'}</h5>
-                        ${result.themes ? `<p class="mb-1"><strong>Themes:</strong> ${result.themes.join(', ')}</p>` : ''}
-                        ${result.speaking_characters ? `<p class="mb-1"><strong>Characters:</strong> ${result.speaking_characters.join(', ')}</p>` : ''}
-                        ${result.environments ? `<p class="mb-1"><strong>Environments:</strong> ${result.environments.join(', ')}</p>` : ''}
-                        ${result.dominant_emotion ? `<span class="badge bg-info">${result.dominant_emotion}</span>` : ''}
+                        <h5 class="mb-1">${escapeHtml(result.title || 'Untitled')}</h5>
+                        ${result.themes ? `<p class="mb-1"><strong>Themes:</strong> ${escapeHtml(result.themes.join(', '))}</p>` : ''}
+                        ${result.speaking_characters ? `<p class="mb-1"><strong>Characters:</strong> ${escapeHtml(result.speaking_characters.join(', '))}</p>` : ''}
+                        ${result.environments ? `<p class="mb-1"><strong>Environments:</strong> ${escapeHtml(result.environments.join(', '))}</p>` : ''}
+                        ${result.dominant_emotion ? `<span class="badge bg-info">${escapeHtml(result.dominant_emotion)}</span>` : ''}
                     </div>
                 `).join('')}
             </div>
@@ -272,6 +191,13 @@ document.addEventListener('DOMContentLoaded', function() {
         });
     });
 
+    if (criteriaModeToggle) {
+        criteriaModeToggle.addEventListener('change', performSearch);
+    }
+
     // Initialize
-    loadFilterOptions();
-});
\ No newline at end of file
+    sections.forEach(section => {
+        initSection(section);
+        loadSuggestions(section);
+    });
+});
@@ -0,0 +1,75 @@
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Optional
+
+from database import db
+from models import AudioAnalysis
+
+logger = logging.getLogger(__name__)
+
+
+class SummaryFiller:
+    """Generates missing summaries in the background, one model call per record.
+
+    Requests for a record that already has a fill in flight share that fill
+    instead of starting another model call.
+    """
+
+    def __init__(self, max_workers: int = 2):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='summary-fill')
+        self._in_flight: Dict[int, Future] = {}
+        self._failures: Dict[int, str] = {}
+        self._lock = threading.Lock()
+
+    def request(self, app, analysis_id: int) -> Future:
+        """Enqueue a fill for the record, or join the one already running."""
+        with self._lock:
+            future = self._in_flight.get(analysis_id)
+            if future is None:
+                self._failures.pop(analysis_id, None)
+                future = self._executor.submit(self._fill, app, analysis_id)
+                self._in_flight[analysis_id] = future
+                logger.info(f"Queued summary fill for analysis {analysis_id}")
+            return future
+
+    def is_pending(self, analysis_id: int) -> bool:
+        with self._lock:
+            return analysis_id in self._in_flight
+
+    def failure(self, analysis_id: int) -> Optional[str]:
+        """The error from the last fill of this record, if it failed."""
+        with self._lock:
+            return self._failures.get(analysis_id)
+
+    def _fill(self, app, analysis_id: int) -> str:
+        analyzer = None
+        try:
+            with app.app_context():
+                analysis = db.session.get(AudioAnalysis, analysis_id)
+                if analysis is None:
+                    raise ValueError(f"Analysis {analysis_id} not found")
+                if analysis.summary:
+                    return analysis.summary
+
+                from gemini_analyzer import GeminiAnalyzer
+                analyzer = GeminiAnalyzer()
+                analysis_result = analyzer.generate_summary(analysis.to_dict())
+                summary = (analysis_result.get('summary') or '').strip()
+                if not summary:
+                    # Stored empty, the record would look unfilled and be re-queued on every poll
+                    raise ValueError("The model returned an empty summary")
+                analysis.summary = summary
+                db.session.commit()
+                logger.info(f"Filled summary for analysis {analysis_id}")
+                return analysis.summary
+        except Exception as e:
+            logger.error(f"Error generating summary for analysis {analysis_id}: {str(e)}")
+            with self._lock:
+                self._failures[analysis_id] = str(e)
+            raise
+        finally:
+            if analyzer:
+                analyzer.cleanup()
+            with self._lock:
+                self._in_flight.pop(analysis_id, None)
@@ -0,0 +1,108 @@
+import copy
+import re
+from typing import Any, Dict, List, Optional
+
+PARENT_QUERY = re.compile(r"'((?:[^'\\]|\\.)*)' in parents")
+
+
+class _Request:
+    def __init__(self, response: Dict[str, Any]):
+        self.response = response
+
+    def execute(self) -> Dict[str, Any]:
+        return copy.deepcopy(self.response)
+
+
+class _Files:
+    def __init__(self, drive: 'FakeDrive'):
+        self.drive = drive
+
+    def list(self, q: str = '', pageSize: int = 100, pageToken: Optional[str] = None, **kwargs) -> _Request:
+        self.drive.calls.append(('files.list', dict(kwargs, q=q, pageSize=pageSize, pageToken=pageToken)))
+        parent = PARENT_QUERY.search(q)
+        parent = re.sub(r'\\(.)', r'\1', parent.group(1)) if parent else None
+        matches = [
+            file for file in self.drive.stored.values()
+            if ("mimeType contains 'audio/'" not in q or file['mimeType'].startswith('audio/'))
+            and ('trashed = false' not in q or not file.get('trashed'))
+            and (parent is None or parent in file['parents'])
+        ]
+        start = int(pageToken or 0)
+        end = start + min(pageSize, self.drive.page_size)
+        response: Dict[str, Any] = {'files': [self.drive.metadata(file) for file in matches[start:end]]}
+        if end < len(matches):
+            response['nextPageToken'] = str(end)
+        return _Request(response)
+
+
+class _Changes:
+    def __init__(self, drive: 'FakeDrive'):
+        self.drive = drive
+
+    def getStartPageToken(self, **kwargs) -> _Request:
+        self.drive.calls.append(('changes.getStartPageToken', kwargs))
+        return _Request({'startPageToken': str(len(self.drive.log))})
+
+    def list(self, pageToken: str, pageSize: int = 100, includeRemoved: bool = True, **kwargs) -> _Request:
+        self.drive.calls.append(('changes.list', dict(kwargs, pageToken=pageToken, pageSize=pageSize)))
+        start = int(pageToken)
+        end = start + min(pageSize, self.drive.page_size)
+        changes = []
+        for file_id in self.drive.log[start:end]:
+            file = self.drive.stored.get(file_id)
+            if file is None:
+                if includeRemoved:
+                    changes.append({'fileId': file_id, 'removed': True})
+            else:
+                # Like Drive, a change carries the file as it is now, not as it was then
+                changes.append({'fileId': file_id, 'removed': False, 'file': self.drive.metadata(file)})
+        response: Dict[str, Any] = {'changes': changes}
+        if end < len(self.drive.log):
+            response['nextPageToken'] = str(end)
+        else:
+            response['newStartPageToken'] = str(len(self.drive.log))
+        return _Request(response)
+
+
+class FakeDrive:
+    """In-memory stand-in for a Drive v3 client's files().list and changes().
+
+    Pages hold at most page_size items, whatever pageSize asks for, so a
+    handful of files exercises the paging. Every write appends to the
+    change log that changes().list pages through.
+    """
+
+    def __init__(self, page_size: int = 2):
+        self.page_size = page_size
+        self.stored: Dict[str, Dict[str, Any]] = {}
+        self.log: List[str] = []  # File ID per change, oldest first
+        self.calls: List[tuple] = []
+
+    def add(self, file_id: str, name: str, mime_type: str = 'audio/mpeg', parents=('root',), size: int = 100):
+        self.stored[file_id] = {
+            'id': file_id, 'name': name, 'mimeType': mime_type, 'size': str(size),
+            'md5Checksum': f'md5-{file_id}', 'modifiedTime': '2026-01-01T00:00:00.000Z',
+            'parents': list(parents), 'trashed': False
+        }
+        self.log.append(file_id)
+
+    def update(self, file_id: str, **fields):
+        self.stored[file_id].update(fields)
+        self.log.append(file_id)
+
+    def trash(self, file_id: str):
+        self.update(file_id, trashed=True)
+
+    def delete(self, file_id: str):
+        del self.stored[file_id]
+        self.log.append(file_id)
+
+    @staticmethod
+    def metadata(file: Dict[str, Any]) -> Dict[str, Any]:
+        return copy.deepcopy(file)
+
+    def files(self) -> _Files:
+        return _Files(self)
+
+    def changes(self) -> _Changes:
+        return _Changes(self)
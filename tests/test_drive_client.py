@@ -0,0 +1,163 @@
+import threading
+
+import pytest
+
+import drive_client
+from drive_client import DriveServiceCache, list_audio_files, list_changes, start_page_token
+from fake_drive import FakeDrive
+
+
+class FakeCredentials:
+    def __init__(self, refresh_token, client_id='client'):
+        self.client_id = client_id
+        self.refresh_token = refresh_token
+        self.token = 'access'
+
+
+@pytest.fixture
+def drive():
+    return FakeDrive(page_size=2)
+
+
+def names(files):
+    return sorted(file['name'] for file in files)
+
+
+def test_listing_follows_every_page(drive):
+    for i in range(5):
+        drive.add(f'f{i}', f'episode{i}.mp3')
+
+    files = list_audio_files(drive)
+
+    assert names(files) == [f'episode{i}.mp3' for i in range(5)]
+    page_tokens = [call['pageToken'] for name, call in drive.calls if name == 'files.list']
+    assert page_tokens == [None, '2', '4']
+
+
+def test_listing_leaves_out_other_folders_trashed_and_non_audio_files(drive):
+    drive.add('a', 'in-folder.mp3', parents=['folder'])
+    drive.add('b', 'elsewhere.mp3', parents=['other'])
+    drive.add('c', 'notes.txt', mime_type='text/plain', parents=['folder'])
+    drive.add('d', 'binned.mp3', parents=['folder'])
+    drive.trash('d')
+
+    assert names(list_audio_files(drive, 'folder')) == ['in-folder.mp3']
+    assert names(list_audio_files(drive)) == ['elsewhere.mp3', 'in-folder.mp3']
+
+
+def test_listing_quotes_the_folder_id(drive):
+    drive.add('a', 'quoted.mp3', parents=["it's"])
+
+    assert names(list_audio_files(drive, "it's")) == ['quoted.mp3']
+
+
+def test_listing_searches_shared_drives(drive):
+    list_audio_files(drive)
+
+    _, call = drive.calls[0]
+    assert call['supportsAllDrives'] and call['includeItemsFromAllDrives']
+
+
+def test_changes_report_additions_across_pages(drive):
+    token = start_page_token(drive)
+    for i in range(5):
+        drive.add(f'f{i}', f'episode{i}.mp3')
+
+    changed, removed, next_token = list_changes(drive, token)
+
+    assert names(changed) == [f'episode{i}.mp3' for i in range(5)]
+    assert removed == []
+    assert next_token == '5'
+    assert all('trashed' not in file for file in changed)
+    # Nothing new since
+    assert list_changes(drive, next_token) == ([], [], '5')
+
+
+def test_deleted_and_trashed_files_are_removed(drive):
+    drive.add('kept', 'kept.mp3')
+    drive.add('deleted', 'deleted.mp3')
+    drive.add('trashed', 'trashed.mp3')
+    token = start_page_token(drive)
+    drive.delete('deleted')
+    drive.trash('trashed')
+
+    changed, removed, _ = list_changes(drive, token)
+
+    assert changed == []
+    assert sorted(removed) == ['deleted', 'trashed']
+
+
+def test_files_leaving_the_folder_are_removed(drive):
+    drive.add('moved', 'moved.mp3', parents=['folder'])
+    drive.add('renamed', 'old.mp3', parents=['folder'])
+    drive.add('converted', 'converted.mp3', parents=['folder'])
+    token = start_page_token(drive)
+    drive.update('moved', parents=['other'])
+    drive.update('renamed', name='new.mp3')
+    drive.update('converted', mimeType='text/plain')
+
+    changed, removed, _ = list_changes(drive, token, 'folder')
+
+    assert names(changed) == ['new.mp3']
+    assert sorted(removed) == ['converted', 'moved']
+
+
+def test_later_changes_to_a_file_supersede_earlier_ones(drive):
+    token = start_page_token(drive)
+    drive.add('restored', 'restored.mp3')
+    drive.trash('restored')
+    drive.update('restored', trashed=False)
+    drive.add('gone', 'gone.mp3')
+    drive.delete('gone')
+
+    changed, removed, _ = list_changes(drive, token)
+
+    assert names(changed) == ['restored.mp3']
+    assert removed == ['gone']
+
+
+def test_service_cache_builds_one_client_per_authorization_and_thread():
+    built = []
+
+    def factory(credentials):
+        built.append(credentials.refresh_token)
+        return FakeDrive()
+
+    cache = DriveServiceCache(factory=factory)
+    alice, bob = FakeCredentials('alice'), FakeCredentials('bob')
+
+    assert cache.get(alice) is cache.get(FakeCredentials('alice'))
+    assert cache.get(bob) is not cache.get(alice)
+    assert built == ['alice', 'bob']
+
+    other = []
+    thread = threading.Thread(target=lambda: other.append(cache.get(alice)))
+    thread.start()
+    thread.join()
+    assert other[0] is not cache.get(alice)
+    assert cache.built == 3
+
+
+def test_service_cache_evicts_the_least_recently_used_client():
+    cache = DriveServiceCache(factory=lambda credentials: FakeDrive(), max_entries=2)
+    first = cache.get(FakeCredentials('a'))
+    cache.get(FakeCredentials('b'))
+    cache.get(FakeCredentials('a'))
+    cache.get(FakeCredentials('c'))
+
+    assert cache.get(FakeCredentials('a')) is first
+    assert cache.built == 3
+    cache.get(FakeCredentials('b'))
+    assert cache.built == 4
+
+
+def test_set_service_factory_replaces_built_clients(monkeypatch):
+    monkeypatch.setattr(drive_client, '_cache', DriveServiceCache(factory=lambda credentials: FakeDrive()))
+    credentials = FakeCredentials('alice')
+    before = drive_client.get_service(credentials)
+
+    fake = FakeDrive()
+    drive_client.set_service_factory(lambda credentials: fake)
+
+    assert drive_client.get_service(credentials) is fake
+    assert fake is not before
@@ -0,0 +1,224 @@
+import asyncio
+
+import pytest
+
+from provider_router import Provider, ProviderError, ProviderRouter, ProviderStats
+from retry_policy import PERMANENT, TRANSIENT, CircuitBreaker
+
+
+class FakeClock:
+    """Manually advanced stand-in for time.monotonic."""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float):
+        self.now += seconds
+
+
+class FakeProvider:
+    """Provider coroutine that replays scripted outcomes and records its calls.
+
+    Each outcome is a result dict, an exception to raise, or None to hang
+    until cancelled. The last outcome repeats once the script runs out.
+    """
+
+    def __init__(self, name, *outcomes, delay=0.0, clock=None, latency=0.0):
+        self.name = name
+        self.outcomes = list(outcomes) or [{'provider': name}]
+        self.delay = delay
+        self.clock = clock
+        self.latency = latency
+        self.calls = 0
+        self.cancelled = 0
+
+    async def analyze(self, file_path, mime_type):
+        outcome = self.outcomes[min(self.calls, len(self.outcomes) - 1)]
+        self.calls += 1
+        try:
+            if outcome is None:
+                await asyncio.Event().wait()
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        if self.clock is not None:
+            self.clock.advance(self.latency)
+        if isinstance(outcome, BaseException):
+            raise outcome
+        return outcome
+
+    def provider(self):
+        return Provider(self.name, self.analyze)
+
+
+def make_router(*fakes, clock=None, **kwargs):
+    kwargs.setdefault('default_hedge_delay', 0.05)
+    kwargs.setdefault('min_hedge_delay', 0.01)
+    return ProviderRouter([fake.provider() for fake in fakes], clock=clock or FakeClock(), **kwargs)
+
+
+def analyze(router, mime_type='audio/mpeg'):
+    return asyncio.run(router.analyze_async('episode.mp3', mime_type))
+
+
+def test_primary_answering_in_time_is_not_hedged():
+    primary, secondary = FakeProvider('primary'), FakeProvider('secondary')
+    router = make_router(primary, secondary)
+
+    assert analyze(router) == {'provider': 'primary'}
+    assert secondary.calls == 0
+    assert router.hedges_sent == 0
+
+
+def test_slow_primary_is_hedged_and_the_loser_cancelled():
+    primary, secondary = FakeProvider('primary', None), FakeProvider('secondary')
+    router = make_router(primary, secondary)
+
+    assert analyze(router) == {'provider': 'secondary'}
+    assert router.hedges_sent == 1
+    assert router.hedges_won == 1
+    assert primary.cancelled == 1
+    # The cancelled call is a latency lower bound, not a failure
+    assert list(router.stats['primary'].samples)[0][1] is None
+    assert router.stats['primary'].error_rate() == 0.0
+    assert router.breakers['primary'].consecutive_failures == 0
+
+
+def test_primary_winning_after_hedge_cancels_the_hedge():
+    primary = FakeProvider('primary', delay=0.1)
+    secondary = FakeProvider('secondary', None)
+    router = make_router(primary, secondary)
+
+    assert analyze(router) == {'provider': 'primary'}
+    assert router.hedges_sent == 1
+    assert router.hedges_won == 0
+    assert secondary.cancelled == 1
+
+
+def test_failed_provider_fails_over_to_the_next():
+    primary = FakeProvider('primary', ConnectionError('connection reset'))
+    secondary = FakeProvider('secondary')
+    router = make_router(primary, secondary)
+
+    assert analyze(router) == {'provider': 'secondary'}
+    assert router.hedges_sent == 0
+    assert router.breakers['primary'].consecutive_failures == 1
+
+
+def test_all_providers_failing_reports_whether_to_retry():
+    router = make_router(FakeProvider('primary', ValueError('bad file format')),
+                         FakeProvider('secondary', ConnectionError('connection reset')))
+    with pytest.raises(ProviderError) as excinfo:
+        analyze(router)
+    assert excinfo.value.error_class == TRANSIENT
+    assert 'primary: bad file format' in str(excinfo.value)
+
+    router = make_router(FakeProvider('primary', ValueError('bad file format')))
+    with pytest.raises(ProviderError) as excinfo:
+        analyze(router)
+    assert excinfo.value.error_class == PERMANENT
+
+
+def test_unsupported_providers_are_skipped():
+    primary, secondary = FakeProvider('primary'), FakeProvider('secondary')
+    router = ProviderRouter([Provider('primary', primary.analyze, lambda mime_type: mime_type == 'audio/mpeg'),
+                             secondary.provider()], clock=FakeClock())
+
+    assert analyze(router, 'image/png') == {'provider': 'secondary'}
+    assert primary.calls == 0
+
+
+def test_consecutive_failures_trip_the_breaker_until_the_reset_timeout():
+    clock = FakeClock()
+    primary = FakeProvider('primary', ConnectionError('connection reset'),
+                           ConnectionError('connection reset'), {'provider': 'primary'})
+    secondary = FakeProvider('secondary')
+    router = make_router(primary, secondary, clock=clock, failure_threshold=2, reset_timeout=30)
+
+    analyze(router)
+    analyze(router)
+    assert router.breakers['primary'].state == CircuitBreaker.OPEN
+
+    # While open, calls go straight to the next provider
+    assert analyze(router) == {'provider': 'secondary'}
+    assert primary.calls == 2
+
+    # After the cool-down one probe goes through and its success closes the circuit
+    clock.advance(30)
+    assert analyze(router) == {'provider': 'primary'}
+    assert primary.calls == 3
+    assert router.breakers['primary'].state == CircuitBreaker.CLOSED
+
+
+def test_failed_probe_reopens_the_breaker():
+    clock = FakeClock()
+    primary = FakeProvider('primary', ConnectionError('connection reset'))
+    router = make_router(primary, FakeProvider('secondary'), clock=clock, failure_threshold=1, reset_timeout=30)
+
+    analyze(router)
+    clock.advance(30)
+    analyze(router)
+    assert primary.calls == 2
+    assert router.breakers['primary'].state == CircuitBreaker.OPEN
+
+    analyze(router)
+    assert primary.calls == 2
+
+
+def test_high_error_rate_trips_the_breaker_without_consecutive_failures():
+    error = ConnectionError('connection reset')
+    primary = FakeProvider('primary', error, error, {'provider': 'primary'}, error, error)
+    router = make_router(primary, FakeProvider('secondary'), failure_threshold=10, min_samples=4,
+                         max_error_rate=0.5)
+
+    for _ in range(3):
+        analyze(router)
+    assert router.breakers['primary'].state == CircuitBreaker.CLOSED
+
+    analyze(router)
+    assert router.breakers['primary'].state == CircuitBreaker.OPEN
+
+
+def test_no_healthy_provider_is_transient():
+    primary = FakeProvider('primary', ConnectionError('connection reset'))
+    router = make_router(primary, failure_threshold=1)
+
+    with pytest.raises(ProviderError):
+        analyze(router)
+    with pytest.raises(ProviderError) as excinfo:
+        analyze(router)
+    assert excinfo.value.error_class == TRANSIENT
+    assert primary.calls == 1
+
+
+def test_hedge_delay_follows_the_latency_percentile():
+    clock = FakeClock()
+    primary = FakeProvider('primary', clock=clock, latency=8.0)
+    router = make_router(primary, clock=clock, hedge_percentile=95, min_hedge_delay=5.0, default_hedge_delay=120.0)
+
+    assert router.hedge_delay(primary.provider()) == 120.0
+    analyze(router)
+    assert router.hedge_delay(primary.provider()) == 8.0
+
+    primary.latency = 1.0
+    for _ in range(20):
+        analyze(router)
+    # Fast calls bring the delay down, but never below the floor
+    assert router.hedge_delay(primary.provider()) == 5.0
+
+
+def test_censored_latencies_hold_the_percentile_up():
+    stats = ProviderStats()
+    for _ in range(10):
+        stats.record(1.0, True)
+    for _ in range(10):
+        stats.record_censored(30.0)
+
+    assert stats.latency_percentile(95) == 30.0
+    assert stats.error_rate() == 0.0
+    stats.record(1.0, False)
+    assert stats.error_rate() == pytest.approx(1 / 11)
@@ -0,0 +1,227 @@
+import logging
+import os
+import shutil
+import threading
+import time
+from typing import Any, Dict, List, Optional, Set
+
+from blob_store import BlobStore
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_INTERVAL = 300  # Seconds between sweeps
+DEFAULT_RELEASE_GRACE = 1800  # Keep released files this long so failed batches can be retried
+DEFAULT_MAX_AGE = 24 * 3600  # Files nothing ever claimed (e.g. left by a crash) go after this long
+DEFAULT_MIN_AGE = 3600  # Quota pressure never evicts files younger than this
+
+
+class UploadJanitor:
+    """Scheduled cleanup of the upload folder, aware of which files are still needed.
+
+    Jobs acquire the files they use and release them when done. One
+    background thread sweeps the folder periodically, removing released
+    files after a grace period and unclaimed files past a maximum age, and
+    evicting the oldest unreferenced files when the folder exceeds its size
+    quota or the disk runs low on free space. When given a blob store, each
+    sweep also garbage-collects its unreferenced blobs with the same grace.
+    """
+
+    def __init__(self, folder: str, interval: float = DEFAULT_INTERVAL,
+                 release_grace: float = DEFAULT_RELEASE_GRACE, max_age: float = DEFAULT_MAX_AGE,
+                 min_age: float = DEFAULT_MIN_AGE, max_bytes: Optional[int] = None,
+                 min_free_bytes: Optional[int] = None, blob_store: Optional[BlobStore] = None):
+        self.folder = folder
+        self.blob_store = blob_store
+        self.interval = interval
+        self.release_grace = release_grace
+        self.max_age = max_age
+        self.min_age = min_age
+        self.max_bytes = max_bytes
+        self.min_free_bytes = min_free_bytes
+        self.removed_files = 0
+        self.freed_bytes = 0
+        self.last_sweep: Optional[float] = None
+        self._refs: Dict[str, Set[str]] = {}  # path -> owners holding it
+        self._released: Dict[str, float] = {}  # path -> when its last owner let go
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        """Start the sweeper thread once per process."""
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='upload-janitor', daemon=True)
+                self._thread.start()
+                logger.info(f"Started upload janitor for {self.folder} every {self.interval}s")
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.sweep()
+            except Exception as e:
+                logger.error(f"Upload janitor sweep failed: {str(e)}", exc_info=True)
+
+    def acquire(self, path: str, owner: str):
+        """Mark a file as needed by owner (a batch or request ID)."""
+        path = os.path.abspath(path)
+        with self._lock:
+            self._refs.setdefault(path, set()).add(owner)
+            self._released.pop(path, None)
+
+    def release(self, path: str, owner: str, remove: bool = False):
+        """Drop owner's claim on a file; with remove, delete it now if nobody else needs it."""
+        path = os.path.abspath(path)
+        with self._lock:
+            owners = self._refs.get(path)
+            if owners is not None:
+                owners.discard(owner)
+                if owners:
+                    return
+                del self._refs[path]
+            if not remove:
+                self._released[path] = time.time()
+                return
+            self._released.pop(path, None)
+        self._remove(path)
+
+    def release_owner(self, owner: str):
+        """Release every file held by owner, e.g. when a batch finishes."""
+        with self._lock:
+            paths = [path for path, owners in self._refs.items() if owner in owners]
+        for path in paths:
+            self.release(path, owner)
+
+    def is_referenced(self, path: str) -> bool:
+        with self._lock:
+            return os.path.abspath(path) in self._refs
+
+    def _remove(self, path: str) -> int:
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+        except FileNotFoundError:
+            return 0
+        except OSError as e:
+            logger.error(f"Error cleaning up file {path}: {str(e)}")
+            return 0
+        self.removed_files += 1
+        self.freed_bytes += size
+        logger.info(f"Cleaned up upload {path}")
+        return size
+
+    def _list_files(self) -> List[Dict[str, Any]]:
+        files = []
+        try:
+            for entry in os.scandir(self.folder):
+                if entry.is_file(follow_symlinks=False):
+                    stat = entry.stat(follow_symlinks=False)
+                    files.append({'path': os.path.abspath(entry.path), 'size': stat.st_size, 'mtime': stat.st_mtime})
+        except FileNotFoundError:
+            pass
+        return files
+
+    def sweep(self) -> Dict[str, Any]:
+        """Apply the retention rules once; returns what was removed."""
+        now = time.time()
+        removed, freed = 0, 0
+        with self._lock:
+            referenced = set(self._refs)
+            released = dict(self._released)
+
+        files = [f for f in self._list_files() if f['path'] not in referenced]
+
+        # Released files after their grace period; unclaimed files past the maximum age
+        survivors = []
+        for f in files:
+            released_at = released.get(f['path'])
+            expired = (now - released_at >= self.release_grace) if released_at is not None \
+                else (now - f['mtime'] >= self.max_age)
+            if expired:
+                freed += self._remove(f['path'])
+                removed += 1
+            else:
+                survivors.append(f)
+
+        # Quota pressure: evict released files first, then the oldest, never anything too young
+        total_bytes = sum(f['size'] for f in self._list_files())
+        candidates = sorted(
+            (f for f in survivors if now - f['mtime'] >= self.min_age or f['path'] in released),
+            key=lambda f: (f['path'] not in released, released.get(f['path'], f['mtime']))
+        )
+        for f in candidates:
+            over_quota = self.max_bytes is not None and total_bytes > self.max_bytes
+            low_disk = self.min_free_bytes is not None and self._free_bytes() < self.min_free_bytes
+            if not over_quota and not low_disk:
+                break
+            size = self._remove(f['path'])
+            total_bytes -= size
+            freed += size
+            removed += 1
+
+        with self._lock:
+            for path in list(self._released):
+                if not os.path.exists(path):
+                    del self._released[path]
+        self.last_sweep = now
+        if removed:
+            logger.info(f"Upload janitor removed {removed} files, freeing {freed} bytes")
+        result = {'removed_files': removed, 'freed_bytes': freed, 'folder_bytes': total_bytes}
+        if self.blob_store is not None:
+            result['blobs'] = self.blob_store.gc(self.release_grace)
+        return result
+
+    def _free_bytes(self) -> int:
+        return shutil.disk_usage(self.folder).free
+
+    def stats(self) -> Dict[str, Any]:
+        files = self._list_files()
+        with self._lock:
+            referenced = len(self._refs)
+            released = len(self._released)
+        return {
+            'folder': self.folder,
+            'files': len(files),
+            'folder_bytes': sum(f['size'] for f in files),
+            'referenced_files': referenced,
+            'released_files': released,
+            'max_bytes': self.max_bytes,
+            'min_free_bytes': self.min_free_bytes,
+            'free_bytes': self._free_bytes() if os.path.isdir(self.folder) else None,
+            'removed_files': self.removed_files,
+            'freed_bytes': self.freed_bytes,
+            'last_sweep': self.last_sweep,
+            'blob_store': self.blob_store.stats() if self.blob_store is not None else None
+        }
+
+
+_janitor: Optional[UploadJanitor] = None
+_janitor_lock = threading.Lock()
+
+
+def _optional_int(name: str) -> Optional[int]:
+    value = os.environ.get(name)
+    return int(value) if value else None
+
+
+def get_upload_janitor(folder: Optional[str] = None, blob_store: Optional[BlobStore] = None) -> UploadJanitor:
+    """Return the process-wide janitor, configured from UPLOAD_* environment variables."""
+    global _janitor
+    with _janitor_lock:
+        if _janitor is None:
+            if folder is None:
+                raise RuntimeError("The upload janitor has not been configured with a folder")
+            _janitor = UploadJanitor(
+                folder,
+                interval=float(os.environ.get('UPLOAD_JANITOR_INTERVAL', DEFAULT_INTERVAL)),
+                release_grace=float(os.environ.get('UPLOAD_RELEASE_GRACE', DEFAULT_RELEASE_GRACE)),
+                max_age=float(os.environ.get('UPLOAD_MAX_AGE', DEFAULT_MAX_AGE)),
+                min_age=float(os.environ.get('UPLOAD_MIN_AGE', DEFAULT_MIN_AGE)),
+                max_bytes=_optional_int('UPLOAD_MAX_BYTES'),
+                min_free_bytes=_optional_int('UPLOAD_MIN_FREE_BYTES'),
+                blob_store=blob_store
+            )
+        return _janitor